@@ -0,0 +1,66 @@
+"""Micro-benchmark of article HTML processing.
+
+Times lapresse.prepare_article (parse, single-walk rule application, text
+extraction and serialization) over the saved La Presse fixtures, plus a
+synthetic long-form article built by repeating the fixture's text, so
+regressions in parse time are visible run to run.
+
+Usage:
+    python benchmarks/bench_htmlrules.py [--repeat N] [--longform N]
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import lapresse as lp  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+
+def load_fixtures(longform: int) -> dict:
+    """Load article fixtures and build the synthetic long-form one."""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "lapresse_*.html"))):
+        with open(path, encoding="utf-8") as f:
+            fixtures[os.path.basename(path)] = f.read()
+    if fixtures and longform:
+        base = next(iter(fixtures.values()))
+        start = base.index('<section class="textModule">')
+        end = base.index("</section>", start) + len("</section>")
+        fixtures[f"longform_x{longform}"] = base[:start] + base[start:end] * longform + base[end:]
+    return fixtures
+
+
+def bench(content: str, repeat: int) -> list:
+    """Time prepare_article on content, in milliseconds per run."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lp.prepare_article(content)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50, help="runs per fixture")
+    parser.add_argument("--longform", type=int, default=100,
+                        help="times the article body is repeated in the synthetic fixture, 0 to skip")
+    args = parser.parse_args()
+
+    print(f"{'fixture':<32}{'KB':>8}{'mean ms':>10}{'min ms':>10}{'stdev':>10}")
+    for name, content in load_fixtures(args.longform).items():
+        timings = bench(content, args.repeat)
+        print(f"{name:<32}{len(content.encode()) / 1024:>8.1f}{statistics.mean(timings):>10.3f}"
+              f"{min(timings):>10.3f}{statistics.stdev(timings) if len(timings) > 1 else 0:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
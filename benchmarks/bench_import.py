@@ -0,0 +1,66 @@
+"""Import-time benchmark of the VOCNews modules.
+
+Imports each module in a fresh interpreter with -X importtime and reports the
+cumulative import time of the module itself, so heavy dependencies creeping
+back into module import (clients, SDKs) show up as a regression. With
+--max-ms the script exits with status 1 when any module exceeds the budget.
+
+Usage:
+    python benchmarks/bench_import.py [--repeat N] [--max-ms MS] [module ...]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+MODULES = ["utils", "mdb", "translate", "telegram_bot", "article", "sources", "feedrss"]
+
+# "import time:      self [us] |  cumulative | imported package"
+IMPORTTIME = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+
+def import_ms(module: str) -> float:
+    """Import module in a fresh interpreter and return its cumulative import time in ms."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        # The top-level module is the one printed without nesting indentation
+        if match and match.group(4) == module and len(match.group(3)) == 1:
+            return int(match.group(2)) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES, help="modules to import")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="fail when a module's median import time exceeds this budget")
+    args = parser.parse_args()
+
+    over = []
+    print(f"{'module':<16}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for module in args.modules:
+        timings = [import_ms(module) for _ in range(args.repeat)]
+        median = statistics.median(timings)
+        print(f"{module:<16}{median:>12.1f}{min(timings):>10.1f}{max(timings):>10.1f}")
+        if args.max_ms is not None and median > args.max_ms:
+            over.append(module)
+
+    if over:
+        print(f"Over the {args.max_ms:.0f} ms budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""End-to-end benchmark of the feed pipeline.
+
+Replays the recorded La Presse article through the whole pipeline (RSS fetch,
+article fetch, image cache, readability and Telegraph cleanup, translation,
+Telegraph publishing and Telegram sending) against local stub servers for the
+sites, OpenAI, Telegraph and the Telegram Bot API, with MongoDB replaced by an
+in-memory stand-in. Every stub has a configurable latency. Reports the time
+of each stage and service call recorded by the metrics module, articles per
+minute and peak Python memory, so optimizations can be compared run to run.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--articles N] [--repeat N] [--warmup N] [--ai-latency S] [--json FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), "src"))
+sys.path.insert(0, ROOT)
+
+from memorydb import MemoryDatabase  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(ROOT), "tests", "fixtures")
+TELEGRAPH_DOMAIN = "telegraph.bench"
+
+
+def make_png(width: int = 64, height: int = 48) -> bytes:
+    """Build a small valid PNG image without Pillow."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\x00" + b"\x80\x40\x20" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def make_feed(base_url: str, articles: int, run: int) -> bytes:
+    """Build an RSS feed of articles pointing at the stub server."""
+    now = datetime.now(timezone.utc)
+    items = "".join(f"""<item>
+<title>Article {run}-{i} : un incendie ravage un entrepôt à Montréal</title>
+<enclosure url="{base_url}/image/{run}-{i}.png" type="image/png" length="0"/>
+<link>{base_url}/article/{run}-{i}</link>
+<guid isPermaLink="true">{base_url}/article/{run}-{i}</guid>
+<description>Une centaine de pompiers ont été déployés dans la nuit de vendredi à samedi.</description>
+<pubDate>{format_datetime(now - timedelta(minutes=i))}</pubDate>
+</item>""" for i in range(articles))
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Bench</title><link>{base_url}</link>
+<description>Bench</description>{items}</channel></rss>""".encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves the feed, articles and images, and stubs OpenAI, Telegraph and Telegram."""
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reply_json(self, data) -> None:
+        self.reply(json.dumps(data).encode())
+
+    def do_GET(self) -> None:
+        latency = self.server.latency
+        if self.path == "/rss":
+            time.sleep(latency["fetch"])
+            return self.reply(self.server.feed, "application/rss+xml; charset=utf-8")
+        if self.path.startswith("/article/"):
+            time.sleep(latency["fetch"])
+            return self.reply(self.server.article, "text/html; charset=utf-8")
+        if self.path.startswith("/image/"):
+            time.sleep(latency["fetch"])
+            return self.reply(self.server.image, "image/png")
+        if self.path.endswith("/models"):
+            return self.reply_json({"object": "list", "data": []})
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        latency = self.server.latency
+        if self.path.endswith("/chat/completions"):
+            time.sleep(latency["ai"])
+            request = json.loads(body)
+            # Echoing the input keeps the segment markers of batched requests
+            content = request["messages"][-1]["content"]
+            if request.get("stream"):
+                event = {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": request["model"],
+                         "choices": [{"index": 0, "delta": {"content": content}}]}
+                return self.reply(f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n".encode(), "text/event-stream")
+            return self.reply_json({
+                "id": "1", "object": "chat.completion", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            })
+        if self.path.startswith("/telegraph/"):
+            time.sleep(latency["telegraph"])
+            with self.server.lock:
+                self.server.pages += 1
+                path = f"bench-{self.server.pages}"
+            return self.reply_json({"ok": True, "result": {"path": path, "url": f"https://telegra.ph/{path}"}})
+        if self.path.startswith("/telegram/"):
+            time.sleep(latency["telegram"])
+            message = {"message_id": 1, "date": 0, "chat": {"id": -1, "type": "channel"}}
+            if self.path.endswith("/sendPhoto"):
+                message["photo"] = [{"file_id": "bench", "file_unique_id": "bench", "width": 64, "height": 48}]
+            else:
+                message["text"] = "bench"
+            return self.reply_json({"ok": True, "result": message})
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_stub(args: argparse.Namespace) -> ThreadingHTTPServer:
+    """Start the stub server in a background thread."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.daemon_threads = True
+    httpd.latency = {"fetch": args.fetch_latency, "ai": args.ai_latency,
+                     "telegraph": args.telegraph_latency, "telegram": args.telegram_latency}
+    with open(os.path.join(FIXTURES, "lapresse_article.html"), "rb") as f:
+        httpd.article = f.read()
+    httpd.image = make_png()
+    httpd.feed = b""
+    httpd.pages = 0
+    httpd.lock = threading.Lock()
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    return httpd
+
+
+def configure(args: argparse.Namespace, base_url: str, workdir: str) -> None:
+    """Point the application at the stubs; must run before its modules are imported."""
+    os.environ.update({
+        "AI_URL": f"{base_url}/v1",
+        "AI_TOKEN": "bench",
+        "AI_MODEL": "bench",
+        "AI_BACKENDS": "",
+        "AI_MAX_CONCURRENCY": str(args.ai_concurrency),
+        "TELEGRAM_BOT_TOKEN": "1:bench",
+        "TELEGRAM_CHAT_ID": ",".join(f"-100{i}" for i in range(args.chats)),
+        "TELEGRAM_BASE_URL": f"{base_url}/telegram/bot",
+        "TELEGRAM_CHAT_INTERVAL": "0",
+        "TELEGRAM_GLOBAL_RATE": "0",
+        "TELEGRAPH_DOMAIN": TELEGRAPH_DOMAIN,
+        "TRANSLATE_CACHE": "none",
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "images"),
+        "PIPELINE_WORKERS": str(args.workers),
+        "CPU_WORKERS": str(args.cpu_workers),
+        "SEND_LAST": "false",
+    })
+
+
+def redirect_telegraph(base_url: str) -> None:
+    """Send the Telegraph client's https API calls to the stub server."""
+    import requests
+    import article
+
+    class StubAdapter(requests.adapters.HTTPAdapter):
+        def send(self, request, **kwargs):
+            request.url = f"{base_url}/telegraph/{request.url.split('/', 3)[3]}"
+            return super().send(request, **kwargs)
+
+    article.get_telegraph()._telegraph.session.mount(f"https://api.{TELEGRAPH_DOMAIN}/", StubAdapter())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--articles", type=int, default=20, help="articles in the replayed feed")
+    parser.add_argument("--repeat", type=int, default=3, help="runs, each with a fresh database")
+    parser.add_argument("--warmup", type=int, default=1, help="uncounted runs paying imports and connections")
+    parser.add_argument("--chats", type=int, default=3, help="Telegram chats to send to")
+    parser.add_argument("--workers", type=int, default=4, help="PIPELINE_WORKERS")
+    parser.add_argument("--cpu-workers", type=int, default=2, help="CPU_WORKERS, 0 to parse in threads")
+    parser.add_argument("--ai-concurrency", type=int, default=4, help="AI_MAX_CONCURRENCY")
+    parser.add_argument("--fetch-latency", type=float, default=0.05, help="seconds per feed, page or image")
+    parser.add_argument("--ai-latency", type=float, default=0.2, help="seconds per completion")
+    parser.add_argument("--telegraph-latency", type=float, default=0.1, help="seconds per Telegraph call")
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="seconds per Telegram call")
+    parser.add_argument("--log-level", default="WARNING", help="application log level")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    httpd = start_stub(args)
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    workdir = tempfile.mkdtemp(prefix="vocnews-bench-")
+    configure(args, base_url, workdir)
+
+    import cpupool
+    import feedrss
+    import httpclient
+    import metrics
+    from logging_conf import logger
+    import mdb
+    import sources
+
+    logger.setLevel(args.log_level)
+    redirect_telegraph(base_url)
+    source = sources.register(sources.Source(
+        name="bench", rss_url=f"{base_url}/rss", rules=sources.get_source("lapresse").rules, min_interval=0))
+
+    async def run_all():
+        # One event loop for every run, the HTTP, OpenAI and Telegram clients are bound to it
+        runs = []
+        for run in range(args.warmup + args.repeat):
+            database = MemoryDatabase()
+            mdb.get_collection = lambda name="rss": database[name]
+            httpd.feed = make_feed(base_url, args.articles, run)
+            metrics.REGISTRY.reset()
+            tracemalloc.start()
+            start = time.perf_counter()
+            found = await feedrss.poll_source(source)
+            wall = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if run < args.warmup:
+                continue
+            sent = sum(1 for doc in database["entries"].docs if doc.get("state") == "sent")
+            runs.append({
+                "articles": found,
+                "sent": sent,
+                "wall_s": wall,
+                "articles_per_min": sent / wall * 60 if wall else 0.0,
+                "peak_mb": peak / 1024 / 1024,
+                "metrics": metrics.REGISTRY.snapshot(),
+            })
+        await httpclient.aclose()
+        cpupool.shutdown()
+        return runs
+
+    runs = asyncio.run(run_all())
+
+    print(f"{'timing (last run)':<52}{'calls':>7}{'total s':>10}{'mean ms':>10}")
+    for name, metric in runs[-1]["metrics"].items():
+        if metric["type"] != "histogram":
+            continue
+        for sample in metric["samples"]:
+            labels = ",".join(f"{key}={value}" for key, value in sample["labels"].items())
+            print(f"{name.removeprefix('vocnews_') + ' ' + labels:<52}{sample['count']:>7}{sample['sum']:>10.2f}"
+                  f"{sample['mean'] * 1000:>10.1f}")
+    print(f"\n{'run':<6}{'sent':>6}{'wall s':>10}{'art/min':>10}{'peak MB':>10}")
+    for i, result in enumerate(runs):
+        print(f"{i:<6}{result['sent']:>6}{result['wall_s']:>10.2f}{result['articles_per_min']:>10.1f}"
+              f"{result['peak_mb']:>10.1f}")
+    print(f"median articles/min: {statistics.median(result['articles_per_min'] for result in runs):.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "runs": runs}, f, indent=2)
+    httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
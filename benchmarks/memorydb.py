@@ -0,0 +1,192 @@
+"""In-memory stand-in for the pymongo collections used by VOCNews.
+
+Implements the subset of the Collection API that mdb and cache call, with
+equality, $or, $in, $lt, $gte, $ne and $exists filters and $set, $unset, $inc,
+$addToSet and $setOnInsert updates, so the pipeline can run without MongoDB.
+Updates are atomic, so find_one_and_update can arbitrate concurrent claims.
+"""
+
+import copy
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+def get_path(doc: Dict, path: str) -> Any:
+    """Get a dotted field of a document, None if missing."""
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def has_path(doc: Dict, path: str) -> bool:
+    """Check whether a dotted field exists in a document."""
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return False
+        doc = doc[part]
+    return True
+
+
+def set_path(doc: Dict, path: str, value: Any) -> None:
+    """Set a dotted field of a document, creating intermediate documents."""
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def unset_path(doc: Dict, path: str) -> None:
+    """Remove a dotted field of a document if present."""
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part, {})
+    doc.pop(last, None)
+
+
+def matches(doc: Dict, query: Dict) -> bool:
+    """Check whether a document matches a filter."""
+    for path, condition in query.items():
+        if path == "$or":
+            if not any(matches(doc, alternative) for alternative in condition):
+                return False
+            continue
+        value = get_path(doc, path)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            for op, operand in condition.items():
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$lt" and not (value is not None and value < operand):
+                    return False
+                if op == "$gte" and not (value is not None and value >= operand):
+                    return False
+                if op == "$exists" and has_path(doc, path) != bool(operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def apply_update(doc: Dict, update: Dict, inserted: bool) -> None:
+    """Apply update operators to a document."""
+    for path, value in update.get("$set", {}).items():
+        set_path(doc, path, copy.deepcopy(value))
+    if inserted:
+        for path, value in update.get("$setOnInsert", {}).items():
+            set_path(doc, path, copy.deepcopy(value))
+    for path in update.get("$unset", {}):
+        unset_path(doc, path)
+    for path, value in update.get("$inc", {}).items():
+        set_path(doc, path, (get_path(doc, path) or 0) + value)
+    for path, value in update.get("$addToSet", {}).items():
+        values = get_path(doc, path) or []
+        if value not in values:
+            set_path(doc, path, values + [value])
+
+
+class Cursor(list):
+    """Query result supporting the sort and limit calls used by the app."""
+
+    def sort(self, key: Any, direction: int = 1) -> "Cursor":
+        if isinstance(key, list):
+            key, direction = key[0]
+        return Cursor(sorted(self, key=lambda doc: get_path(doc, key) or "", reverse=direction < 0))
+
+    def limit(self, count: int) -> "Cursor":
+        return Cursor(self[:count])
+
+
+class MemoryCollection:
+    """Thread-safe in-memory collection."""
+
+    def __init__(self) -> None:
+        self.docs: List[Dict] = []
+        self._lock = threading.RLock()
+        self._next_id = 0
+
+    def create_index(self, *args: Any, **kwargs: Any) -> str:
+        return "index"
+
+    def _project(self, doc: Dict, projection: Optional[Dict]) -> Dict:
+        doc = copy.deepcopy(doc)
+        if projection and projection.get("_id") == 0:
+            doc.pop("_id", None)
+        return doc
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> Cursor:
+        with self._lock:
+            return Cursor(self._project(doc, projection) for doc in self.docs if matches(doc, query or {}))
+
+    def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> Optional[Dict]:
+        found = self.find(query, projection)
+        return found[0] if found else None
+
+    def _update(self, query: Dict, update: Dict, upsert: bool, many: bool) -> SimpleNamespace:
+        with self._lock:
+            targets = [doc for doc in self.docs if matches(doc, query)]
+            if not many:
+                targets = targets[:1]
+            for doc in targets:
+                apply_update(doc, update, inserted=False)
+            upserted_id = None
+            if not targets and upsert:
+                self._next_id += 1
+                doc = {"_id": self._next_id, **{k: v for k, v in query.items() if not isinstance(v, dict)}}
+                apply_update(doc, update, inserted=True)
+                self.docs.append(doc)
+                upserted_id = doc["_id"]
+            return SimpleNamespace(matched_count=len(targets), modified_count=len(targets), upserted_id=upserted_id)
+
+    def update_one(self, query: Dict, update: Dict, upsert: bool = False) -> SimpleNamespace:
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query: Dict, update: Dict, upsert: bool = False) -> SimpleNamespace:
+        return self._update(query, update, upsert, many=True)
+
+    def replace_one(self, query: Dict, replacement: Dict, upsert: bool = False) -> SimpleNamespace:
+        with self._lock:
+            self.docs = [doc for doc in self.docs if not matches(doc, query)]
+            self._next_id += 1
+            self.docs.append({"_id": self._next_id, **copy.deepcopy(replacement)})
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+
+    def bulk_write(self, operations: List[Any], ordered: bool = True) -> SimpleNamespace:
+        for operation in operations:
+            self._update(operation._filter, operation._doc, operation._upsert, many=False)
+        return SimpleNamespace(acknowledged=True)
+
+    def find_one_and_update(self, query: Dict, update: Dict, projection: Optional[Dict] = None,
+                            sort: Optional[List] = None, upsert: bool = False,
+                            return_document: bool = False) -> Optional[Dict]:
+        with self._lock:
+            found = Cursor(doc for doc in self.docs if matches(doc, query))
+            if sort:
+                found = found.sort(sort)
+            if not found:
+                self._update(query, update, upsert, many=False)
+                return None
+            before = self._project(found[0], projection)
+            apply_update(found[0], update, inserted=False)
+            # ReturnDocument.AFTER is True
+            return self._project(found[0], projection) if return_document else before
+
+    def estimated_document_count(self) -> int:
+        return len(self.docs)
+
+    def delete_many(self, query: Dict) -> SimpleNamespace:
+        with self._lock:
+            kept = [doc for doc in self.docs if not matches(doc, query)]
+            deleted, self.docs = len(self.docs) - len(kept), kept
+            return SimpleNamespace(deleted_count=deleted)
+
+
+class MemoryDatabase(dict):
+    """Collections by name, created on first access."""
+
+    def __missing__(self, name: str) -> MemoryCollection:
+        self[name] = MemoryCollection()
+        return self[name]
@@ -0,0 +1,596 @@
+"""Article processing module for VOCNews.
+
+Source independent part of the article pipeline: parses a page into one lxml
+tree, applies the compiled cleanup rules of its source together with the
+Telegraph whitelist, turns it once into a template with the translatable texts
+cut out, translates the texts and publishes the result to Telegraph.
+
+Templates are either HTML parts or Telegraph node JSON built directly from the
+tree, so publishing needs no HTML parsing. Content over Telegraph's size limit
+is split into continuation pages, and pages are remembered by content hash so
+publishing identical content again reuses the existing page.
+"""
+
+import hashlib
+import json
+import re
+import time
+from html import escape
+from typing import Any, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+import utils as ut
+import mdb as db
+import metrics
+from logging_conf import logger
+from htmlrules import CompiledRules, Rules
+from lxml import etree, html
+from translate import translate_batch, atranslate_batch
+
+if TYPE_CHECKING:
+    from telegraph import Telegraph
+
+log = logger.getChild(__name__)
+
+TELEGRAPH_TOKEN = ut.ENV.get("TELEGRAPH_TOKEN", "")
+# Telegraph domain, the API is served from api.<domain> (e.g. the graph.org mirror)
+TELEGRAPH_DOMAIN = ut.ENV.get("TELEGRAPH_DOMAIN", "telegra.ph")
+TARGET_LANG = "Simple Chinese"
+
+parse_seconds = metrics.histogram("vocnews_parse_seconds", "Duration of article preparation steps")
+telegraph_seconds = metrics.histogram("vocnews_telegraph_seconds", "Duration of Telegraph API calls")
+update_paragraphs = metrics.counter(
+    "vocnews_update_paragraphs_total", "Paragraphs of updated articles, reused or translated again")
+
+# Define Telegraph allowed tags
+TELEGRAPH_TAGS = frozenset({'a', 'aside', 'b', 'blockquote', 'br', 'code', 'em',
+                            'figcaption', 'figure', 'h3', 'h4', 'hr', 'i', 'iframe',
+                            'img', 'li', 'ol', 'p', 'pre', 's', 'strong', 'u', 'ul', 'video', 'body'})
+
+# Reduces any cleaned page to what Telegraph accepts. Other tags, h1, h2 and span
+# included, are unwrapped into their text as they always were, not renamed.
+TELEGRAPH_RULES = Rules(
+    allowed_tags=TELEGRAPH_TAGS,
+)
+
+# Shown on a page published before its body is translated
+PLACEHOLDER_NOTICE = "全文翻译中，请稍后刷新。"
+
+# Stands in for a translatable text inside the serialized template
+TEXT_SLOT = "\ue000"
+
+# Telegraph node: a text, or a {"tag", "attrs", "children"} element
+Node = Union[str, Dict[str, Any]]
+# Elements starting a new line, after which Telegraph drops leading whitespace
+BLOCK_TAGS = frozenset({'aside', 'blockquote', 'figcaption', 'figure', 'h3', 'h4', 'hr', 'li', 'ol',
+                        'p', 'pre', 'ul', 'video'})
+VOID_TAGS = frozenset({'br', 'hr', 'img'})
+whitespace_re = re.compile(r"\s+")
+
+# Telegraph rejects page content over 64 KB of JSON
+CONTENT_LIMIT = 64 * 1024
+# Room kept on each page for the link to its continuation
+LINK_RESERVE = 512
+# Text of the link to the continuation page
+CONTINUED_LABEL = "下一页 →"
+
+_telegraph: Optional["Telegraph"] = None
+
+
+def get_telegraph() -> "Telegraph":
+    """
+    Gets the shared Telegraph client, creating it on first use.
+    Returns:
+        Telegraph: Shared client
+    """
+    global _telegraph
+    if _telegraph is None:
+        from telegraph import Telegraph
+        _telegraph = Telegraph(access_token=TELEGRAPH_TOKEN, domain=TELEGRAPH_DOMAIN)
+    return _telegraph
+
+
+def parse_html(content: str) -> html.HtmlElement:
+    """
+    Parses HTML into a document tree, wrapping fragments into html/body.
+    Args:
+        content: HTML document or fragment
+    Returns:
+        html.HtmlElement: Root <html> element
+    """
+    return html.document_fromstring(content)
+
+
+def telegraph_tree(doc: html.HtmlElement, rules: CompiledRules) -> html.HtmlElement:
+    """
+    Applies rules to the body of a document in place, for Telegraph output.
+    Args:
+        doc: Root <html> element
+        rules: Compiled rules ending with TELEGRAPH_RULES
+    Returns:
+        html.HtmlElement: The <body> element, containing Telegraph content only
+    """
+    body = rules.apply(doc.body)
+    body.attrib.clear()
+    return body
+
+
+def inner_html(element: html.HtmlElement) -> str:
+    """
+    Serializes the content of an element without the element's own tag.
+    Args:
+        element: Element to serialize, without attributes
+    Returns:
+        str: Inner HTML
+    """
+    markup = html.tostring(element, encoding='unicode', with_tail=False)
+    return markup[markup.index('>') + 1:markup.rindex('<')]
+
+
+def slot_texts(element: html.HtmlElement) -> List[str]:
+    """
+    Cuts out the non-blank text nodes of an element for translation.
+    The element is modified: every text node is replaced by a TEXT_SLOT marker.
+    Args:
+        element: Element whose content is extracted, usually <body>
+    Returns:
+        List[str]: Stripped texts in document order
+    """
+    texts = []
+
+    def slot(text: Optional[str]) -> Optional[str]:
+        if not text or not (stripped := text.strip()):
+            return text
+        texts.append(stripped.replace(TEXT_SLOT, ""))
+        start = text.index(stripped[0])
+        return text[:start] + TEXT_SLOT + text[start + len(stripped):]
+
+    # A tail follows the element's descendants, so it is cut out when the element ends
+    for event, node in etree.iterwalk(element, events=("start", "end")):
+        if event == "start":
+            node.text = slot(node.text)
+        elif node is not element:
+            node.tail = slot(node.tail)
+    return texts
+
+
+def extract_texts(element: html.HtmlElement) -> Tuple[List[str], List[str]]:
+    """
+    Serializes an element once, cutting out its non-blank text nodes for translation.
+    The element is modified: every text node is replaced by a TEXT_SLOT marker.
+    Args:
+        element: Element whose content is extracted, usually <body>
+    Returns:
+        Tuple[List[str], List[str]]: Template parts surrounding the texts, and the
+            stripped texts; render_texts joins them back into HTML
+    """
+    texts = slot_texts(element)
+    parts = inner_html(element).split(TEXT_SLOT)
+    if len(parts) != len(texts) + 1:
+        raise ValueError(f"Template has {len(parts) - 1} slots for {len(texts)} texts")
+    return parts, texts
+
+
+def render_texts(parts: List[str], texts: List[str]) -> str:
+    """
+    Joins template parts from extract_texts with (translated) texts.
+    Args:
+        parts: Template parts
+        texts: Texts for the slots between the parts, not HTML-escaped
+    Returns:
+        str: HTML content
+    """
+    chunks = [parts[0]]
+    for text, part in zip(texts, parts[1:]):
+        chunks.append(escape(text, quote=False))
+        chunks.append(part)
+    return "".join(chunks)
+
+
+def tree_to_nodes(element: html.HtmlElement) -> List[Node]:
+    """
+    Converts the content of a Telegraph tree into Telegraph node JSON, collapsing
+    whitespace the way Telegraph does when it parses the equivalent HTML.
+    Args:
+        element: Element whose content is converted, usually <body> after TELEGRAPH_RULES
+    Returns:
+        List[Node]: Telegraph nodes
+    """
+    last_text: List[Optional[str]] = [None]
+
+    def add_text(target: List[Node], text: Optional[str], pre: bool) -> None:
+        if not text:
+            return
+        if not pre:
+            text = whitespace_re.sub(" ", text)
+            if last_text[0] is None or last_text[0].endswith(" "):
+                text = text.lstrip(" ")
+            if not text:
+                last_text[0] = None
+                return
+            last_text[0] = text
+        if target and isinstance(target[-1], str):
+            target[-1] += text
+        else:
+            target.append(text)
+
+    def walk(parent: html.HtmlElement, target: List[Node], pre: bool) -> None:
+        add_text(target, parent.text, pre)
+        for child in parent:
+            # Comments and processing instructions have no string tag
+            if isinstance(child.tag, str):
+                if child.tag in BLOCK_TAGS:
+                    last_text[0] = None
+                node: Dict[str, Any] = {"tag": child.tag}
+                if child.attrib:
+                    node["attrs"] = dict(child.attrib)
+                target.append(node)
+                if child.tag not in VOID_TAGS:
+                    children: List[Node] = []
+                    walk(child, children, pre or child.tag == "pre")
+                    if children:
+                        node["children"] = children
+            add_text(target, child.tail, pre)
+
+    nodes: List[Node] = []
+    walk(element, nodes, False)
+    return nodes
+
+
+def extract_nodes(element: html.HtmlElement) -> Tuple[List[Node], List[str]]:
+    """
+    Converts an element into a Telegraph node template, cutting out its non-blank
+    text nodes for translation. The element is modified like by extract_texts.
+    Args:
+        element: Element whose content is extracted, usually <body>
+    Returns:
+        Tuple[List[Node], List[str]]: Node template whose strings hold TEXT_SLOT
+            markers, and the stripped texts; render_nodes fills them back in
+    """
+    texts = slot_texts(element)
+    return tree_to_nodes(element), texts
+
+
+def render_nodes(template: List[Node], texts: List[str]) -> List[Node]:
+    """
+    Fills a node template from extract_nodes with (translated) texts.
+    Args:
+        template: Node template
+        texts: Texts for the slots of the template, in order
+    Returns:
+        List[Node]: Telegraph nodes
+    Raises:
+        ValueError: If the template does not have one slot per text
+    """
+    remaining = iter(texts)
+    used = 0
+
+    def fill(nodes: List[Node], pre: bool) -> List[Node]:
+        nonlocal used
+        filled: List[Node] = []
+        for node in nodes:
+            if isinstance(node, str):
+                pieces = node.split(TEXT_SLOT)
+                chunks = [pieces[0]]
+                for piece in pieces[1:]:
+                    text = next(remaining, "")
+                    used += 1
+                    chunks.append(text if pre else whitespace_re.sub(" ", text))
+                    chunks.append(piece)
+                filled.append("".join(chunks))
+            elif "children" in node:
+                filled.append({**node, "children": fill(node["children"], pre or node["tag"] == "pre")})
+            else:
+                filled.append(node)
+        return filled
+
+    nodes = fill(template, False)
+    if used != len(texts):
+        raise ValueError(f"Template has {used} slots for {len(texts)} texts")
+    return nodes
+
+
+def html_nodes(html_content: str) -> List[Node]:
+    """
+    Parses Telegraph ready HTML into Telegraph nodes, for content only available as HTML.
+    Args:
+        html_content: Telegraph ready HTML content
+    Returns:
+        List[Node]: Telegraph nodes
+    """
+    from telegraph.utils import html_to_nodes
+    return html_to_nodes(html_content)
+
+
+def prepare_article(content: str, rules: CompiledRules) -> Tuple[List[str], List[str]]:
+    """
+    Turns a raw article page into Telegraph content ready for translation,
+    parsing and serializing it only once.
+    Args:
+        content: Raw HTML content
+        rules: Compiled cleanup rules of the article's source
+    Returns:
+        Tuple[List[str], List[str]]: Template parts and texts, see extract_texts
+    """
+    start = time.perf_counter()
+    body = telegraph_tree(parse_html(content), rules)
+    readable = time.perf_counter()
+    parse_seconds.observe(readable - start, step="readability")
+    result = extract_texts(body)
+    parse_seconds.observe(time.perf_counter() - readable, step="telegraph")
+    return result
+
+
+def prepare_nodes(content: str, rules: CompiledRules) -> Tuple[List[Node], List[str]]:
+    """
+    Turns a raw article page into a Telegraph node template ready for translation,
+    parsing it only once.
+    Args:
+        content: Raw HTML content
+        rules: Compiled cleanup rules of the article's source
+    Returns:
+        Tuple[List[Node], List[str]]: Node template and texts, see extract_nodes
+    """
+    start = time.perf_counter()
+    body = telegraph_tree(parse_html(content), rules)
+    readable = time.perf_counter()
+    parse_seconds.observe(readable - start, step="readability")
+    result = extract_nodes(body)
+    parse_seconds.observe(time.perf_counter() - readable, step="telegraph")
+    return result
+
+
+def translate_texts(texts: List[str], source_lang: str = "French") -> List[str]:
+    """
+    Translates extracted texts to Simple Chinese.
+    Args:
+        texts: Texts to translate
+        source_lang: Language of the texts
+    Returns:
+        List[str]: Translated texts
+    """
+    return translate_batch(texts, source_lang=source_lang, target_lang=TARGET_LANG)
+
+
+async def atranslate_texts(texts: List[str], source_lang: str = "French") -> List[str]:
+    """
+    Translates extracted texts to Simple Chinese without blocking the event loop.
+    Args:
+        texts: Texts to translate
+        source_lang: Language of the texts
+    Returns:
+        List[str]: Translated texts
+    """
+    return await atranslate_batch(texts, source_lang=source_lang, target_lang=TARGET_LANG)
+
+
+def reuse_translations(texts: List[str], previous_texts: List[str],
+                       previous_translations: List[str]) -> List[Optional[str]]:
+    """
+    Finds the paragraphs of an updated article that are unchanged since its previous version.
+    Args:
+        texts: Texts of the updated article
+        previous_texts: Texts of the previous version
+        previous_translations: Translations of previous_texts
+    Returns:
+        List[Optional[str]]: Previous translation of each text, None for the changed and new ones
+    """
+    known = dict(zip(previous_texts, previous_translations))
+    return [known.get(text) for text in texts]
+
+
+async def aupdate_texts(texts: List[str], previous_texts: List[str], previous_translations: List[str],
+                        source_lang: str = "French") -> List[str]:
+    """
+    Translates the texts of an updated article, reusing the translation of the
+    paragraphs unchanged since its previous version.
+    Args:
+        texts: Texts of the updated article
+        previous_texts: Texts of the previous version
+        previous_translations: Translations of previous_texts
+        source_lang: Language of the texts
+    Returns:
+        List[str]: Translated texts
+    """
+    results = reuse_translations(texts, previous_texts, previous_translations)
+    changed = [i for i, result in enumerate(results) if result is None]
+    if changed:
+        for i, translated in zip(changed, await atranslate_texts([texts[i] for i in changed], source_lang)):
+            results[i] = translated
+    update_paragraphs.inc(len(texts) - len(changed), result="reused")
+    update_paragraphs.inc(len(changed), result="translated")
+    log.info(f"Translated {len(changed)} of {len(texts)} paragraphs of an updated article")
+    return results
+
+
+def create_page(title: str, content: List[Node]) -> Dict[str, str]:
+    """
+    Creates a Telegraph page with the given title and content.
+    Args:
+        title: Page title
+        content: Telegraph nodes
+    Returns:
+        Dict[str, str]: url and path of the created Telegraph page
+    """
+    with telegraph_seconds.time(method="createPage"):
+        response = get_telegraph().create_page(
+            title=title,
+            content=content
+        )
+    log.debug(f"telegraph.create_page {response['url']}")
+    return {"url": response["url"], "path": response["path"]}
+
+
+def create_telegraph_page(title: str, html_content: str) -> str:
+    """
+    Creates a Telegraph page with the given title and content.
+    Args:
+        title: Page title
+        html_content: Telegraph ready HTML content
+    Returns:
+        str: URL of the created Telegraph page
+    """
+    return create_page(title, html_nodes(html_content))["url"]
+
+
+def edit_page(path: str, title: str, content: List[Node]) -> Dict[str, str]:
+    """
+    Replaces the title and content of an existing Telegraph page.
+    Args:
+        path: Path of the page, as returned by create_page
+        title: Page title
+        content: Telegraph nodes
+    Returns:
+        Dict[str, str]: url and path of the edited Telegraph page
+    """
+    with telegraph_seconds.time(method="editPage"):
+        response = get_telegraph().edit_page(
+            path=path,
+            title=title,
+            content=content
+        )
+    log.debug(f"telegraph.edit_page {response['url']}")
+    return {"url": response["url"], "path": response["path"]}
+
+
+def content_size(content: Union[Node, List[Node]]) -> int:
+    """
+    Measures nodes the way Telegraph counts its content limit.
+    Args:
+        content: Node or list of nodes
+    Returns:
+        int: Size in bytes of the compact JSON
+    """
+    return len(json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def split_node(node: Node, limit: int) -> List[Node]:
+    """
+    Splits a node too large for one page into consecutive nodes, cutting
+    elements between their children and texts between characters.
+    Args:
+        node: Telegraph node
+        limit: Maximum size of each resulting node
+    Returns:
+        List[Node]: Nodes no larger than limit, except void elements that cannot be split
+    """
+    if content_size(node) <= limit:
+        return [node]
+    if isinstance(node, str):
+        # A character takes at most 6 bytes of JSON, for \uXXXX escapes
+        step = max(1, (limit - 2) // 6)
+        return [node[i:i + step] for i in range(0, len(node), step)]
+    if not node.get("children"):
+        return [node]
+    shell = {**node, "children": []}
+    return [{**shell, "children": group}
+            for group in split_nodes(node["children"], limit - content_size(shell))]
+
+
+def split_nodes(nodes: List[Node], limit: Optional[int] = None) -> List[List[Node]]:
+    """
+    Splits content into pages that each fit Telegraph's content limit.
+    Args:
+        nodes: Telegraph nodes
+        limit: Maximum size of each page's content, defaults to CONTENT_LIMIT
+            minus the LINK_RESERVE kept for the continuation link
+    Returns:
+        List[List[Node]]: Content of each page, at least one
+    """
+    limit = limit or CONTENT_LIMIT - LINK_RESERVE
+    pages: List[List[Node]] = []
+    page: List[Node] = []
+    size = 2  # []
+    for node in nodes:
+        for piece in split_node(node, limit - 2):
+            piece_size = content_size(piece) + 1  # separating comma
+            if page and size + piece_size > limit:
+                pages.append(page)
+                page, size = [], 2
+            page.append(piece)
+            size += piece_size
+    pages.append(page)
+    return pages
+
+
+def content_hash(title: str, content: List[Node]) -> str:
+    """
+    Gets the key identifying a page by its title and content.
+    Args:
+        title: Page title
+        content: Telegraph nodes
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    data = json.dumps({"title": title, "content": content}, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def publish_once(title: str, content: List[Node], path: Optional[str] = None) -> Dict[str, str]:
+    """
+    Creates a page, or edits the one at path, unless the same title and content
+    were already published there.
+    Args:
+        title: Page title
+        content: Telegraph nodes, within the content limit
+        path: Path of the page to edit, None to create one
+    Returns:
+        Dict[str, str]: url and path of the page
+    """
+    key = content_hash(title, content)
+    known = db.get_page(key)
+    if known and (path is None or known["path"] == path):
+        log.debug(f"Reusing Telegraph page {known['url']}")
+        return {"url": known["url"], "path": known["path"]}
+    page = edit_page(path, title, content) if path else create_page(title, content)
+    db.save_page(key, page)
+    return page
+
+
+def publish_page(title: str, content: List[Node], path: Optional[str] = None) -> Dict[str, str]:
+    """
+    Publishes content to Telegraph, split into continuation pages linked from
+    one to the next when it exceeds the content limit.
+    Args:
+        title: Page title
+        content: Telegraph nodes
+        path: Path of an existing first page to edit, None to create it
+    Returns:
+        Dict[str, str]: url and path of the first page
+    """
+    pages = split_nodes(content)
+    page: Optional[Dict[str, str]] = None
+    # Last page first, so each page can link to the next one
+    for index in reversed(range(len(pages))):
+        nodes = pages[index]
+        if page:
+            nodes = nodes + [continuation_node(page["url"])]
+        page = publish_once(title if index == 0 else f"{title} ({index + 1})", nodes, path if index == 0 else None)
+    if len(pages) > 1:
+        log.info(f"Published {title} as {len(pages)} pages")
+    return page
+
+
+def continuation_node(url: str) -> Node:
+    """
+    Builds the link from a page to its continuation.
+    Args:
+        url: URL of the next page
+    Returns:
+        Node: Paragraph with the link
+    """
+    return {"tag": "p", "children": [{"tag": "a", "attrs": {"href": url}, "children": [CONTINUED_LABEL]}]}
+
+
+def placeholder_nodes(summary: str, link: str) -> List[Node]:
+    """
+    Builds the temporary content of a page published before its body is translated.
+    Args:
+        summary: Translated summary
+        link: Original article URL
+    Returns:
+        List[Node]: Telegraph nodes
+    """
+    return [
+        {"tag": "p", "children": [summary]},
+        {"tag": "p", "children": [{"tag": "i", "children": [PLACEHOLDER_NOTICE]}]},
+        {"tag": "p", "children": [{"tag": "a", "attrs": {"href": link}, "children": ["原文"]}]},
+    ]
@@ -0,0 +1,370 @@
+"""Translation backend pool module for VOCNews.
+
+Chat completions are spread over a pool of OpenAI-compatible backends, such as
+several Ollama hosts plus a hosted fallback. Each request goes to the available
+primary backend with the fewest requests in flight, fallback backends are only
+used when every primary is down, and a failed request is retried on the next
+backend. A backend failing repeatedly is taken out of rotation for a cooldown,
+and periodic health checks bring it back as soon as it answers again.
+
+AI_BACKENDS holds a JSON list of backends, for example:
+    [{"name": "gpu1", "url": "http://gpu1:11434/v1", "model": "qwen2:7b"},
+     {"name": "openai", "url": "https://api.openai.com/v1", "token": "...",
+      "model": "gpt-4o-mini", "fallback": true, "timeout": 30}]
+Without it the pool has the single backend configured by AI_URL, AI_TOKEN and AI_MODEL.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional
+import utils as ut
+import metrics
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+backends_config = ut.ENV.get("AI_BACKENDS", "")
+# Seconds a request may take on a backend before failing over
+default_timeout = float(ut.ENV.get("AI_TIMEOUT", "120"))
+# Consecutive failures taking a backend out of rotation, and for how many seconds
+max_failures = int(ut.ENV.get("AI_BACKEND_FAILURES", "2"))
+cooldown = float(ut.ENV.get("AI_BACKEND_COOLDOWN", "30"))
+# Seconds between two health checks of the backends in daemon mode
+health_interval = float(ut.ENV.get("AI_HEALTH_INTERVAL", "60"))
+
+_pool: Optional["Pool"] = None
+
+request_seconds = metrics.histogram("vocnews_llm_seconds", "Duration of chat completions per backend attempt")
+request_failures = metrics.counter("vocnews_llm_failures_total", "Failed chat completion attempts")
+tokens = metrics.counter("vocnews_llm_tokens_total", "Tokens reported by the backends")
+
+
+def is_backend_error(error: Exception) -> bool:
+    """Check whether an error means the backend is unhealthy rather than the request invalid.
+
+    Args:
+        error (Exception): Error raised by a request
+
+    Returns:
+        bool: True for connection errors, timeouts, rate limits and server errors
+    """
+    import openai
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code >= 500 or error.status_code == 429)
+
+
+@dataclass(eq=False)
+class Backend:
+    """An OpenAI-compatible chat completion server.
+
+    Attributes:
+        name: Name used in logs
+        base_url: API base URL, ending with /v1 for Ollama
+        api_key: API key, servers without authentication accept any
+        model: Model requested from this backend
+        timeout: Seconds a request may take before failing over
+        fallback: Only used when every primary backend is down
+    """
+    name: str
+    base_url: str
+    api_key: str = ""
+    model: str = ""
+    timeout: float = 120.0
+    fallback: bool = False
+    outstanding: int = 0
+    failures: int = 0
+    down_until: float = 0.0
+    _client: Any = field(default=None, repr=False)
+    _async_client: Any = field(default=None, repr=False)
+
+    @property
+    def available(self) -> bool:
+        """Whether the backend is in rotation."""
+        return time.monotonic() >= self.down_until
+
+    def get_client(self) -> Any:
+        """Get the sync OpenAI client of the backend, creating it on first use.
+
+        Returns:
+            OpenAI: Client without retries, failover replaces them
+        """
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(base_url=self.base_url, api_key=self.api_key or "none",
+                                  timeout=self.timeout, max_retries=0)
+        return self._client
+
+    def get_async_client(self) -> Any:
+        """Get the async OpenAI client of the backend, creating it on first use.
+
+        Returns:
+            AsyncOpenAI: Client without retries, failover replaces them
+        """
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key or "none",
+                                             timeout=self.timeout, max_retries=0)
+        return self._async_client
+
+
+class Completion(NamedTuple):
+    """Content of a chat completion, or a delta of a streamed one, with the backend that produced it."""
+    content: str
+    backend: Backend
+
+
+class Pool:
+    """Routes chat completions over backends with least-outstanding-requests and failover."""
+
+    def __init__(self, backends: List[Backend]) -> None:
+        if not backends:
+            raise ValueError("The backend pool needs at least one backend")
+        self.backends = backends
+        self._lock = threading.Lock()
+
+    def candidates(self) -> List[Backend]:
+        """Get the backends in the order a request should try them.
+
+        Available primaries come first, least busy first, then available fallbacks,
+        then the backends out of rotation, soonest back first, as a last resort.
+
+        Returns:
+            List[Backend]: Every backend of the pool
+        """
+        with self._lock:
+            up = [backend for backend in self.backends if backend.available]
+            down = sorted((backend for backend in self.backends if not backend.available),
+                          key=lambda backend: backend.down_until)
+            return sorted(up, key=lambda backend: (backend.fallback, backend.outstanding)) + down
+
+    def primary_models(self) -> List[str]:
+        """Get the models of the primary backends, or of every backend if all are fallbacks.
+
+        Returns:
+            List[str]: Distinct model names, in backend order
+        """
+        backends = [backend for backend in self.backends if not backend.fallback] or self.backends
+        return list(dict.fromkeys(backend.model for backend in backends))
+
+    @contextmanager
+    def lease(self, backend: Backend) -> Iterator[Backend]:
+        """Count a request in flight on a backend for the duration of the block."""
+        with self._lock:
+            backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+
+    def succeeded(self, backend: Backend) -> None:
+        """Put a backend back in rotation after a successful request."""
+        with self._lock:
+            if backend.failures or backend.down_until:
+                log.info(f"Backend {backend.name} is back")
+            backend.failures = 0
+            backend.down_until = 0.0
+
+    def failed(self, backend: Backend, error: Exception) -> None:
+        """Count a failed request, taking the backend out of rotation after max_failures."""
+        log.warning(f"Backend {backend.name} failed: {error}")
+        request_failures.inc(backend=backend.name, error=type(error).__name__)
+        if not is_backend_error(error):
+            return
+        with self._lock:
+            backend.failures += 1
+            if backend.failures >= max_failures:
+                backend.down_until = time.monotonic() + cooldown
+                log.warning(f"Backend {backend.name} out of rotation for {cooldown:.0f}s")
+
+    def request(self, backend: Backend, messages: List[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+        """Build the keyword arguments of a chat completion on a backend."""
+        return {"model": backend.model, "temperature": 0, "messages": messages, **kwargs}
+
+    def count_tokens(self, backend: Backend, usage: Any) -> None:
+        """Count the tokens of a completion, when the backend reports its usage."""
+        if usage is not None:
+            tokens.inc(usage.prompt_tokens or 0, backend=backend.name, kind="prompt")
+            tokens.inc(usage.completion_tokens or 0, backend=backend.name, kind="completion")
+
+    def complete(self, messages: List[Dict[str, str]]) -> Completion:
+        """Run a chat completion, failing over from backend to backend.
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+
+        Returns:
+            Completion: Content of the first completion choice and the backend that answered
+
+        Raises:
+            Exception: The last error when every backend failed
+        """
+        error: Optional[Exception] = None
+        for backend in self.candidates():
+            with self.lease(backend), request_seconds.time(backend=backend.name, mode="complete"):
+                try:
+                    completion = backend.get_client().chat.completions.create(**self.request(backend, messages))
+                except Exception as e:
+                    self.failed(backend, e)
+                    error = e
+                    continue
+            self.succeeded(backend)
+            self.count_tokens(backend, getattr(completion, "usage", None))
+            return Completion(completion.choices[0].message.content, backend)
+        raise error
+
+    async def acomplete(self, messages: List[Dict[str, str]]) -> Completion:
+        """Async version of complete, each attempt bounded by its backend's timeout.
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+
+        Returns:
+            Completion: Content of the first completion choice and the backend that answered
+
+        Raises:
+            Exception: The last error when every backend failed
+        """
+        error: Optional[Exception] = None
+        for backend in self.candidates():
+            with self.lease(backend), request_seconds.time(backend=backend.name, mode="complete"):
+                try:
+                    completion = await asyncio.wait_for(
+                        backend.get_async_client().chat.completions.create(**self.request(backend, messages)),
+                        timeout=backend.timeout)
+                except Exception as e:
+                    self.failed(backend, e)
+                    error = e
+                    continue
+            self.succeeded(backend)
+            self.count_tokens(backend, getattr(completion, "usage", None))
+            return Completion(completion.choices[0].message.content, backend)
+        raise error
+
+    async def astream(self, messages: List[Dict[str, str]]) -> AsyncIterator[Completion]:
+        """Run a streamed chat completion, failing over until the first content arrives.
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+
+        Yields:
+            Completion: Content deltas of the first completion choice, with the backend streaming them
+
+        Raises:
+            Exception: The last error when every backend failed, or an error after
+                content was already yielded
+        """
+        error: Optional[Exception] = None
+        for backend in self.candidates():
+            started = False
+            with self.lease(backend), request_seconds.time(backend=backend.name, mode="stream"):
+                try:
+                    stream = await asyncio.wait_for(
+                        backend.get_async_client().chat.completions.create(
+                            **self.request(backend, messages, stream=True)),
+                        timeout=backend.timeout)
+                    async for chunk in stream:
+                        self.count_tokens(backend, getattr(chunk, "usage", None))
+                        if chunk.choices and (delta := chunk.choices[0].delta.content):
+                            started = True
+                            yield Completion(delta, backend)
+                except Exception as e:
+                    self.failed(backend, e)
+                    if started:
+                        raise
+                    error = e
+                    continue
+            self.succeeded(backend)
+            return
+        raise error
+
+    async def acheck(self, backend: Backend) -> bool:
+        """Check that a backend answers by listing its models.
+
+        Args:
+            backend (Backend): Backend to check
+
+        Returns:
+            bool: True if the backend is healthy
+        """
+        try:
+            await asyncio.wait_for(backend.get_async_client().models.list(), timeout=backend.timeout)
+        except Exception as e:
+            self.failed(backend, e)
+            return False
+        self.succeeded(backend)
+        return True
+
+    async def acheck_all(self) -> Dict[str, bool]:
+        """Check every backend concurrently.
+
+        Returns:
+            Dict[str, bool]: Health by backend name
+        """
+        results = await asyncio.gather(*(self.acheck(backend) for backend in self.backends))
+        return {backend.name: healthy for backend, healthy in zip(self.backends, results)}
+
+    async def run_health_checks(self, stop: asyncio.Event, interval: float) -> None:
+        """Check every backend each interval seconds until stop is set.
+
+        Args:
+            stop (asyncio.Event): Set to stop checking
+            interval (float): Seconds between two checks
+        """
+        while not stop.is_set():
+            log.debug(f"Backend health: {await self.acheck_all()}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def parse_backends(config: str) -> List[Backend]:
+    """Parse the AI_BACKENDS JSON list.
+
+    Args:
+        config (str): JSON list of objects with url and optional name, token, model,
+            timeout and fallback keys
+
+    Returns:
+        List[Backend]: Configured backends
+    """
+    return [
+        Backend(
+            name=item.get("name", item["url"]),
+            base_url=item["url"],
+            api_key=item.get("token", ""),
+            model=item.get("model", ut.ENV.get("AI_MODEL", "")),
+            timeout=float(item.get("timeout", default_timeout)),
+            fallback=bool(item.get("fallback", False)),
+        )
+        for item in json.loads(config)
+    ]
+
+
+def get_pool() -> Pool:
+    """Get the shared backend pool configured by AI_BACKENDS, or by AI_URL/AI_TOKEN/AI_MODEL.
+
+    Returns:
+        Pool: Shared pool
+    """
+    global _pool
+    if _pool is None:
+        if backends_config:
+            backends = parse_backends(backends_config)
+        else:
+            backends = [Backend(
+                name="default",
+                base_url=ut.ENV.get("AI_URL", "") or None,
+                api_key=ut.ENV.get("AI_TOKEN", ""),
+                model=ut.ENV.get("AI_MODEL", ""),
+                timeout=default_timeout,
+            )]
+        _pool = Pool(backends)
+        log.debug(f"Translation backends: {[backend.name for backend in backends]}")
+    return _pool
@@ -0,0 +1,224 @@
+"""Translation cache module for VOCNews.
+
+Translations are content-addressed: the key is a hash of the source text, the
+language pair, the model and the resolved system prompt, so changing any of them
+never returns a stale translation. Two size-bounded LRU backends are provided,
+a local SQLite file and a MongoDB collection reusing the mdb client.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import utils as ut
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+# Backend selection: "sqlite", "mongo" or "none"
+backend = ut.ENV.get("TRANSLATE_CACHE", "sqlite").lower()
+path = ut.ENV.get("TRANSLATE_CACHE_PATH", "translate_cache.sqlite3")
+max_entries = int(ut.ENV.get("TRANSLATE_CACHE_SIZE", "100000"))
+
+# Fraction of max_entries removed at once when the cache overflows
+EVICT_RATIO = 0.1
+# Keys per SQLite query, below its bound on host parameters
+SQLITE_BATCH = 500
+
+_cache = None
+
+
+def make_key(text: str, source_lang: Optional[str], target_lang: str, model: str, system_prompt: str) -> str:
+    """Build the cache key of a translation.
+
+    Args:
+        text (str): Source text
+        source_lang (Optional[str]): Source language
+        target_lang (str): Target language
+        model (str): Model name
+        system_prompt (str): Resolved system prompt
+
+    Returns:
+        str: Hex SHA-256 digest identifying the translation
+    """
+    parts = [text, source_lang or "", target_lang, model, system_prompt]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class NullCache:
+    """Cache that never stores anything, used when caching is disabled."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a translation.
+
+        Args:
+            key (str): Cache key from make_key
+
+        Returns:
+            Optional[str]: Cached translation or None
+        """
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Look up translations with one query, marking the hits as used once.
+
+        Args:
+            keys (List[str]): Cache keys from make_key
+
+        Returns:
+            List[Optional[str]]: Cached translations in key order, None for misses
+        """
+        self.misses += len(keys)
+        return [None] * len(keys)
+
+    def set(self, key: str, value: str) -> None:
+        """Store a translation.
+
+        Args:
+            key (str): Cache key from make_key
+            value (str): Translated text
+        """
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters.
+
+        Returns:
+            Dict[str, Any]: Hits, misses and hit ratio
+        """
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class SQLiteCache(NullCache):
+    """Size-bounded LRU translation cache stored in a local SQLite file."""
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS translations_used ON translations (used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        found: Dict[str, str] = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(unique), SQLITE_BATCH):
+                chunk = unique[start:start + SQLITE_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM translations WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE translations SET used = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [now, *(key for key, _ in rows)])
+                    found.update(rows)
+            if found:
+                self._conn.commit()
+            results = [found.get(key) for key in keys]
+            self.hits += sum(1 for result in results if result is not None)
+            self.misses += sum(1 for result in results if result is None)
+            return results
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE translations SET value = ?, used = ? WHERE key = ?", (value, time.time(), key))
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    "INSERT INTO translations (key, value, used) VALUES (?, ?, ?)", (key, value, time.time()))
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until the cache is back under its bound."""
+        count = self._size - self.max_entries + int(self.max_entries * EVICT_RATIO)
+        self._conn.execute(
+            "DELETE FROM translations WHERE key IN "
+            "(SELECT key FROM translations ORDER BY used LIMIT ?)", (count,))
+        self._size = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        log.debug(f"Evicted {count} translations, {self._size} left")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "size": self._size}
+
+
+class MongoCache(NullCache):
+    """Size-bounded LRU translation cache stored in a MongoDB collection."""
+
+    def __init__(self, collection, max_entries: int) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self.collection = collection
+        self.collection.create_index("used")
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        unique = list(dict.fromkeys(keys))
+        found = {doc["_id"]: doc["value"] for doc in self.collection.find({"_id": {"$in": unique}})} if unique else {}
+        if found:
+            self.collection.update_many({"_id": {"$in": list(found)}}, {"$set": {"used": datetime.now(timezone.utc)}})
+        results = [found.get(key) for key in keys]
+        self.hits += sum(1 for result in results if result is not None)
+        self.misses += sum(1 for result in results if result is None)
+        return results
+
+    def set(self, key: str, value: str) -> None:
+        result = self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "used": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            size = self.collection.estimated_document_count()
+            if size > self.max_entries:
+                self._evict(size)
+
+    def _evict(self, size: int) -> None:
+        """Remove the least recently used entries until the cache is back under its bound."""
+        count = size - self.max_entries + int(self.max_entries * EVICT_RATIO)
+        keys = [doc["_id"] for doc in self.collection.find({}, {"_id": 1}).sort("used", 1).limit(count)]
+        self.collection.delete_many({"_id": {"$in": keys}})
+        log.debug(f"Evicted {len(keys)} translations")
+
+
+def get_cache() -> NullCache:
+    """Get the translation cache configured by TRANSLATE_CACHE.
+
+    Returns:
+        NullCache: The shared cache instance, a NullCache when caching is disabled
+    """
+    global _cache
+    if _cache is None:
+        try:
+            if backend == "sqlite":
+                _cache = SQLiteCache(path, max_entries)
+            elif backend == "mongo":
+                import mdb
+                _cache = MongoCache(mdb.get_collection("translations"), max_entries)
+            else:
+                _cache = NullCache()
+        except Exception as e:
+            log.error(f"Failed to open {backend} translation cache, caching disabled: {e}")
+            _cache = NullCache()
+        log.debug(f"Translation cache: {type(_cache).__name__}")
+    return _cache
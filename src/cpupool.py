@@ -0,0 +1,96 @@
+"""CPU worker pool module for VOCNews.
+
+Parsing and cleaning an article page is pure Python and lxml work holding the
+GIL: run in a thread it no longer blocks the event loop, but every article and
+every source still share one core. run_cpu sends such work to a pool of worker
+processes instead, so pages are cleaned in parallel while the event loop keeps
+driving the network I/O. Workers are started with the spawn method and warmed
+up by importing lxml and the article modules, so the first article does not pay
+for it. Functions must be module level and their arguments and results
+picklable; the metrics a worker records are merged back into the parent's.
+
+CPU_WORKERS sets the number of processes, 0 runs the work in a thread instead.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+import metrics
+import utils as ut
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+# Worker processes for CPU-bound work, 0 to use a thread of the event loop's default executor
+cpu_workers = int(ut.ENV.get("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def warm_up() -> None:
+    """Import the parsing modules in a new worker process."""
+    import lxml.html  # noqa: F401
+    import htmlrules  # noqa: F401
+    import article  # noqa: F401
+    log.debug(f"CPU worker {os.getpid()} ready")
+
+
+def call(func: Callable[..., Any], *args: Any) -> Tuple[Any, dict]:
+    """Run a function in a worker process, returning its result and the metrics it recorded.
+
+    Args:
+        func (Callable): Module level function
+        *args: Picklable arguments
+
+    Returns:
+        Tuple[Any, dict]: Result and state of the worker's metrics registry
+    """
+    metrics.REGISTRY.reset()
+    result = func(*args)
+    return result, metrics.REGISTRY.state()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Get the shared process pool, starting it on first use.
+
+    Returns:
+        ProcessPoolExecutor: Pool of cpu_workers warmed up processes
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=cpu_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_up,
+        )
+        log.debug(f"Started {cpu_workers} CPU workers")
+    return _executor
+
+
+async def run_cpu(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a CPU-bound function without blocking the event loop.
+
+    Args:
+        func (Callable): Module level function
+        *args: Picklable arguments
+
+    Returns:
+        Any: Return value of func
+    """
+    if cpu_workers <= 0:
+        return await asyncio.to_thread(func, *args)
+    loop = asyncio.get_running_loop()
+    result, state = await loop.run_in_executor(get_executor(), functools.partial(call, func, *args))
+    metrics.REGISTRY.merge(state)
+    return result
+
+
+def shutdown() -> None:
+    """Stop the worker processes, if they were started."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -8,65 +8,538 @@ for fetching and storing RSS feed data.
 import utils as ut
 from logging_conf import logger
 import asyncio
-from telegram_bot import send_new
+import functools
+import os
+import signal
+import socket
+import sys
+from typing import Awaitable, Callable
+from telegram_bot import format_caption, get_chats, send_to_chats, shutdown
 import mdb as db
-import lapresse as lp
+import article
+import cpupool
+import images
+import sources
 import rssutils
+from translate import atranslate_text
+from cache import get_cache
+import backends
+import metrics
+from backends import get_pool
+from pipeline import Stage, run_pipeline, stage_seconds
+import httpclient
+from scheduler import Schedule, run_forever
 
 log = logger.getChild(__name__)
 
 
-async def process_entry(entity):
-    """Process a single RSS entry"""
-    content = lp.get_entry_content(entity)
-    text = lp.get_readability(content)
-    telegraph_content = lp.prepare_telegraph_content(text)
-    translated_text = lp.translate_content(telegraph_content)
-    title = lp.translate_text(
-        entity["title"],
-        source_lang="French",
-        target_lang="Simple Chinese"
-    )
-    summary = lp.translate_text(
-        entity["summary"],
-        source_lang="French",
-        target_lang="Simple Chinese"
+# Number of entries processed concurrently by each pipeline stage
+workers = int(ut.ENV.get("PIPELINE_WORKERS", "4"))
+# Capacity of the queues between pipeline stages
+queue_size = int(ut.ENV.get("PIPELINE_QUEUE_SIZE", str(workers)))
+
+
+# Processing states of an entry in order, each persisted once its stage completes
+STATES = ["new", "fetched", "parsed", "translated", "published", "sent"]
+# Artifacts persisted with each state, enough to resume from it after a restart
+ARTIFACTS = {
+    "fetched": ("content",),
+    "parsed": ("nodes", "texts"),
+    "translated": ("title", "summary", "translated_nodes", "translated_texts", "original"),
+    "published": ("url", "path"),
+}
+# Artifacts no longer needed once an entry is sent, parts are those of entries parsed as HTML.
+# The texts and their translations are kept to translate only the changed paragraphs of an update,
+# the translated node tree is rebuilt from them.
+DROPPED_ARTIFACTS = ("content", "nodes", "parts", "translated_nodes", "previous")
+# Post to Telegram as soon as the title and summary are translated, behind a placeholder page
+early_post = ut.ENV.get("EARLY_POST", "false") == "true"
+# Entries failing this many times are given up
+max_attempts = int(ut.ENV.get("PIPELINE_MAX_ATTEMPTS", "3"))
+# Update the page of sent entries whose feed entry changed, translating only the changed paragraphs
+update_articles = ut.ENV.get("UPDATE_ARTICLES", "true") == "true"
+
+# Role of this process: "all" polls the feeds and processes their entries, "producer" only
+# polls them and queues the new entries, "worker" only processes queued entries under a lease
+role = ut.ENV.get("ROLE", "all")
+worker_id = ut.ENV.get("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+# Seconds a claimed entry stays reserved to its worker without a heartbeat
+lease_seconds = float(ut.ENV.get("LEASE_SECONDS", "300"))
+# Seconds an idle worker waits before looking for queued entries again
+worker_idle = float(ut.ENV.get("WORKER_IDLE", "5"))
+# Seconds a failed entry waits before it is claimed again, doubled after each further failure
+retry_backoff = float(ut.ENV.get("PIPELINE_RETRY_BACKOFF", "60"))
+
+
+def source_of(entity: dict) -> sources.Source:
+    """Get the source an entry was read from"""
+    return sources.get_source(entity.get("source", "lapresse"))
+
+
+def item_of(doc: dict) -> dict:
+    """Turn a stored entry document into a pipeline item resuming from its state"""
+    doc = dict(doc)
+    artifacts = doc.pop("artifacts", None) or {}
+    return {
+        "entity": doc,
+        "key": doc.get("key") or rssutils.entry_key(doc),
+        "state": doc.get("state", "new"),
+        "sent_chats": doc.get("sent_chats") or [],
+        **artifacts,
+    }
+
+
+async def fetch_stage(item: dict) -> dict:
+    """Download the article page of an entry"""
+    entity = item["entity"]
+    log.info(f"Processing: {entity['published']}-{entity['title']} \n {entity['link']} \n {entity['image']}")
+    content = await source_of(entity).aget_content(entity["link"])
+    if not content:
+        raise ValueError(f"No content for {entity['link']}")
+    item["content"] = content
+    return item
+
+
+async def image_stage(item: dict) -> dict:
+    """Download the entry's image into the image cache, the URL is kept if this fails"""
+    item["photo"] = None
+    if url := item["entity"].get("image"):
+        try:
+            item["photo"] = await images.aget_image(url)
+        except Exception as e:
+            log.error(f"Image cache failed for {url}: {e}")
+    return item
+
+
+async def parse_stage(item: dict) -> dict:
+    """Extract the readable article and convert it for Telegraph"""
+    source = source_of(item["entity"])
+    item["nodes"], item["texts"] = await source.aprepare_nodes(item["content"])
+    return item
+
+
+async def translate_headline(item: dict) -> None:
+    """Translate the title and summary on their own, so they finish before the body"""
+    entity = item["entity"]
+    lang = source_of(entity).lang
+    item["title"], item["summary"] = await asyncio.gather(
+        atranslate_text(
+            entity["title"],
+            source_lang=lang,
+            target_lang=article.TARGET_LANG
+        ),
+        atranslate_text(
+            entity["summary"],
+            source_lang=lang,
+            target_lang=article.TARGET_LANG
+        )
     )
-    url = lp.create_telegraph_page(title, translated_text)
-    log.info(f"Telegraph URL: {url}")
-
-    await send_new(
-        entity,
-        title,
-        summary,
-        url
+    await asyncio.to_thread(db.save_progress, item["key"], item["state"],
+                            {"title": item["title"], "summary": item["summary"]})
+
+
+async def post_preview(item: dict) -> None:
+    """Publish a placeholder page for the translated title and summary and post it to Telegram"""
+    if not item.get("path"):
+        page = await asyncio.to_thread(
+            article.publish_page, item["title"], article.placeholder_nodes(item["summary"], item["entity"]["link"]))
+        item["url"], item["path"] = page["url"], page["path"]
+        await asyncio.to_thread(db.save_progress, item["key"], item["state"],
+                                {"url": item["url"], "path": item["path"]})
+        log.info(f"Telegraph placeholder URL: {item['url']}")
+    if failed := await send_pending(item):
+        log.warning(f"Early post failed for {', '.join(failed)}, retrying after publishing")
+
+
+async def translate_again(text: str, lang: str, previous: str, translated: str) -> str:
+    """Translate a title or summary of an updated entry, unless it did not change"""
+    if text == previous and translated:
+        return translated
+    return await atranslate_text(text, source_lang=lang, target_lang=article.TARGET_LANG)
+
+
+async def translate_update(item: dict) -> list:
+    """Translate the changed paragraphs, title and summary of an updated entry, returning the body texts"""
+    entity, previous = item["entity"], item["previous"]
+    lang = source_of(entity).lang
+    translated, item["title"], item["summary"] = await asyncio.gather(
+        article.aupdate_texts(item["texts"], previous["texts"], previous["translated_texts"], lang),
+        translate_again(entity["title"], lang, previous["title"], previous["translated_title"]),
+        translate_again(entity["summary"], lang, previous["summary"], previous["translated_summary"])
     )
+    return translated
 
 
-async def main() -> None:
-    """Main execution function to fetch and store RSS feed data."""
-    try:
+async def translate_stage(item: dict) -> dict:
+    """
+    Translate the article body, title and summary concurrently.
+    With EARLY_POST the title and summary are translated first and posted to
+    Telegram behind a placeholder page while the body is being translated.
+    An updated entry only has its changed paragraphs translated again.
+    """
+    entity = item["entity"]
+    lang = source_of(entity).lang
+    if item.get("previous"):
+        translated = await translate_update(item)
+    elif early_post:
+        if not item.get("title"):
+            await translate_headline(item)
+        body = asyncio.create_task(article.atranslate_texts(item["texts"], lang))
+        try:
+            await post_preview(item)
+        except Exception as e:
+            log.error(f"Early post failed for {entity['link']}: {e}")
+        translated = await body
+    else:
+        translated, item["title"], item["summary"] = await asyncio.gather(
+            article.atranslate_texts(item["texts"], lang),
+            atranslate_text(
+                entity["title"],
+                source_lang=lang,
+                target_lang=article.TARGET_LANG
+            ),
+            atranslate_text(
+                entity["summary"],
+                source_lang=lang,
+                target_lang=article.TARGET_LANG
+            )
+        )
+    item["translated_texts"] = translated
+    item["original"] = {"title": entity["title"], "summary": entity["summary"]}
+    if "nodes" in item:
+        item["translated_nodes"] = article.render_nodes(item["nodes"], translated)
+    else:
+        # Entry parsed into an HTML template before node templates
+        item["translated_nodes"] = article.html_nodes(article.render_texts(item["parts"], translated))
+    return item
+
+
+async def publish_stage(item: dict) -> dict:
+    """
+    Publish the translated article to Telegraph, replacing the placeholder page if
+    there is one, and reusing the page if the same content was already published
+    """
+    if "translated_nodes" in item:
+        nodes = item["translated_nodes"]
+    else:
+        # Entry translated into HTML before node templates
+        nodes = article.html_nodes(item["translated_text"])
+    page = await asyncio.to_thread(article.publish_page, item["title"], nodes, item.get("path"))
+    item["url"], item["path"] = page["url"], page["path"]
+    log.info(f"Telegraph URL: {item['url']}")
+    return item
+
+
+async def send_pending(item: dict) -> list:
+    """Send the article to the Telegram chats it was not sent to yet, returning the failed ones"""
+    caption = format_caption(item["entity"], item["title"], item["summary"], item["url"])
+    chats = [chat_id for chat_id in get_chats() if chat_id not in item["sent_chats"]]
+
+    async def on_sent(chat_id: str) -> None:
+        item["sent_chats"].append(chat_id)
+        await asyncio.to_thread(db.add_sent_chat, item["key"], chat_id)
+
+    results = await send_to_chats(chats, item["entity"], caption, on_sent, item.get("photo"))
+    return [chat_id for chat_id in chats if not results.get(chat_id)]
+
+
+@metrics.timed(stage_seconds, stage="send")
+async def send_stage(item: dict) -> bool:
+    """Send the published article to the Telegram chats it was not sent to yet"""
+    if not all([item["title"], item["summary"], item["url"]]):
+        log.error("Missing required parameters")
+        await asyncio.to_thread(db.record_failure, item["key"], "send: missing title, summary or url")
+        return False
+    if failed := await send_pending(item):
+        await asyncio.to_thread(db.record_failure, item["key"], f"send: {', '.join(failed)}")
+        return False
+    log.info(f"Message sent successfully: {item['title']}")
+    item["state"] = "sent"
+    await asyncio.to_thread(db.finish_entry, item["key"], "sent", DROPPED_ARTIFACTS)
+    return True
+
+
+def resumable(name: str, func: Callable[[dict], Awaitable[dict]], state: str) -> Stage:
+    """
+    Wrap a stage so it is skipped for items that already reached its state,
+    and persists its state and artifacts, or the failure, once it ran.
+    """
+    async def run(item: dict) -> dict:
+        if STATES.index(item["state"]) >= STATES.index(state):
+            return item
+        try:
+            item = await func(item)
+        except Exception as e:
+            await asyncio.to_thread(db.record_failure, item["key"], f"{name}: {e}")
+            raise
+        item["state"] = state
+        await asyncio.to_thread(db.save_progress, item["key"], state, {k: item[k] for k in ARTIFACTS[state]})
+        return item
+    return Stage(name, run, workers)
+
+
+STAGES = [
+    resumable("fetch", fetch_stage, "fetched"),
+    Stage("image", image_stage, workers),
+    resumable("parse", parse_stage, "parsed"),
+    resumable("translate", translate_stage, "translated"),
+    resumable("publish", publish_stage, "published"),
+]
+
 
-        newrss = lp.fetch_rss()
-        lastrss = db.get_last_rss(lp.NAME)
+async def process_entry(doc: dict) -> bool:
+    """Process a single stored entry from its last completed stage"""
+    item = item_of(doc)
+    for stage in STAGES:
+        item = await stage.func(item)
+    return await send_stage(item)
 
-        entities = rssutils.get_new_entries(newrss, lastrss)
-        if ut.ENV.get("SEND_LAST", "false") == "true":
+
+async def poll_source(source: sources.Source, process: bool = True) -> int:
+    """
+    Fetch one source's feed, then claim and process its new entries together with
+    the ones an earlier run left unfinished, unless process is False and workers
+    take them from the queue. Returns how many entries were new.
+    """
+    send_last = ut.ENV.get("SEND_LAST", "false") == "true"
+    lastrss = db.get_last_rss(source.name)
+    # Entries were stored one by one: stop reading the feed at the stored ones, unless
+    # updates are tracked, as changed entries can sit anywhere in the feed
+    stored = not send_last and not update_articles and not (lastrss and "entries" in lastrss)
+    newrss = await source.afetch_rss(None if send_last else lastrss, db.get_known_hashes if stored else None)
+    entities, updated = [], []
+    if newrss is None:
+        log.info(f"No new entries found: {source.name}")
+    else:
+        if lastrss and "entries" in lastrss:
+            # Snapshot written before entries were stored one by one
+            entities = rssutils.get_new_entries(newrss, lastrss) or []
+        else:
+            entities, updated = rssutils.diff_entries(newrss["entries"], db.get_known_hashes(newrss["entries"]))
+            if updated:
+                log.info(f"Updated entries in {source.name}: {len(updated)}")
+        if send_last:
             entities = newrss["entries"][0:1]
+        db.save_entries(newrss["entries"])
+        db.start_entries(entities, restart=send_last)
+        if updated and update_articles:
+            if restarted := db.restart_updated(updated):
+                log.info(f"Updating the pages of {restarted} sent entries from {source.name}")
+        # Save every changed feed so its ETag/Last-Modified validators are kept
+        db.save_rss(newrss)
         if entities:
-            log.info(f"New entries found: {len(entities)}")
-            db.save_rss(newrss)
-            for entity in entities:
-                log.info(f"Processing: {
-                         entity['published']}-{entity['title']} \n {entity['link']} \n {entity['image']}")
-                await process_entry(entity)
+            log.info(f"New entries found in {source.name}: {len(entities)}")
+    if not process:
+        return len(entities)
+
+    pending = await asyncio.to_thread(claim_entries, source.name)
+    if pending:
+        if len(pending) > len(entities):
+            log.info(f"Resuming unfinished entries in {source.name}: {len(pending) - len(entities)}")
+        results = await process_entries(pending)
+        log.info(f"Sent {sum(1 for sent in results if sent)} of {len(pending)} entries from {source.name}")
+    elif newrss is not None:
+        log.info(f"No new entries found: {source.name}")
+    return len(entities)
+
+
+async def heartbeat(key: str, work: asyncio.Task) -> None:
+    """Renew the lease on an entry while it is processed, cancelling the work if the lease is lost"""
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        if not await asyncio.to_thread(db.renew_lease, key, worker_id, lease_seconds):
+            log.warning(f"Lease lost on {key}, leaving it to its new worker")
+            work.cancel()
+            return
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before an entry that failed attempts times is retried"""
+    return retry_backoff * 2 ** max(attempts - 1, 0)
+
+
+async def settle(doc: dict, sent: bool) -> None:
+    """
+    Release the lease on a processed entry once it is sent, or keep it through a
+    backoff after a failure, so that an outage does not use up its attempts at once.
+    An update failing its last attempt is reverted to the version sent before.
+    """
+    if sent:
+        await asyncio.to_thread(db.release_entry, doc["key"], worker_id)
+        return
+    if await asyncio.to_thread(db.revert_update, doc["key"], max_attempts):
+        log.warning(f"Gave up updating {doc['key']}, keeping the version sent before")
+        await asyncio.to_thread(db.release_entry, doc["key"], worker_id)
+        return
+    delay = retry_delay(doc.get("attempts", 0) + 1)
+    log.info(f"Retrying {doc['key']} in {delay:.0f}s at the earliest")
+    # Hold the lease through the backoff, no worker claims the entry before it expires
+    await asyncio.to_thread(db.renew_lease, doc["key"], worker_id, delay)
+
+
+def claim_entries(name: str) -> list:
+    """Claim every unfinished entry of a source no worker holds, oldest first"""
+    docs = []
+    while doc := db.claim_entry(worker_id, STATES[:-1], max_attempts, lease_seconds, [name]):
+        docs.append(doc)
+    return docs
+
+
+async def process_claimed(doc: dict) -> bool:
+    """Process an entry claimed from the queue, holding its lease until it is settled"""
+    key = doc["key"]
+    work = asyncio.create_task(process_entry(doc))
+    beat = asyncio.create_task(heartbeat(key, work))
+    try:
+        sent = await work
+    except asyncio.CancelledError:
+        lost = beat.done()
+        beat.cancel()
+        await asyncio.to_thread(db.release_entry, key, worker_id)
+        if lost:
+            return False
+        raise
+    except Exception as e:
+        log.error(f"Entry {key} failed: {e}")
+        sent = False
+    beat.cancel()
+    await settle(doc, sent)
+    return sent
+
+
+async def process_entries(docs) -> list:
+    """
+    Process entries claimed from the queue concurrently, sending them to Telegram
+    in feed order. Their leases are renewed while they are processed, and an entry
+    whose lease is lost is not sent, its new worker sends it.
+    """
+    lost = set()
+
+    async def beat() -> None:
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            for doc in docs:
+                if doc["key"] not in lost and not await asyncio.to_thread(
+                        db.renew_lease, doc["key"], worker_id, lease_seconds):
+                    log.warning(f"Lease lost on {doc['key']}, leaving it to its new worker")
+                    lost.add(doc["key"])
+
+    async def sink(item: dict) -> bool:
+        if item["key"] in lost:
+            return False
+        return await send_stage(item)
+
+    beating = asyncio.create_task(beat())
+    try:
+        results = await run_pipeline([item_of(doc) for doc in docs], STAGES, sink, queue_size)
+    except asyncio.CancelledError:
+        for doc in docs:
+            await asyncio.to_thread(db.release_entry, doc["key"], worker_id)
+        raise
+    finally:
+        beating.cancel()
+    for doc, sent in zip(docs, results):
+        if doc["key"] not in lost:
+            await settle(doc, bool(sent))
+    return results
+
+
+async def run_worker(stop: asyncio.Event, drain: bool = False) -> int:
+    """
+    Claim queued entries of the enabled sources and process them, PIPELINE_WORKERS
+    at a time, until stop is set, or until the queue is empty with drain.
+    Returns how many entries were sent.
+    """
+    names = [source.name for source in sources.load_sources()]
+    sent = 0
+
+    async def claim_loop() -> None:
+        nonlocal sent
+        while not stop.is_set():
+            doc = await asyncio.to_thread(
+                db.claim_entry, worker_id, STATES[:-1], max_attempts, lease_seconds, names)
+            if doc is None:
+                if drain:
+                    return
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=worker_idle)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if await process_claimed(doc):
+                sent += 1
+
+    log.info(f"Worker {worker_id} processing queued entries of {', '.join(names)}")
+    await asyncio.gather(*(claim_loop() for _ in range(max(1, workers))))
+    return sent
+
+
+async def run_once() -> None:
+    """Poll every source once, or process every queued entry once in the worker role"""
+    if role == "worker":
+        log.info(f"Sent {await run_worker(asyncio.Event(), drain=True)} queued entries")
+        return
+    results = await asyncio.gather(
+        *(poll_source(source, process=role != "producer") for source in sources.load_sources()),
+        return_exceptions=True
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    for failure in failures:
+        log.error(f"Source failed: {failure}")
+    log.info(f"Translation cache: {get_cache().stats()}")
+    if failures:
+        raise failures[0]
+
+
+async def run_daemon() -> None:
+    """
+    Poll every source on its adaptive schedule, or process queued entries in the
+    worker role, until SIGINT or SIGTERM
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    tasks = []
+    if role == "worker":
+        tasks.append(run_worker(stop))
+    else:
+        schedule = Schedule.from_env()
+        log.info(f"Starting daemon ({role}): {schedule}")
+        process = role != "producer"
+        tasks.append(run_forever(
+            [(source.name, functools.partial(poll_source, source, process)) for source in sources.load_sources()],
+            schedule,
+            stop
+        ))
+    if role != "producer":
+        tasks.append(get_pool().run_health_checks(stop, backends.health_interval))
+    await asyncio.gather(*tasks)
+    log.info(f"Translation cache: {get_cache().stats()}")
+
+
+async def main(daemon: bool = False) -> None:
+    """Main execution function to fetch and store RSS feed data."""
+    server = metrics.serve(metrics.metrics_port) if metrics.metrics_port else None
+    try:
+        if daemon:
+            await run_daemon()
         else:
-            log.info("No new entries found")
+            await run_once()
 
     except Exception as e:
         log.error(f"Error in main execution: {str(e)}")
         raise
+    finally:
+        await httpclient.aclose()
+        cpupool.shutdown()
+        if daemon:
+            await shutdown()
+        if metrics.metrics_file:
+            metrics.dump(metrics.metrics_file)
+        if server:
+            server.shutdown()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(daemon="--daemon" in sys.argv or ut.ENV.get("DAEMON", "false") == "true"))
@@ -0,0 +1,100 @@
+"""Streaming feed reader module for VOCNews.
+
+feedparser builds the whole feed in memory and every entry is parsed, dated and
+hashed on every poll, although most of them were already stored by the previous
+one. iter_entries walks the feed with lxml's iterparse instead, freeing every
+item once read, and yields its entries one at a time, so the reader
+can stop as soon as it reaches entries known from storage: read_delta looks the
+entries up batch by batch and stops after the first batch that holds nothing new
+or updated. Parse work and memory per poll then follow the size of the delta,
+not the size of the feed. Changed or back-dated entries after that batch are
+not read, so streaming is opt-in (RSS_STREAMING) and feedrss reads whole feeds
+while it tracks updates (UPDATE_ARTICLES).
+
+Each item is read by feedparser alone, through its public parse function, so
+entries have the same values as in a whole parsed feed and their content
+hashes do not change with the reader.
+"""
+
+import io
+from typing import Callable, Dict, Iterator, List, Optional
+import feedparser
+from lxml import etree
+import rssutils
+import utils as ut
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+# Entries looked up in storage at once while streaming a feed
+batch_size = int(ut.ENV.get("RSS_STREAM_BATCH", "10"))
+
+# Feeds holding a single RSS item or Atom entry, for feedparser to read it
+RSS_FEED = b'<rss version="2.0"><channel>%s</channel></rss>'
+ATOM_FEED = b'<feed xmlns="http://www.w3.org/2005/Atom">%s</feed>'
+
+
+def local_name(tag: str) -> str:
+    """Strip the namespace of an element tag."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def to_entry(item: etree._Element) -> feedparser.FeedParserDict:
+    """
+    Reads an RSS item or Atom entry element with feedparser, as the only entry
+    of a feed, so it is sanitized and dated exactly like a whole parsed feed.
+    Args:
+        item: item or entry element
+    Returns:
+        feedparser.FeedParserDict: Entry as feedparser returns it
+    """
+    wrapper = ATOM_FEED if local_name(item.tag) == "entry" else RSS_FEED
+    entries = feedparser.parse(wrapper % etree.tostring(item, with_tail=False)).entries
+    return entries[0] if entries else feedparser.FeedParserDict()
+
+
+def iter_entries(data: bytes) -> Iterator[feedparser.FeedParserDict]:
+    """
+    Lazily reads the entries of an RSS or Atom feed, in feed order.
+    Elements are freed once read, and nothing after the last entry pulled is parsed.
+    Args:
+        data: Raw feed document
+    Yields:
+        feedparser.FeedParserDict: Entries as returned by to_entry
+    Raises:
+        lxml.etree.XMLSyntaxError: If the document is not well-formed
+    """
+    items = etree.iterparse(io.BytesIO(data), events=("end",), tag=("{*}item", "{*}entry"),
+                            resolve_entities=False, no_network=True)
+    for _, item in items:
+        yield to_entry(item)
+        item.clear()
+        while item.getprevious() is not None:
+            del item.getparent()[0]
+
+
+def read_delta(entries: Iterator[Dict], lookup: Callable[[List[Dict]], Dict[str, str]],
+               size: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Yields the entries of a feed up to the first batch already stored unchanged.
+    Feeds list the newest entries first, so the entries after a batch that holds
+    nothing new or updated are taken as known without being read.
+    Args:
+        entries: Feed entries, newest first
+        lookup: Gets the stored content hash of entries by key, such as mdb.get_known_hashes
+        size: Entries per lookup, defaults to batch_size
+    Yields:
+        Dict: Entries of the batches read, known ones included
+    """
+    size = size or batch_size
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) < size:
+            continue
+        yield from batch
+        if not any(rssutils.diff_entries(batch, lookup(batch))):
+            log.debug(f"Stopped reading feed at {len(batch)} unchanged entries")
+            return
+        batch = []
+    yield from batch
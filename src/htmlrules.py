@@ -0,0 +1,261 @@
+"""Declarative HTML cleanup rules for VOCNews.
+
+A Rules object lists what to do with matching elements: remove them with their
+content, unwrap them (keep the content, drop the tag) or rename them, plus an
+optional whitelist of tags and attributes. Rules from several sources (the
+generic cleaner, a news site, Telegraph) are merged and compiled into a single
+CompiledRules, which applies all of them in one walk over the tree, however
+many rules there are.
+
+Selectors are a small CSS subset: ``tag``, ``#id``, ``.class``, their
+combinations like ``div.author`` or ``header#mainHeader``, and descendant
+combinators like ``header h1``.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+from lxml import html
+from lxml.html import defs
+
+# (tag, id, classes) of an element, as seen by selectors
+Descriptor = Tuple[str, Optional[str], FrozenSet[str]]
+
+# Attributes holding URLs that must not run javascript
+LINK_ATTRS = ('href', 'src', 'action', 'formaction')
+
+selector_re = re.compile(r"^([a-zA-Z][\w-]*|\*)?((?:[#.][\w-]+)*)$")
+
+
+@dataclass(frozen=True)
+class Selector:
+    """A parsed selector.
+
+    Attributes:
+        tag: Tag name, None matches any tag
+        id: Required id attribute
+        classes: Required CSS classes
+        ancestor: Selector an ancestor must match, for descendant combinators
+    """
+    tag: Optional[str] = None
+    id: Optional[str] = None
+    classes: FrozenSet[str] = frozenset()
+    ancestor: Optional["Selector"] = None
+
+    def match_one(self, descriptor: Descriptor) -> bool:
+        """Check the element itself, ignoring the ancestor part."""
+        tag, id_, classes = descriptor
+        return ((self.tag is None or self.tag == tag)
+                and (self.id is None or self.id == id_)
+                and self.classes <= classes)
+
+    def match(self, descriptor: Descriptor, ancestors: Sequence[Descriptor]) -> bool:
+        """Check the element and, for descendant combinators, its ancestors.
+
+        Args:
+            descriptor: Descriptor of the element
+            ancestors: Descriptors of its ancestors, outermost first
+
+        Returns:
+            bool: True if the selector matches
+        """
+        if not self.match_one(descriptor):
+            return False
+        if self.ancestor is None:
+            return True
+        return any(self.ancestor.match(ancestors[i], ancestors[:i])
+                   for i in range(len(ancestors) - 1, -1, -1))
+
+
+def parse_selector(text: str) -> Selector:
+    """Parse a selector string.
+
+    Args:
+        text: Selector such as "div.author" or "header h1"
+
+    Returns:
+        Selector: Parsed selector
+
+    Raises:
+        ValueError: If the selector uses unsupported syntax
+    """
+    selector = None
+    for part in text.split():
+        if not (match := selector_re.match(part)):
+            raise ValueError(f"Unsupported selector: {text!r}")
+        tag, rest = match.groups()
+        ids = [token[1:] for token in re.findall(r"[#.][\w-]+", rest) if token[0] == "#"]
+        classes = [token[1:] for token in re.findall(r"[#.][\w-]+", rest) if token[0] == "."]
+        if len(ids) > 1:
+            raise ValueError(f"Unsupported selector: {text!r}")
+        selector = Selector(
+            tag=None if tag in (None, "*") else tag.lower(),
+            id=ids[0] if ids else None,
+            classes=frozenset(classes),
+            ancestor=selector,
+        )
+    if selector is None:
+        raise ValueError("Empty selector")
+    return selector
+
+
+@dataclass
+class Rules:
+    """Declarative cleanup rules.
+
+    Attributes:
+        remove: Selectors of elements removed with their content
+        unwrap: Selectors of elements replaced by their content
+        rename: Tag renames, applied before the allowed_tags check
+        allowed_tags: If set, other tags are unwrapped
+        allowed_attrs: If set, other attributes are stripped
+        remove_comments: Remove comments and processing instructions
+        remove_javascript: Strip javascript: URLs from link attributes
+    """
+    remove: Sequence[str] = ()
+    unwrap: Sequence[str] = ()
+    rename: Dict[str, str] = field(default_factory=dict)
+    allowed_tags: Optional[FrozenSet[str]] = None
+    allowed_attrs: Optional[FrozenSet[str]] = None
+    remove_comments: bool = False
+    remove_javascript: bool = False
+
+    def merge(self, other: "Rules") -> "Rules":
+        """Combine two rule sets, other's renames winning on conflicts.
+
+        Args:
+            other: Rules applied together with these ones
+
+        Returns:
+            Rules: Union of removals, unwraps and renames, intersection of whitelists
+        """
+        def intersect(a, b):
+            if a is None or b is None:
+                return a if b is None else b
+            return a & b
+
+        return Rules(
+            remove=[*self.remove, *other.remove],
+            unwrap=[*self.unwrap, *other.unwrap],
+            rename={**self.rename, **other.rename},
+            allowed_tags=intersect(self.allowed_tags, other.allowed_tags),
+            allowed_attrs=intersect(self.allowed_attrs, other.allowed_attrs),
+            remove_comments=self.remove_comments or other.remove_comments,
+            remove_javascript=self.remove_javascript or other.remove_javascript,
+        )
+
+    def compile(self) -> "CompiledRules":
+        """Compile the rules for a single-pass walk.
+
+        Returns:
+            CompiledRules: Compiled rules
+        """
+        return CompiledRules(self)
+
+
+def index_selectors(selectors: Sequence[str]) -> Tuple[Dict[str, List[Selector]], List[Selector]]:
+    """Index selectors by tag so each element only checks the ones that can match.
+
+    Args:
+        selectors: Selector strings
+
+    Returns:
+        Tuple[Dict[str, List[Selector]], List[Selector]]: Selectors by tag, and
+            selectors matching any tag
+    """
+    by_tag: Dict[str, List[Selector]] = {}
+    any_tag: List[Selector] = []
+    for text in selectors:
+        selector = parse_selector(text)
+        if selector.tag is None:
+            any_tag.append(selector)
+        else:
+            by_tag.setdefault(selector.tag, []).append(selector)
+    return by_tag, any_tag
+
+
+class CompiledRules:
+    """Rules compiled into tag-indexed lookups and applied in one tree walk."""
+
+    def __init__(self, rules: Rules) -> None:
+        self.rules = rules
+        self.remove_by_tag, self.remove_any = index_selectors(rules.remove)
+        self.unwrap_by_tag, self.unwrap_any = index_selectors(rules.unwrap)
+        self.rename = dict(rules.rename)
+        self.allowed_tags = rules.allowed_tags
+        self.allowed_attrs = rules.allowed_attrs
+        self.remove_comments = rules.remove_comments
+        self.remove_javascript = rules.remove_javascript
+
+    def apply(self, root: html.HtmlElement) -> html.HtmlElement:
+        """Apply the rules in place to the descendants of root.
+
+        The root element itself is never removed, unwrapped or renamed.
+
+        Args:
+            root: Element to clean, usually <html> or <body>
+
+        Returns:
+            html.HtmlElement: root
+        """
+        self._walk(root, [])
+        return root
+
+    @staticmethod
+    def _matches(by_tag: Dict[str, List[Selector]], any_tag: List[Selector],
+                 descriptor: Descriptor, ancestors: List[Descriptor]) -> bool:
+        for selector in by_tag.get(descriptor[0], ()):
+            if selector.match(descriptor, ancestors):
+                return True
+        for selector in any_tag:
+            if selector.match(descriptor, ancestors):
+                return True
+        return False
+
+    def _clean_attrs(self, element: html.HtmlElement) -> None:
+        attrib = element.attrib
+        if self.allowed_attrs is not None:
+            for name in [name for name in attrib.keys() if name not in self.allowed_attrs]:
+                del attrib[name]
+        if self.remove_javascript:
+            for name in LINK_ATTRS:
+                value = attrib.get(name)
+                if value and re.sub(r"\s", "", value).lower().startswith("javascript:"):
+                    del attrib[name]
+
+    def _walk(self, element: html.HtmlElement, ancestors: List[Descriptor]) -> None:
+        for child in list(element):
+            tag = child.tag
+            if not isinstance(tag, str):
+                if self.remove_comments:
+                    child.drop_tree()
+                continue
+            tag = tag.lower()
+            descriptor = (tag, child.get("id"), frozenset(child.get("class", "").split()))
+            if self._matches(self.remove_by_tag, self.remove_any, descriptor, ancestors):
+                child.drop_tree()
+                continue
+            self._clean_attrs(child)
+            ancestors.append(descriptor)
+            self._walk(child, ancestors)
+            ancestors.pop()
+            new_tag = self.rename.get(tag, tag)
+            if new_tag != child.tag:
+                child.tag = new_tag
+            if ((self.allowed_tags is not None and new_tag not in self.allowed_tags)
+                    or self._matches(self.unwrap_by_tag, self.unwrap_any, descriptor, ancestors)):
+                child.drop_tag()
+
+
+# Equivalent of lxml's Cleaner(scripts, javascript, comments, style, page_structure=False)
+# with its other defaults: links, meta, embedded, frames, forms, annoying tags,
+# unknown tags and unsafe attributes
+CLEANER_RULES = Rules(
+    remove=["script", "style", "link", "meta", "base", "applet", "frame", "frameset", "noframes",
+            "button", "input", "select", "textarea"],
+    unwrap=["iframe", "embed", "layer", "object", "param", "form", "blink", "marquee"],
+    allowed_tags=frozenset(defs.tags),
+    allowed_attrs=frozenset(defs.safe_attrs),
+    remove_comments=True,
+    remove_javascript=True,
+)
@@ -0,0 +1,201 @@
+"""Shared HTTP client module for VOCNews.
+
+All feed and article downloads go through one connection-pooled httpx client
+(sync) or one per event loop (async), so repeated requests to the same site
+reuse keep-alive connections, and HTTP/2 when the optional h2 package is
+installed. Feeds can be fetched conditionally with ETag/Last-Modified
+validators, an unchanged feed costing a 304 instead of a full download.
+"""
+
+import asyncio
+import importlib.util
+from typing import Dict, Optional, Tuple
+import httpx
+import utils as ut
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+timeout = float(ut.ENV.get("HTTP_TIMEOUT", "10"))
+max_connections = int(ut.ENV.get("HTTP_MAX_CONNECTIONS", "20"))
+user_agent = ut.ENV.get("HTTP_USER_AGENT", "Mozilla/5.0 (compatible; VOCNews/0.1)")
+http2 = importlib.util.find_spec("h2") is not None
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def client_options() -> Dict:
+    """Get the options shared by the sync and async clients.
+
+    Returns:
+        Dict: Keyword arguments for httpx.Client and httpx.AsyncClient
+    """
+    return {
+        "http2": http2,
+        "timeout": timeout,
+        "follow_redirects": True,
+        "headers": {"User-Agent": user_agent},
+        "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    }
+
+
+def get_client() -> httpx.Client:
+    """Get the shared connection-pooled sync client.
+
+    Returns:
+        httpx.Client: Shared client
+    """
+    global _client
+    if _client is None:
+        _client = httpx.Client(**client_options())
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get the shared connection-pooled async client of the running event loop.
+
+    Returns:
+        httpx.AsyncClient: Shared client
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(**client_options())
+        _async_client_loop = loop
+    return _async_client
+
+
+def conditional_headers(etag: Optional[str] = None, last_modified: Optional[str] = None) -> Dict[str, str]:
+    """Build conditional request headers from stored validators.
+
+    Args:
+        etag: ETag of the last full response
+        last_modified: Last-Modified of the last full response
+
+    Returns:
+        Dict[str, str]: If-None-Match / If-Modified-Since headers
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def get_text(url: str) -> Optional[str]:
+    """Fetch a page with the shared client.
+
+    Args:
+        url: The URL to fetch
+
+    Returns:
+        Optional[str]: Decoded response body or None if the request fails
+    """
+    try:
+        response = get_client().get(url)
+        log.debug(f"GET {url} {response.status_code} {response.http_version}")
+        response.raise_for_status()
+        return response.text
+    except httpx.HTTPError as e:
+        log.error(f"Failed to fetch {url}: {e}")
+        return None
+
+
+async def aget_text(url: str) -> Optional[str]:
+    """Fetch a page with the shared async client.
+
+    Args:
+        url: The URL to fetch
+
+    Returns:
+        Optional[str]: Decoded response body or None if the request fails
+    """
+    try:
+        response = await get_async_client().get(url)
+        log.debug(f"GET {url} {response.status_code} {response.http_version}")
+        response.raise_for_status()
+        return response.text
+    except httpx.HTTPError as e:
+        log.error(f"Failed to fetch {url}: {e}")
+        return None
+
+
+async def aget_bytes(url: str) -> Optional[bytes]:
+    """Fetch a binary resource such as an image with the shared async client.
+
+    Args:
+        url: The URL to fetch
+
+    Returns:
+        Optional[bytes]: Response body or None if the request fails
+    """
+    try:
+        response = await get_async_client().get(url)
+        log.debug(f"GET {url} {response.status_code} {response.http_version}")
+        response.raise_for_status()
+        return response.content
+    except httpx.HTTPError as e:
+        log.error(f"Failed to fetch {url}: {e}")
+        return None
+
+
+def get_conditional(url: str, etag: Optional[str] = None,
+                    last_modified: Optional[str] = None) -> Tuple[Optional[httpx.Response], bool]:
+    """Fetch a resource unless it is unchanged since the given validators.
+
+    Args:
+        url: The URL to fetch
+        etag: ETag of the last full response
+        last_modified: Last-Modified of the last full response
+
+    Returns:
+        Tuple[Optional[httpx.Response], bool]: The full response (None when
+            unchanged) and whether the resource changed
+
+    Raises:
+        httpx.HTTPError: If the request fails
+    """
+    response = get_client().get(url, headers=conditional_headers(etag, last_modified))
+    log.debug(f"GET {url} {response.status_code} {response.http_version}")
+    if response.status_code == httpx.codes.NOT_MODIFIED:
+        return None, False
+    response.raise_for_status()
+    return response, True
+
+
+async def aget_conditional(url: str, etag: Optional[str] = None,
+                           last_modified: Optional[str] = None) -> Tuple[Optional[httpx.Response], bool]:
+    """Async version of get_conditional.
+
+    Args:
+        url: The URL to fetch
+        etag: ETag of the last full response
+        last_modified: Last-Modified of the last full response
+
+    Returns:
+        Tuple[Optional[httpx.Response], bool]: The full response (None when
+            unchanged) and whether the resource changed
+
+    Raises:
+        httpx.HTTPError: If the request fails
+    """
+    response = await get_async_client().get(url, headers=conditional_headers(etag, last_modified))
+    log.debug(f"GET {url} {response.status_code} {response.http_version}")
+    if response.status_code == httpx.codes.NOT_MODIFIED:
+        return None, False
+    response.raise_for_status()
+    return response, True
+
+
+async def aclose() -> None:
+    """Close the shared clients and their pooled connections."""
+    global _client, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
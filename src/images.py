@@ -0,0 +1,186 @@
+"""Article image cache module for VOCNews.
+
+Each article image is downloaded once and kept in a size-bounded LRU cache on
+disk, keyed by the hash of its URL, so Telegram receives the bytes from us
+instead of fetching the origin CDN for every chat. When the optional Pillow
+package is installed, images too large for a Telegram photo are downscaled
+and re-encoded as JPEG before being cached.
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+from typing import Optional
+import httpclient
+import metrics
+import utils as ut
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+directory = ut.ENV.get("IMAGE_CACHE_DIR", "image_cache")
+max_bytes = int(float(ut.ENV.get("IMAGE_CACHE_MB", "200")) * 1024 * 1024)
+# Telegram photos are limited to 10 MB and 10000 px for width plus height
+photo_max_bytes = int(ut.ENV.get("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+photo_max_side = int(ut.ENV.get("IMAGE_MAX_SIDE", "2560"))
+pillow = importlib.util.find_spec("PIL") is not None
+
+# Fraction of max_bytes freed at once when the cache overflows
+EVICT_RATIO = 0.1
+
+_cache: Optional["ImageCache"] = None
+
+cache_lookups = metrics.counter("vocnews_image_cache_lookups_total", "Image cache lookups by result")
+fetch_seconds = metrics.histogram("vocnews_fetch_seconds", "Duration of site requests, rate limiting excluded")
+
+
+def image_key(url: str) -> str:
+    """Get the cache key of an image URL.
+
+    Args:
+        url (str): Image URL
+
+    Returns:
+        str: Hex SHA-256 digest of the URL
+    """
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """Size-bounded LRU cache of image files, using modification times as recency."""
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def path(self, url: str) -> str:
+        """Get the file path of an image.
+
+        Args:
+            url (str): Image URL
+
+        Returns:
+            str: Path of the cached file
+        """
+        return os.path.join(self.directory, image_key(url))
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Read a cached image and mark it as recently used.
+
+        Args:
+            url (str): Image URL
+
+        Returns:
+            Optional[bytes]: Image bytes or None if not cached
+        """
+        path = self.path(url)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def set(self, url: str, data: bytes) -> None:
+        """Store an image, evicting the least recently used ones when over max_bytes.
+
+        Args:
+            url (str): Image URL
+            data (bytes): Image bytes
+        """
+        path = self.path(url)
+        with self._lock:
+            if os.path.exists(path):
+                self._size -= os.path.getsize(path)
+            # Write then rename so readers never see a partial file
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used images until the cache is back under its bound."""
+        target = self.max_bytes - int(self.max_bytes * EVICT_RATIO)
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.is_file()),
+                         key=lambda entry: entry.stat().st_mtime)
+        removed = 0
+        for entry in entries:
+            if self._size <= target:
+                break
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            self._size -= size
+            removed += 1
+        log.debug(f"Evicted {removed} images, {self._size} bytes left")
+
+
+def get_cache() -> ImageCache:
+    """Get the shared image cache.
+
+    Returns:
+        ImageCache: Cache in IMAGE_CACHE_DIR bounded by IMAGE_CACHE_MB
+    """
+    global _cache
+    if _cache is None:
+        _cache = ImageCache(directory, max_bytes)
+    return _cache
+
+
+def fit_photo(data: bytes) -> bytes:
+    """Downscale and re-encode an image that exceeds Telegram's photo limits.
+
+    Images are returned unchanged when they fit or when Pillow is not installed.
+
+    Args:
+        data (bytes): Image bytes
+
+    Returns:
+        bytes: Image bytes within photo_max_side and photo_max_bytes when possible
+    """
+    if not pillow:
+        return data
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= photo_max_side and len(data) <= photo_max_bytes:
+                return data
+            image.thumbnail((photo_max_side, photo_max_side))
+            output = io.BytesIO()
+            image.convert("RGB").save(output, format="JPEG", quality=85, optimize=True)
+    except Exception as e:
+        log.warning(f"Cannot re-encode image: {e}")
+        return data
+    log.debug(f"Image re-encoded from {len(data)} to {output.tell()} bytes")
+    return output.getvalue()
+
+
+async def aget_image(url: str) -> Optional[bytes]:
+    """Get an image ready to upload to Telegram, downloading it only if not cached.
+
+    Args:
+        url (str): Image URL
+
+    Returns:
+        Optional[bytes]: Image bytes or None if the download fails
+    """
+    cache = get_cache()
+    if (data := await asyncio.to_thread(cache.get, url)) is not None:
+        cache_lookups.inc(result="hit")
+        return data
+    cache_lookups.inc(result="miss")
+    with fetch_seconds.time(kind="image", source="images"):
+        data = await httpclient.aget_bytes(url)
+    if data is None:
+        return None
+    data = await asyncio.to_thread(fit_photo, data)
+    await asyncio.to_thread(cache.set, url, data)
+    return data
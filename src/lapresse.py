@@ -1,14 +1,14 @@
-from typing import Optional, Dict
-import feedparser
+from typing import Optional, Dict, List, Tuple
 import utils as ut
-import requests
-from datetime import datetime
+import httpx
 from logging_conf import logger
-from bs4 import BeautifulSoup
-from lxml.html.clean import Cleaner
+from htmlrules import CLEANER_RULES, Rules
 from lxml import html
-from telegraph import Telegraph
+from article import (TELEGRAPH_RULES, parse_html, inner_html, telegraph_tree, extract_texts,
+                     render_texts, translate_texts, create_telegraph_page)
+from sources import Source, register
 from translate import translate_text
+import httpclient
 import rssutils
 
 log = logger.getChild(__name__)
@@ -16,37 +16,52 @@ log = logger.getChild(__name__)
 # Constants
 NAME = "lapresse"
 RSS_URL = "https://www.lapresse.ca/actualites/rss"
-TELEGRAPH_TOKEN = ut.ENV.get("TELEGRAPH_TOKEN", "")
 DATE_FORMAT = "%a, %d %b %Y %H:%M:%S %z"
 
-telegraph = Telegraph(access_token=TELEGRAPH_TOKEN)
+# Site chrome removed from every La Presse page
+READABILITY_RULES = Rules(
+    remove=['header#mainHeader', 'div.socialShare', 'aside', 'footer', 'noscript'],
+)
 
+# Article decorations that have no place on the Telegraph page
+DECORATION_RULES = Rules(
+    remove=['div.badgeCollection', 'div.author', 'header h1'],
+)
 
-def fetch_rss() -> None:
+SOURCE = register(Source(
+    name=NAME,
+    rss_url=RSS_URL,
+    date_format=DATE_FORMAT,
+    rules=READABILITY_RULES.merge(DECORATION_RULES),
+    image=lambda entry: entry.links[0].href,
+))
+
+readability_rules = CLEANER_RULES.merge(READABILITY_RULES).compile()
+telegraph_rules = DECORATION_RULES.merge(TELEGRAPH_RULES).compile()
+
+
+def parse_rss(data: bytes, response: Optional[httpx.Response] = None) -> Dict:
     """
-    Fetches RSS feed entries from LaPresse and stores them in the rss dictionary.
+    Parses RSS feed data from LaPresse into the rss dictionary.
     Each entry contains title, published date, summary, link and image.
+    Args:
+        data: Raw feed document
+        response: HTTP response the feed came from, used for its encoding and validators
+    Returns:
+        Dict: rss dictionary with name, url, validators and entries
     """
-    rss = {
-        "name": NAME,
-        "url": RSS_URL,
-        "entries": []
-    }
+    return SOURCE.parse_rss(data, response)
 
-    feed = feedparser.parse(RSS_URL)
 
-    for entry in feed.entries:
-        # "Sat, 23 Nov 2024 14:13:45 -0500" to datatime
-        published = datetime.strptime(entry.published, DATE_FORMAT).isoformat()
-
-        rss["entries"].append({
-            "title": entry.title,
-            "published": published,
-            "summary": entry.summary,
-            "link": entry.link,
-            "image": entry.links[0].href
-        })
-    return rss
+def fetch_rss(lastrss: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Fetches RSS feed entries from LaPresse, conditionally on the validators of lastrss.
+    Args:
+        lastrss: Previously fetched rss dictionary, its etag/last_modified make the request conditional
+    Returns:
+        Optional[Dict]: rss dictionary or None if the feed is unchanged since lastrss
+    """
+    return SOURCE.fetch_rss(lastrss)
 
 
 def get_entry_content(entry: Dict) -> Optional[str]:
@@ -65,74 +80,36 @@ def get_entry_content(entry: Dict) -> Optional[str]:
 
 def get_content(url: str) -> Optional[str]:
     """
-    Fetches content from a given URL using requests.
+    Fetches content from a given URL using the shared HTTP client.
     Args:
         url: The URL to fetch content from
     Returns:
         str: The response content or None if request fails
     """
-    try:
-        response = requests.get(url, timeout=10)  # Add timeout
-        log.debug(f"GET {url} {response.status_code}")
-        response.raise_for_status()
-        return response.text
-    except requests.RequestException as e:
-        log.error(f"Failed to fetch content: {e}")
-        return None
+    return httpclient.get_text(url)
 
 
-def get_readability(content: str) -> str:
+def prepare_article(content: str) -> Tuple[List[str], List[str]]:
     """
-    Cleans HTML content by removing unwanted elements and formatting.
+    Turns a raw article page into Telegraph content ready for translation,
+    parsing and serializing it only once.
     Args:
         content: Raw HTML content
     Returns:
-        str: Cleaned HTML content
+        Tuple[List[str], List[str]]: Template parts and texts, see article.extract_texts
+    """
+    return SOURCE.prepare_article(content)
+
+
+def get_readability(content: str) -> str:
     """
-    cleaner = Cleaner(
-        scripts=True,
-        javascript=True,
-        comments=True,
-        style=True,
-        page_structure=False,
-    )
-    doc = html.fromstring(content)
-    cleaned_html = cleaner.clean_html(doc)
-
-    # remove header, footer, aside, socialShare, noscript
-    for header in cleaned_html.xpath('//header[@id="mainHeader"]'):
-        header.getparent().remove(header)
-    for div in cleaned_html.xpath('//div[@class="socialShare"]'):
-        div.getparent().remove(div)
-    for aside in cleaned_html.xpath('//aside'):
-        aside.getparent().remove(aside)
-    for footer in cleaned_html.xpath('//footer'):
-        footer.getparent().remove(footer)
-    for noscript in cleaned_html.xpath('//noscript'):
-        noscript.getparent().remove(noscript)
-
-    content = html.tostring(cleaned_html).decode('utf-8')
-    soup = BeautifulSoup(content, 'lxml')
-    return soup.prettify()
-
-
-def create_telegraph_page(title: str, html_content: str) -> str:
-    """
-    Creates a Telegraph page with the given title and content.
+    Cleans HTML content by removing unwanted elements and formatting.
     Args:
-        title: Page title
-        html_content: HTML content for the page
+        content: Raw HTML content
     Returns:
-        str: URL of the created Telegraph page
+        str: Cleaned HTML content
     """
-    body = prepare_telegraph_content(html_content)
-
-    response = telegraph.create_page(
-        title=title,
-        html_content=body
-    )
-    log.debug(f"telegraph.create_page {response['url']}")
-    return response["url"]
+    return html.tostring(readability_rules.apply(parse_html(content)), encoding='unicode')
 
 
 def prepare_telegraph_content(html_content: str) -> str:
@@ -143,44 +120,7 @@ def prepare_telegraph_content(html_content: str) -> str:
     Returns:
         str: Prepared HTML content
     """
-    soup = BeautifulSoup(html_content, 'lxml')
-
-    #  remove div class="badgeCollection"
-    for div in soup.find_all('div', class_="badgeCollection"):
-        div.decompose()
-    for div in soup.find_all('div', class_="author"):
-        div.decompose()
-
-    # remove <header> <h1></h1> </header>
-    header = soup.find('header')
-    if header:
-        h1 = header.find('h1')
-        if h1:
-            h1.decompose()
-
-    # Define Telegraph allowed tags
-    allowed_tags = {'a', 'aside', 'b', 'blockquote', 'br', 'code', 'em',
-                    'figcaption', 'figure', 'h3', 'h4', 'hr', 'i', 'iframe',
-                    'img', 'li', 'ol', 'p', 'pre', 's', 'strong', 'u', 'ul', 'video', 'body'}
-
-    # Unwrap any tags that aren't allowed by Telegraph
-    for element in soup.find_all():
-        if element.name not in allowed_tags:
-            element.unwrap()
-
-    # replace h1 to h3
-    for h1 in soup.find_all('h1'):
-        h1.name = 'h3'
-
-    # replace h2 to h4
-    for h2 in soup.find_all('h2'):
-        h2.name = 'h4'
-
-    # replace span to b
-    for span in soup.find_all('span'):
-        span.name = 'b'
-
-    return soup.body.decode_contents()
+    return inner_html(telegraph_tree(parse_html(html_content), telegraph_rules))
 
 
 def translate_content(content: str) -> str:
@@ -192,17 +132,8 @@ def translate_content(content: str) -> str:
         str: Translated HTML content
     """
     try:
-        soup = BeautifulSoup(content, 'lxml')
-        for text_node in soup.find_all(string=True):
-            if text := text_node.strip():
-                translated_text = translate_text(
-                    text,
-                    source_lang="French",
-                    target_lang="Simple Chinese"
-                )
-                log.debug(f"Translated: {text} -> {translated_text}")
-                text_node.replace_with(translated_text)
-        return soup.prettify()
+        parts, texts = extract_texts(parse_html(content).body)
+        return render_texts(parts, translate_texts(texts))
     except Exception as e:
         log.error(f"Translation error: {e}")
         return content
@@ -216,11 +147,9 @@ if __name__ == "__main__":
         if entry := rssutils.get_last_entries(rss):
             if content := get_entry_content(entry):
                 ut.dump_file(content, "lapresse.html")
-                text = get_readability(content)
-                ut.dump_file(text, "parsed_lapresse.html")
-                telegraph_content = prepare_telegraph_content(text)
-                ut.dump_file(telegraph_content, "telegraph.html")
-                translated_text = translate_content(telegraph_content)
+                parts, texts = prepare_article(content)
+                ut.dump_file(render_texts(parts, texts), "telegraph.html")
+                translated_text = render_texts(parts, translate_texts(texts))
                 title = translate_text(
                     entry["title"],
                     source_lang="French",
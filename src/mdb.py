@@ -1,17 +1,65 @@
-from pymongo import MongoClient
-from typing import Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, List, Optional, TYPE_CHECKING
 import utils as ut
+import metrics
+import rssutils
 from logging_conf import logger
 
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+    from pymongo.collection import Collection
+    from pymongo.database import Database
+
 log = logger.getChild(__name__)
 
 uri = ut.ENV.get("MDB_CONNECT", "")
-log.debug(f"MongoDB connection URI: {uri}")
-client = MongoClient(uri)
-db = client["vocnews"]
-collection = db["rss"]
+
+op_seconds = metrics.histogram("vocnews_mongo_op_seconds", "Duration of MongoDB operations")
+
+_client: Optional["MongoClient"] = None
+_entries_indexed = False
+_pages_indexed = False
+
+
+def get_client() -> "MongoClient":
+    """
+    Get the shared MongoDB client, connecting on first use.
+
+    Returns:
+        MongoClient: Shared client
+    """
+    global _client
+    if _client is None:
+        from pymongo import MongoClient
+        log.debug(f"MongoDB connection URI: {uri}")
+        _client = MongoClient(uri)
+    return _client
+
+
+def get_db() -> "Database":
+    """
+    Get the vocnews database.
+
+    Returns:
+        Database: vocnews database
+    """
+    return get_client()["vocnews"]
+
+
+def get_collection(name: str = "rss") -> "Collection":
+    """
+    Get a collection of the vocnews database.
+
+    Args:
+        name: Collection name
+
+    Returns:
+        Collection: The collection
+    """
+    return get_db()[name]
 
 
+@metrics.timed(op_seconds, op="get_last_rss")
 def get_last_rss(name: str) -> Dict[str, Any]:
     """
     Get the last RSS feed entry for a given source name.
@@ -23,25 +71,396 @@ def get_last_rss(name: str) -> Dict[str, Any]:
         Dictionary containing the last RSS feed entry
     """
     log.debug(f"Getting last RSS entry for source: {name}")
-    return collection.find_one({"name": name})
+    return get_collection().find_one({"name": name})
 
 
+@metrics.timed(op_seconds, op="save_rss")
 def save_rss(rss: Dict[str, Any]) -> Any:
     """
-    Save the RSS feed data for a given source name.
+    Save the RSS feed state for a given source name.
+    Entries are stored one by one with save_entries, the rss document only
+    keeps the feed's URL and HTTP validators.
 
     Args:
-        name: Name of the RSS feed source
         rss: Dictionary containing the RSS feed data
 
     Returns:
-        InsertOneResult object containing the inserted_id
+        UpdateResult of the replacement
     """
     name = rss["name"]
     log.debug(f"Saving RSS feed for source: {name}")
 
-    return collection.replace_one(
+    return get_collection().replace_one(
         {"name": name},  # search criteria
-        rss,  # replacement document
+        {k: v for k, v in rss.items() if k != "entries"},  # replacement document
         upsert=True  # if document not found, insert it
     )
+
+
+def get_entries_collection() -> "Collection":
+    """
+    Get the per-entry collection, creating its unique key index on first use.
+
+    Returns:
+        Collection: entries collection
+    """
+    global _entries_indexed
+    collection = get_collection("entries")
+    if not _entries_indexed:
+        collection.create_index("key", unique=True)
+        collection.create_index([("source", 1), ("state", 1)])
+        collection.create_index([("state", 1), ("lease_until", 1)])
+        _entries_indexed = True
+    return collection
+
+
+@metrics.timed(op_seconds, op="get_known_hashes")
+def get_known_hashes(entries: Iterable[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Get the stored content hash of the entries already seen.
+
+    Args:
+        entries: RSS entries
+
+    Returns:
+        Dict[str, str]: Content hash by entry key, for the stored entries only
+    """
+    keys = list({rssutils.entry_key(entry) for entry in entries})
+    if not keys:
+        return {}
+    cursor = get_entries_collection().find({"key": {"$in": keys}}, {"_id": 0, "key": 1, "hash": 1})
+    return {doc["key"]: doc["hash"] for doc in cursor}
+
+
+@metrics.timed(op_seconds, op="save_entries")
+def save_entries(entries: List[Dict[str, Any]]) -> Any:
+    """
+    Upsert RSS entries by key in a single bulk write.
+
+    Args:
+        entries: RSS entries
+
+    Returns:
+        BulkWriteResult, or None if there is nothing to save
+    """
+    from pymongo import UpdateOne
+    if not entries:
+        return None
+    now = datetime.now(timezone.utc)
+    operations = {}
+    for entry in entries:
+        key = rssutils.entry_key(entry)
+        operations[key] = UpdateOne(
+            {"key": key},
+            {
+                "$set": {**entry, "key": key, "hash": rssutils.entry_hash(entry), "seen": now},
+                "$setOnInsert": {"first_seen": now},
+            },
+            upsert=True
+        )
+    log.debug(f"Saving {len(operations)} entries")
+    return get_entries_collection().bulk_write(list(operations.values()), ordered=False)
+
+
+@metrics.timed(op_seconds, op="start_entries")
+def start_entries(entries: List[Dict[str, Any]], restart: bool = False) -> Any:
+    """
+    Queue saved entries for processing by giving them the "new" state.
+    Entries that already have a processing state keep it unless restart is set.
+
+    Args:
+        entries: RSS entries, already saved with save_entries
+        restart: Process the entries again from the start
+
+    Returns:
+        UpdateResult, or None if there is nothing to start
+    """
+    keys = [rssutils.entry_key(entry) for entry in entries]
+    if not keys:
+        return None
+    query: Dict[str, Any] = {"key": {"$in": keys}}
+    if not restart:
+        query["state"] = {"$exists": False}
+    return get_entries_collection().update_many(
+        query,
+        {"$set": {"state": "new", "attempts": 0, "sent_chats": []}, "$unset": {"artifacts": ""}}
+    )
+
+
+@metrics.timed(op_seconds, op="restart_updated")
+def restart_updated(entries: List[Dict[str, Any]]) -> int:
+    """
+    Queue sent entries whose feed entry changed, so their page is updated.
+    The page path is kept so the page is edited in place, and the texts and
+    translations become the "previous" artifact, so only the changed paragraphs
+    are translated again. The sent artifacts and attempts are kept as
+    "sent_version" until the update is sent, so revert_update can restore them.
+    Entries sent without their texts and translations stored are left alone.
+
+    Args:
+        entries: Updated RSS entries, already saved with save_entries
+
+    Returns:
+        int: Number of restarted entries
+    """
+    keys = [rssutils.entry_key(entry) for entry in entries]
+    if not keys:
+        return 0
+    collection = get_entries_collection()
+    query = {"key": {"$in": keys}, "state": "sent",
+             "artifacts.texts": {"$exists": True}, "artifacts.translated_texts": {"$exists": True}}
+    restarted = 0
+    for doc in collection.find(query, {"_id": 0, "key": 1, "artifacts": 1, "attempts": 1}):
+        artifacts = doc["artifacts"]
+        original = artifacts.get("original") or {}
+        previous = {
+            "texts": artifacts["texts"],
+            "translated_texts": artifacts["translated_texts"],
+            "title": original.get("title"),
+            "summary": original.get("summary"),
+            "translated_title": artifacts.get("title"),
+            "translated_summary": artifacts.get("summary"),
+        }
+        result = collection.update_one(
+            {"key": doc["key"], "state": "sent"},
+            {"$set": {"state": "new", "attempts": 0, "updated": datetime.now(timezone.utc), "artifacts": {
+                "url": artifacts.get("url"), "path": artifacts.get("path"), "previous": previous},
+                "sent_version": {"artifacts": artifacts, "attempts": doc.get("attempts", 0)}}}
+        )
+        restarted += result.modified_count
+    return restarted
+
+
+@metrics.timed(op_seconds, op="revert_update")
+def revert_update(key: str, max_attempts: int) -> bool:
+    """
+    Give up the update of a sent entry that failed max_attempts times, restoring
+    the state, artifacts and attempts it was sent with, so it stays sent and is
+    updated again on its next change.
+
+    Args:
+        key: Entry key
+        max_attempts: Entries that failed this many times are given up
+
+    Returns:
+        bool: Whether the entry was an update given up and reverted
+    """
+    collection = get_entries_collection()
+    doc = collection.find_one(
+        {"key": key, "attempts": {"$gte": max_attempts}, "sent_version": {"$exists": True}},
+        {"_id": 0, "sent_version": 1}
+    )
+    if doc is None:
+        return False
+    sent = doc["sent_version"]
+    result = collection.update_one(
+        {"key": key, "sent_version": {"$exists": True}},
+        {"$set": {"state": "sent", "artifacts": sent["artifacts"], "attempts": sent["attempts"],
+                  "updated": datetime.now(timezone.utc)},
+         "$unset": {"sent_version": ""}}
+    )
+    return result.modified_count > 0
+
+
+def unleased(now: datetime) -> Dict[str, Any]:
+    """
+    Build the filter of entries no worker holds a live lease on.
+
+    Args:
+        now: Current time
+
+    Returns:
+        Dict[str, Any]: Query matching never leased, released and expired entries
+    """
+    return {"$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]}
+
+
+@metrics.timed(op_seconds, op="claim_entry")
+def claim_entry(worker: str, states: List[str], max_attempts: int, lease_seconds: float,
+                sources: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Atomically lease the oldest unfinished entry no other worker holds.
+    Expired leases of crashed or stalled workers are reclaimed the same way.
+
+    Args:
+        worker: ID of the claiming worker
+        states: Processing states of unfinished entries
+        max_attempts: Entries that failed this many times are given up
+        lease_seconds: Seconds the entry stays reserved without a renew_lease
+        sources: Only claim entries of these sources, any source if None
+
+    Returns:
+        Optional[Dict[str, Any]]: Claimed entry document, None if the queue is empty
+    """
+    from pymongo import ReturnDocument
+    now = datetime.now(timezone.utc)
+    query: Dict[str, Any] = {"state": {"$in": states}, "attempts": {"$lt": max_attempts}, **unleased(now)}
+    if sources is not None:
+        query["source"] = {"$in": sources}
+    return get_entries_collection().find_one_and_update(
+        query,
+        {"$set": {"lease_owner": worker, "lease_until": now + timedelta(seconds=lease_seconds)}},
+        projection={"_id": 0},
+        sort=[("published", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+@metrics.timed(op_seconds, op="renew_lease")
+def renew_lease(key: str, worker: str, lease_seconds: float) -> bool:
+    """
+    Extend the lease of a worker on an entry, as a heartbeat.
+
+    Args:
+        key: Entry key
+        worker: ID of the worker holding the lease
+        lease_seconds: Seconds from now the lease lasts
+
+    Returns:
+        bool: False if the worker lost the lease, e.g. after it expired and was reclaimed
+    """
+    until = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+    result = get_entries_collection().update_one(
+        {"key": key, "lease_owner": worker},
+        {"$set": {"lease_until": until}}
+    )
+    return result.matched_count > 0
+
+
+@metrics.timed(op_seconds, op="release_entry")
+def release_entry(key: str, worker: str) -> Any:
+    """
+    Give up the lease of a worker on an entry, once processed or abandoned.
+
+    Args:
+        key: Entry key
+        worker: ID of the worker holding the lease
+
+    Returns:
+        UpdateResult of the update
+    """
+    return get_entries_collection().update_one(
+        {"key": key, "lease_owner": worker},
+        {"$unset": {"lease_owner": "", "lease_until": ""}}
+    )
+
+
+@metrics.timed(op_seconds, op="save_progress")
+def save_progress(key: str, state: str, artifacts: Dict[str, Any]) -> Any:
+    """
+    Record that an entry completed a processing stage, with the stage's artifacts.
+
+    Args:
+        key: Entry key
+        state: Processing state reached
+        artifacts: Stage outputs needed by the following stages
+
+    Returns:
+        UpdateResult of the update
+    """
+    update = {f"artifacts.{name}": value for name, value in artifacts.items()}
+    return get_entries_collection().update_one(
+        {"key": key},
+        {"$set": {**update, "state": state, "updated": datetime.now(timezone.utc)}}
+    )
+
+
+@metrics.timed(op_seconds, op="record_failure")
+def record_failure(key: str, error: str) -> Any:
+    """
+    Count a failed processing attempt of an entry.
+
+    Args:
+        key: Entry key
+        error: Error description
+
+    Returns:
+        UpdateResult of the update
+    """
+    return get_entries_collection().update_one(
+        {"key": key},
+        {"$inc": {"attempts": 1}, "$set": {"error": error, "updated": datetime.now(timezone.utc)}}
+    )
+
+
+@metrics.timed(op_seconds, op="add_sent_chat")
+def add_sent_chat(key: str, chat_id: str) -> Any:
+    """
+    Record that an entry was sent to a chat.
+
+    Args:
+        key: Entry key
+        chat_id: Telegram chat ID
+
+    Returns:
+        UpdateResult of the update
+    """
+    return get_entries_collection().update_one({"key": key}, {"$addToSet": {"sent_chats": chat_id}})
+
+
+@metrics.timed(op_seconds, op="finish_entry")
+def finish_entry(key: str, state: str, drop: Iterable[str] = ()) -> Any:
+    """
+    Record the final processing state of an entry and drop artifacts no longer needed,
+    along with the version an update replaced.
+
+    Args:
+        key: Entry key
+        state: Final processing state
+        drop: Names of the artifacts to remove
+
+    Returns:
+        UpdateResult of the update
+    """
+    update: Dict[str, Any] = {"$set": {"state": state, "updated": datetime.now(timezone.utc)},
+                              "$unset": {"sent_version": ""}}
+    update["$unset"].update({f"artifacts.{name}": "" for name in drop})
+    return get_entries_collection().update_one({"key": key}, update)
+
+
+def get_pages_collection() -> "Collection":
+    """
+    Get the Telegraph page collection, creating its unique hash index on first use.
+
+    Returns:
+        Collection: pages collection
+    """
+    global _pages_indexed
+    collection = get_collection("pages")
+    if not _pages_indexed:
+        collection.create_index("hash", unique=True)
+        _pages_indexed = True
+    return collection
+
+
+@metrics.timed(op_seconds, op="get_page")
+def get_page(content_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the Telegraph page published with a given title and content.
+
+    Args:
+        content_hash: Hash of the page title and content
+
+    Returns:
+        Optional[Dict[str, Any]]: Page with its url and path, None if never published
+    """
+    return get_pages_collection().find_one({"hash": content_hash}, {"_id": 0})
+
+
+@metrics.timed(op_seconds, op="save_page")
+def save_page(content_hash: str, page: Dict[str, str]) -> Any:
+    """
+    Remember the Telegraph page published with a given title and content.
+
+    Args:
+        content_hash: Hash of the page title and content
+        page: url and path of the page
+
+    Returns:
+        UpdateResult of the upsert
+    """
+    return get_pages_collection().update_one(
+        {"hash": content_hash},
+        {"$set": {"url": page["url"], "path": page["path"], "updated": datetime.now(timezone.utc)}},
+        upsert=True
+    )
@@ -0,0 +1,327 @@
+"""Metrics module for VOCNews.
+
+Records latency histograms and counters for every step of the pipeline, such as
+feed and article fetches, readability, model calls and their tokens, Telegraph
+and Telegram requests and MongoDB operations, so a slow run can be traced to
+the service responsible for it.
+
+Metrics are exported as Prometheus text on http://127.0.0.1:METRICS_PORT/metrics
+when METRICS_PORT is set, and written as JSON to METRICS_FILE after each run
+when it is set.
+"""
+
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import utils as ut
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+# Local port of the Prometheus endpoint, disabled when 0
+metrics_port = int(ut.ENV.get("METRICS_PORT", "0"))
+# JSON file the metrics are written to after each run, disabled when empty
+metrics_file = ut.ENV.get("METRICS_FILE", "")
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict[str, Any]) -> Labels:
+    """Turn label keyword arguments into a hashable, sorted key."""
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Format labels in the Prometheus text format, e.g. {stage="fetch"}."""
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter, one value per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        """Increase the counter of a label set.
+
+        Args:
+            amount (float, optional): Increment. Defaults to 1.
+            **labels: Label values
+        """
+        key = label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        """Get the counter of a label set, 0 if never increased."""
+        return self._values.get(label_key(labels), 0)
+
+    def lines(self) -> List[str]:
+        """Render the samples in the Prometheus text format."""
+        with self._lock:
+            return [f"{self.name}{format_labels(key)} {value:g}" for key, value in sorted(self._values.items())]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Get the samples as JSON-serializable dicts."""
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in sorted(self._values.items())]
+
+    def reset(self) -> None:
+        """Forget every sample."""
+        with self._lock:
+            self._values.clear()
+
+    def state(self) -> Dict[Labels, float]:
+        """Get a picklable copy of the samples, for merge."""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, state: Dict[Labels, float]) -> None:
+        """Add the samples of another counter of the same name, e.g. from a worker process."""
+        with self._lock:
+            for key, value in state.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, one per label set."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (the last one is +Inf), sum and count
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        """Record a value.
+
+        Args:
+            value (float): Observed value, usually seconds
+            **labels: Label values
+        """
+        key = label_key(labels)
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0, 0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the block in seconds, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: Any) -> int:
+        """Get the number of observations of a label set."""
+        return int(self._values[key][1][1]) if (key := label_key(labels)) in self._values else 0
+
+    def total(self, **labels: Any) -> float:
+        """Get the sum of the observations of a label set."""
+        return self._values[key][1][0] if (key := label_key(labels)) in self._values else 0.0
+
+    def lines(self) -> List[str]:
+        """Render the samples in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            for key, (counts, (total, count)) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{format_labels(key, ('le', le))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {total:g}")
+                lines.append(f"{self.name}_count{format_labels(key)} {count:g}")
+        return lines
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Get the samples as JSON-serializable dicts, without buckets."""
+        with self._lock:
+            return [{"labels": dict(key), "count": int(count), "sum": total, "mean": total / count if count else 0.0}
+                    for key, (_, (total, count)) in sorted(self._values.items())]
+
+    def reset(self) -> None:
+        """Forget every sample."""
+        with self._lock:
+            self._values.clear()
+
+    def state(self) -> Dict[Labels, Tuple[List[int], List[float]]]:
+        """Get a picklable copy of the samples, for merge."""
+        with self._lock:
+            return {key: (list(counts), list(totals)) for key, (counts, totals) in self._values.items()}
+
+    def merge(self, state: Dict[Labels, Tuple[List[int], List[float]]]) -> None:
+        """Add the samples of another histogram with the same buckets, e.g. from a worker process."""
+        with self._lock:
+            for key, (counts, totals) in state.items():
+                own_counts, own_totals = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0, 0]))
+                for i, count in enumerate(counts):
+                    own_counts[i] += count
+                own_totals[0] += totals[0]
+                own_totals[1] += totals[1]
+
+
+class Registry:
+    """Named metrics, created on first use."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls: type, name: str, help: str, **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric.kind}")
+            elif help and not metric.help:
+                metric.help = help
+            return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        """Get or create a counter."""
+        return self._get(Counter, name, help)
+
+    def histogram(self, name: str, help: str = "", buckets: Sequence[float] = BUCKETS) -> Histogram:
+        """Get or create a histogram."""
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.lines())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get every metric as a JSON-serializable dict."""
+        return {metric.name: {"type": metric.kind, "help": metric.help, "samples": metric.snapshot()}
+                for metric in list(self._metrics.values())}
+
+    def reset(self) -> None:
+        """Forget the samples of every metric, keeping the metrics."""
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def state(self) -> Dict[str, Tuple[str, str, Any]]:
+        """Get a picklable copy of every metric's samples, for merge."""
+        return {metric.name: (metric.kind, metric.help, metric.state()) for metric in list(self._metrics.values())}
+
+    def merge(self, state: Dict[str, Tuple[str, str, Any]]) -> None:
+        """Add the samples of another registry, e.g. one of a worker process.
+
+        Args:
+            state: Return value of the other registry's state()
+        """
+        for name, (kind, help, samples) in state.items():
+            metric = self.counter(name, help) if kind == Counter.kind else self.histogram(name, help)
+            metric.merge(samples)
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str = "") -> Counter:
+    """Get or create a counter of the shared registry."""
+    return REGISTRY.counter(name, help)
+
+
+def histogram(name: str, help: str = "", buckets: Sequence[float] = BUCKETS) -> Histogram:
+    """Get or create a histogram of the shared registry."""
+    return REGISTRY.histogram(name, help, buckets)
+
+
+def timed(metric: Histogram, **labels: Any) -> Callable[[Callable], Callable]:
+    """Decorate a function or coroutine function to observe its duration.
+
+    Args:
+        metric (Histogram): Histogram receiving the durations in seconds
+        **labels: Label values of the observations
+
+    Returns:
+        Callable: Decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with metric.time(**labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with metric.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the shared registry in the Prometheus text format on /metrics."""
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the Prometheus endpoint from a background thread.
+
+    Args:
+        port (int): Port, 0 for any free port
+        host (str, optional): Interface. Defaults to "127.0.0.1".
+
+    Returns:
+        ThreadingHTTPServer: Running server, call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def dump(file: str) -> None:
+    """Write every metric as JSON.
+
+    Args:
+        file (str): Output file path
+    """
+    ut.dump_json({"time": time.time(), "metrics": REGISTRY.snapshot()}, file)
@@ -0,0 +1,105 @@
+"""Concurrent staged pipeline module for VOCNews.
+
+Items flow through a list of async stages connected by bounded queues, every
+stage running its own pool of workers so slow work on one item overlaps the
+other stages of the next ones. The final sink receives results strictly in
+input order, whatever order the stages finish them in.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+import metrics
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+stage_seconds = metrics.histogram("vocnews_stage_seconds", "Duration of pipeline stages per item")
+stage_failures = metrics.counter("vocnews_stage_failures_total", "Items dropped by a failing pipeline stage")
+
+# Marks an item that failed in an earlier stage so later stages skip it
+FAILED = object()
+
+
+@dataclass
+class Stage:
+    """A pipeline stage.
+
+    Attributes:
+        name: Stage name used in logs
+        func: Coroutine function transforming the output of the previous stage
+        workers: Number of items this stage processes concurrently
+    """
+    name: str
+    func: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+
+
+async def run_pipeline(
+    items: Sequence[Any],
+    stages: List[Stage],
+    sink: Callable[[Any], Awaitable[Any]],
+    queue_size: int = 1,
+) -> List[Optional[Any]]:
+    """Run items through stages concurrently and deliver them to sink in order.
+
+    An exception in a stage or in the sink is logged and only drops that item.
+
+    Args:
+        items: Items to process
+        stages: Stages applied one after another
+        sink: Coroutine function called with each final result, in input order
+        queue_size: Capacity of the queues between stages
+
+    Returns:
+        List[Optional[Any]]: Return values of sink in input order, None for dropped items
+    """
+    queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+    results: List[Optional[Any]] = [None] * len(items)
+
+    async def feed() -> None:
+        for index, item in enumerate(items):
+            await queues[0].put((index, item))
+
+    async def work(stage: Stage, inbox: asyncio.Queue, outbox: asyncio.Queue) -> None:
+        while True:
+            index, value = await inbox.get()
+            if value is not FAILED:
+                start = time.perf_counter()
+                try:
+                    value = await stage.func(value)
+                except Exception as e:
+                    log.error(f"Stage {stage.name} failed for item {index}: {e}")
+                    stage_failures.inc(stage=stage.name)
+                    value = FAILED
+                stage_seconds.observe(time.perf_counter() - start, stage=stage.name)
+            await outbox.put((index, value))
+
+    async def deliver(inbox: asyncio.Queue) -> None:
+        pending = {}
+        next_index = 0
+        while next_index < len(items):
+            index, value = await inbox.get()
+            pending[index] = value
+            while next_index in pending:
+                value = pending.pop(next_index)
+                if value is not FAILED:
+                    try:
+                        results[next_index] = await sink(value)
+                    except Exception as e:
+                        log.error(f"Sink failed for item {next_index}: {e}")
+                next_index += 1
+
+    workers = [
+        asyncio.create_task(work(stage, queues[i], queues[i + 1]))
+        for i, stage in enumerate(stages)
+        for _ in range(max(1, stage.workers))
+    ]
+    try:
+        await asyncio.gather(feed(), deliver(queues[-1]))
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return results
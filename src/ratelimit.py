@@ -0,0 +1,20 @@
+"""Rate limiting module for VOCNews."""
+
+import asyncio
+import time
+
+
+class RateLimiter:
+    """Spaces out requests by at least interval seconds."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        """Wait until the next request is allowed."""
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
@@ -1,4 +1,12 @@
-from typing import Optional, Dict
+import hashlib
+from typing import Optional, Dict, Iterable, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track the reader and never identify an article
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "cmp", "xtor"})
+
+# Entry fields whose change makes an already seen entry an update
+HASHED_FIELDS = ("title", "summary", "published", "image")
 
 
 def get_last_entries(rss) -> Optional[Dict]:
@@ -34,3 +42,79 @@ def get_new_entries(newrss, lastrss) -> Optional[Dict]:
     new_entries = [entry for entry in newrss["entries"]
                    if entry["published"] > last_entry["published"]]
     return new_entries if new_entries else None
+
+
+def normalize_link(url: str) -> str:
+    """
+    Normalizes an article URL so the same article always gets the same key.
+    Lowercases the scheme and host, drops default ports, the fragment, tracking
+    parameters (utm_* and TRACKING_PARAMS) and the trailing slash, and sorts the
+    remaining query parameters.
+
+    Args:
+        url: Article URL
+    Returns:
+        str: Normalized URL
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS)
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def entry_key(entry: Dict) -> str:
+    """
+    Returns the unique key of an entry: its source and its GUID, or its
+    normalized link when the feed has no GUID.
+
+    Args:
+        entry: RSS entry
+    Returns:
+        str: Entry key
+    """
+    guid = entry.get("guid") or entry["link"]
+    if guid.startswith(("http://", "https://")):
+        guid = normalize_link(guid)
+    return f"{entry.get('source', '')}:{guid}"
+
+
+def entry_hash(entry: Dict) -> str:
+    """
+    Returns a hash of the content of an entry, used to detect updated entries.
+
+    Args:
+        entry: RSS entry
+    Returns:
+        str: Hex SHA-256 digest of HASHED_FIELDS
+    """
+    parts = [str(entry.get(name) or "") for name in HASHED_FIELDS]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def diff_entries(entries: Iterable[Dict], known: Dict[str, str]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Splits feed entries into new and updated ones against the known entry hashes.
+    Entries repeated within the feed are only returned once.
+
+    Args:
+        entries: RSS entries
+        known: Content hash of every already seen entry, by entry key
+    Returns:
+        Tuple[List[Dict], List[Dict]]: New entries and updated entries, in feed order
+    """
+    new, updated, seen = [], [], set()
+    for entry in entries:
+        key = entry_key(entry)
+        if key in seen:
+            continue
+        seen.add(key)
+        if key not in known:
+            new.append(entry)
+        elif known[key] != entry_hash(entry):
+            updated.append(entry)
+    return new, updated
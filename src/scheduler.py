@@ -0,0 +1,155 @@
+"""Polling scheduler module for VOCNews.
+
+Runs a poll function for every source forever in a long-lived process, so
+clients and connections stay warm between polls. Each source has its own
+adaptive interval: it drops to the minimum as soon as a poll finds new
+entries, grows by a backoff factor after every quiet poll or error, is
+stretched during the configured night hours, and gets random jitter so
+sources never poll in lockstep.
+"""
+
+import asyncio
+import random
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+import utils as ut
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+
+def parse_hours(hours: str) -> Optional[Tuple[int, int]]:
+    """Parse a "start-end" hour range such as "0-6".
+
+    Args:
+        hours (str): Hour range, empty to disable
+
+    Returns:
+        Optional[Tuple[int, int]]: Start and end hours, None if disabled
+    """
+    if not hours:
+        return None
+    start, end = hours.split("-")
+    return int(start) % 24, int(end) % 24
+
+
+@dataclass
+class Schedule:
+    """Adaptive polling schedule settings.
+
+    Attributes:
+        min_interval: Seconds between polls while a feed is active
+        max_interval: Upper bound of the interval after quiet polls
+        backoff: Factor applied to the interval after a quiet poll or an error
+        jitter: Random spread applied to every interval, as a fraction of it
+        night_hours: Local hours (start, end) during which intervals are stretched
+        night_factor: Stretch factor applied during night hours
+        timezone: Time zone of night_hours
+    """
+    min_interval: float = 120.0
+    max_interval: float = 1800.0
+    backoff: float = 1.5
+    jitter: float = 0.1
+    night_hours: Optional[Tuple[int, int]] = (0, 6)
+    night_factor: float = 3.0
+    timezone: str = "America/Toronto"
+
+    @classmethod
+    def from_env(cls) -> "Schedule":
+        """Build the schedule from POLL_* environment variables.
+
+        Returns:
+            Schedule: Configured schedule
+        """
+        return cls(
+            min_interval=float(ut.ENV.get("POLL_INTERVAL", "120")),
+            max_interval=float(ut.ENV.get("POLL_MAX_INTERVAL", "1800")),
+            backoff=float(ut.ENV.get("POLL_BACKOFF", "1.5")),
+            jitter=float(ut.ENV.get("POLL_JITTER", "0.1")),
+            night_hours=parse_hours(ut.ENV.get("POLL_NIGHT_HOURS", "0-6")),
+            night_factor=float(ut.ENV.get("POLL_NIGHT_FACTOR", "3")),
+            timezone=ut.ENV.get("POLL_TIMEZONE", "America/Toronto"),
+        )
+
+    def is_night(self, now: datetime) -> bool:
+        """Check whether a time falls within the night hours.
+
+        Args:
+            now (datetime): Time to check, aware or naive local time
+
+        Returns:
+            bool: True during night hours
+        """
+        if not self.night_hours:
+            return False
+        hour = now.astimezone(ZoneInfo(self.timezone)).hour
+        start, end = self.night_hours
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def next_interval(self, current: float, found: int) -> float:
+        """Compute the base interval after a poll, without jitter or night stretch.
+
+        Args:
+            current (float): Base interval used before this poll
+            found (int): Number of new entries found, negative on error
+
+        Returns:
+            float: Next base interval
+        """
+        if found > 0:
+            return self.min_interval
+        return min(max(current, self.min_interval) * self.backoff, self.max_interval)
+
+    def delay(self, interval: float, now: Optional[datetime] = None) -> float:
+        """Turn a base interval into the actual sleep, with night stretch and jitter.
+
+        Args:
+            interval (float): Base interval
+            now (datetime, optional): Current time. Defaults to now.
+
+        Returns:
+            float: Seconds to sleep
+        """
+        if self.is_night(now or datetime.now().astimezone()):
+            interval *= self.night_factor
+        return max(0.0, interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+async def poll_forever(name: str, poll: Callable[[], Awaitable[int]], schedule: Schedule,
+                       stop: asyncio.Event) -> None:
+    """Call poll on an adaptive schedule until stop is set.
+
+    Args:
+        name (str): Name used in logs
+        poll: Coroutine function returning the number of new entries found
+        schedule (Schedule): Schedule settings
+        stop (asyncio.Event): Set to stop polling
+    """
+    interval = schedule.min_interval
+    while not stop.is_set():
+        try:
+            found = await poll()
+        except Exception as e:
+            log.error(f"Poll of {name} failed: {e}")
+            found = -1
+        interval = schedule.next_interval(interval, found)
+        delay = schedule.delay(interval)
+        log.info(f"Next poll of {name} in {delay:.0f}s")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_forever(polls: List[Tuple[str, Callable[[], Awaitable[int]]]], schedule: Schedule,
+                      stop: asyncio.Event) -> None:
+    """Poll every source concurrently on its own schedule until stop is set.
+
+    Args:
+        polls: (name, poll) pairs, see poll_forever
+        schedule (Schedule): Schedule settings shared by all sources
+        stop (asyncio.Event): Set to stop polling
+    """
+    await asyncio.gather(*(poll_forever(name, poll, schedule, stop) for name, poll in polls))
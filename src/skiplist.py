@@ -0,0 +1,139 @@
+"""Pre-translation skip list module for VOCNews.
+
+Many text nodes of an article need no model at all: numbers, dates and times,
+URLs, punctuation, photo credits made of proper nouns, and fixed phrases such
+as "Lisez aussi". classify answers them with deterministic rules, either
+keeping the text as is or translating it from a glossary, so only real prose
+costs a round trip to the model.
+
+The built-in glossary can be extended with TRANSLATE_GLOSSARY, the path of a
+JSON file mapping target languages to {phrase: translation} objects.
+"""
+
+import json
+import re
+from typing import Dict, List, Optional
+import utils as ut
+from logging_conf import logger
+
+log = logger.getChild(__name__)
+
+glossary_path = ut.ENV.get("TRANSLATE_GLOSSARY", "")
+
+# Fixed phrases of French news pages, by target language
+GLOSSARY: Dict[str, Dict[str, str]] = {
+    "Simple Chinese": {
+        "lisez aussi": "另请阅读",
+        "lire aussi": "另请阅读",
+        "à lire aussi": "另请阅读",
+        "en vidéo": "视频",
+        "en photos": "图集",
+        "en images": "图集",
+        "publicité": "广告",
+        "mis à jour": "更新",
+        "publié": "发布",
+        "avec la presse canadienne": "综合加通社报道",
+        "la presse canadienne": "加通社",
+        "agence france-presse": "法新社",
+    },
+}
+
+FRENCH_MONTHS = {
+    "janvier": 1, "février": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6, "juillet": 7,
+    "août": 8, "septembre": 9, "octobre": 10, "novembre": 11, "décembre": 12,
+}
+
+punctuation_re = re.compile(r"^[\W_]+$")
+numeric_re = re.compile(r"^[-+−–—(]?[$€£]?\s?\d[\d\s.,:/×x%$€£()+\-−–—]*$")
+url_re = re.compile(r"^(?:https?://|www\.)\S+$|^[\w.+-]+@[\w-]+(?:\.[\w-]+)+$", re.IGNORECASE)
+# "PHOTO ARCHIVES LA PRESSE", "PHOTO ROBERT SKINNER, LA PRESSE", "ILLUSTRATION : LA PRESSE"
+credit_re = re.compile(r"^(?:PHOTOS?|ILLUSTRATION|IMAGE|CAPTURE D['’]ÉCRAN|VIDÉO|INFOGRAPHIE)\b[^a-zà-ÿ]*$")
+french_date_re = re.compile(
+    r"^(?:(?:lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche)\s+)?(\d{1,2})(?:er)?\s+("
+    + "|".join(FRENCH_MONTHS) + r")\s+(\d{4})$", re.IGNORECASE)
+french_time_re = re.compile(r"^(\d{1,2})\s?h\s?(\d{2})?$")
+
+_glossary: Optional[Dict[str, Dict[str, str]]] = None
+
+
+def normalize_phrase(text: str) -> str:
+    """Normalize a phrase for glossary lookups.
+
+    Args:
+        text (str): Phrase
+
+    Returns:
+        str: Lowercased phrase with collapsed whitespace and no trailing punctuation
+    """
+    return " ".join(text.lower().split()).rstrip(" :.!?…")
+
+
+def get_glossary() -> Dict[str, Dict[str, str]]:
+    """Get the built-in glossary merged with the one in TRANSLATE_GLOSSARY.
+
+    Returns:
+        Dict[str, Dict[str, str]]: Translations by target language and normalized phrase
+    """
+    global _glossary
+    if _glossary is None:
+        _glossary = {lang: dict(phrases) for lang, phrases in GLOSSARY.items()}
+        if glossary_path:
+            try:
+                for lang, phrases in ut.load_json(glossary_path).items():
+                    _glossary.setdefault(lang, {}).update(
+                        {normalize_phrase(phrase): translation for phrase, translation in phrases.items()})
+            except (IOError, json.JSONDecodeError, AttributeError) as e:
+                log.error(f"Ignoring glossary {glossary_path}: {e}")
+    return _glossary
+
+
+def is_chinese(lang: str) -> bool:
+    """Check whether a target language is a Chinese variant."""
+    return "chinese" in lang.lower()
+
+
+def classify(text: str, source_lang: Optional[str] = None, target_lang: str = "English") -> Optional[str]:
+    """Translate a text by rule when it needs no model.
+
+    Args:
+        text (str): Text to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        Optional[str]: Rule translation, often the text itself, or None if the
+            text must go to the model
+    """
+    stripped = text.strip()
+    if not stripped or punctuation_re.match(stripped) or url_re.match(stripped) or credit_re.match(stripped):
+        return text
+    if phrase := get_glossary().get(target_lang, {}).get(normalize_phrase(stripped)):
+        return phrase
+    if is_chinese(target_lang) and source_lang in (None, "auto", "French"):
+        if match := french_date_re.match(stripped):
+            day, month, year = match.groups()
+            return f"{year}年{FRENCH_MONTHS[month.lower()]}月{int(day)}日"
+        if match := french_time_re.match(stripped):
+            hour, minute = match.groups()
+            return f"{int(hour)}:{minute or '00'}"
+    if numeric_re.match(stripped):
+        return text
+    return None
+
+
+def classify_texts(texts: List[str], source_lang: Optional[str] = None,
+                   target_lang: str = "English") -> List[Optional[str]]:
+    """Translate by rule the texts that need no model.
+
+    Args:
+        texts (List[str]): Texts to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        List[Optional[str]]: Rule translations, None for the texts that need the model
+    """
+    results = [classify(text, source_lang, target_lang) for text in texts]
+    if skipped := sum(result is not None for result in results):
+        log.debug(f"Skipped the model for {skipped} of {len(texts)} texts")
+    return results
@@ -0,0 +1,310 @@
+"""News source registry module for VOCNews.
+
+Every news site is described by a Source: its feed URL, date format, language
+and HTML cleanup rules. Source modules (such as lapresse)
+register their Source when imported; load_sources imports the ones enabled by
+the SOURCES environment variable. Fetching, parsing and article preparation
+are implemented once here and driven by each source's settings, and every
+source has its own rate limiter so polling many sites never hammers one.
+"""
+
+import asyncio
+import importlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import feedparser
+import httpx
+from lxml import etree
+import cpupool
+import feedstream
+import httpclient
+import metrics
+from ratelimit import RateLimiter
+import utils as ut
+from logging_conf import logger
+from article import TELEGRAPH_RULES, Node, prepare_article, prepare_nodes
+from htmlrules import CLEANER_RULES, CompiledRules, Rules
+
+log = logger.getChild(__name__)
+
+# Comma separated names of the source modules to poll
+enabled = ut.ENV.get("SOURCES", "lapresse")
+# Stream feeds and stop reading at the entries already stored. Opt-in: the changed or
+# back-dated entries after the first unchanged batch are not read
+streaming = ut.ENV.get("RSS_STREAMING", "false") == "true"
+
+registry: Dict[str, "Source"] = {}
+
+fetch_seconds = metrics.histogram("vocnews_fetch_seconds", "Duration of site requests, rate limiting excluded")
+
+
+def find_image(entry: Any) -> Optional[str]:
+    """
+    Finds the illustration of a feed entry in its enclosures or media tags.
+    Args:
+        entry: feedparser entry
+    Returns:
+        Optional[str]: Image URL or None
+    """
+    for link in entry.get("links", []):
+        if link.get("rel") == "enclosure" and link.get("type", "").startswith("image/"):
+            return link.get("href")
+    for media in entry.get("media_content", []) + entry.get("media_thumbnail", []):
+        if media.get("url"):
+            return media["url"]
+    return None
+
+
+@dataclass
+class Source:
+    """A news site polled through its RSS feed.
+
+    Attributes:
+        name: Unique source name, also the name of the rss document in MongoDB
+        rss_url: Feed URL
+        date_format: strptime format of the entries' published date
+        rules: Site specific cleanup rules, merged with the cleaner and Telegraph rules
+        lang: Language of the articles
+        min_interval: Minimum number of seconds between two requests to the site
+        image: Function extracting the image URL of a feedparser entry
+    """
+    name: str
+    rss_url: str
+    date_format: str = "%a, %d %b %Y %H:%M:%S %z"
+    rules: Rules = field(default_factory=Rules)
+    lang: str = "French"
+    min_interval: float = 1.0
+    image: Callable[[Any], Optional[str]] = find_image
+
+    @cached_property
+    def limiter(self) -> RateLimiter:
+        """Rate limiter shared by every request to the site."""
+        return RateLimiter(self.min_interval)
+
+    @cached_property
+    def article_rules(self) -> CompiledRules:
+        """Cleaner, site and Telegraph rules compiled for a single walk."""
+        return CLEANER_RULES.merge(self.rules).merge(TELEGRAPH_RULES).compile()
+
+    def parse_date(self, entry: Any) -> str:
+        """
+        Parses the published date of a feed entry.
+        Args:
+            entry: feedparser entry
+        Returns:
+            str: ISO 8601 date
+        Raises:
+            ValueError: If the entry has no date, or one feedparser cannot parse either
+        """
+        published = entry.get("published")
+        if not published:
+            raise ValueError("No published date")
+        try:
+            # "Sat, 23 Nov 2024 14:13:45 -0500" to datatime
+            return datetime.strptime(published, self.date_format).isoformat()
+        except ValueError:
+            parsed = entry.get("published_parsed")
+            if not parsed:
+                raise ValueError(f"Unparseable published date: {published}")
+            return datetime(*parsed[:6], tzinfo=timezone.utc).isoformat()
+
+    def to_entry(self, entry: Any) -> Dict:
+        """
+        Turns a feed entry into the entry dictionary stored in MongoDB.
+        Args:
+            entry: feedparser entry
+        Returns:
+            Dict: Entry with source, title, published date, summary, link, guid and image
+        """
+        return {
+            "source": self.name,
+            "title": entry.title,
+            "published": self.parse_date(entry),
+            "summary": entry.summary,
+            "link": entry.link,
+            "guid": entry.get("id"),
+            "image": self.image(entry)
+        }
+
+    def read_entries(self, entries: Iterable[Any]) -> Iterator[Dict]:
+        """
+        Turns feed entries into entry dictionaries, skipping the ones that cannot be
+        read, so that one bad item does not stop the whole feed.
+        Args:
+            entries: feedparser entries
+        Yields:
+            Dict: Entries as returned by to_entry
+        """
+        for entry in entries:
+            try:
+                yield self.to_entry(entry)
+            except (AttributeError, ValueError) as e:
+                log.warning(f"Skipping an entry of {self.rss_url}: {e}")
+
+    def new_rss(self, response: Optional[httpx.Response] = None) -> Dict:
+        """
+        Creates an empty rss dictionary.
+        Args:
+            response: HTTP response the feed came from, used for its validators
+        Returns:
+            Dict: rss dictionary with name, url, validators and no entries
+        """
+        return {
+            "name": self.name,
+            "url": self.rss_url,
+            "etag": response.headers.get("etag") if response is not None else None,
+            "last_modified": response.headers.get("last-modified") if response is not None else None,
+            "entries": []
+        }
+
+    def parse_rss(self, data: bytes, response: Optional[httpx.Response] = None) -> Dict:
+        """
+        Parses feed data into the rss dictionary.
+        Each entry contains source, title, published date, summary, link, guid and image.
+        Args:
+            data: Raw feed document
+            response: HTTP response the feed came from, used for its encoding and validators
+        Returns:
+            Dict: rss dictionary with name, url, validators and entries
+        """
+        rss = self.new_rss(response)
+        headers = dict(response.headers) if response is not None else {}
+        feed = feedparser.parse(data, response_headers=headers)
+        rss["entries"] = list(self.read_entries(feed.entries))
+        return rss
+
+    def stream_rss(self, data: bytes, response: Optional[httpx.Response] = None,
+                   lookup: Optional[Callable[[List[Dict]], Dict[str, str]]] = None) -> Dict:
+        """
+        Parses feed data into the rss dictionary, reading entries one at a time and
+        stopping at the first batch of entries already stored unchanged.
+        Falls back to parse_rss if the document is not well-formed XML.
+        Args:
+            data: Raw feed document
+            response: HTTP response the feed came from, used for its encoding and validators
+            lookup: Gets the stored content hash of entries by key, every entry is read if None
+        Returns:
+            Dict: rss dictionary with name, url, validators and the entries read
+        """
+        rss = self.new_rss(response)
+        entries = self.read_entries(feedstream.iter_entries(data))
+        try:
+            rss["entries"] = list(feedstream.read_delta(entries, lookup) if lookup else entries)
+        except etree.XMLSyntaxError as e:
+            log.warning(f"Parsing {self.rss_url} with feedparser: {e}")
+            return self.parse_rss(data, response)
+        return rss
+
+    def fetch_rss(self, lastrss: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Fetches the feed, conditionally on the validators of lastrss.
+        Args:
+            lastrss: Previously fetched rss dictionary
+        Returns:
+            Optional[Dict]: rss dictionary or None if the feed is unchanged since lastrss
+        """
+        lastrss = lastrss or {}
+        with fetch_seconds.time(kind="rss", source=self.name):
+            response, changed = httpclient.get_conditional(
+                self.rss_url, lastrss.get("etag"), lastrss.get("last_modified"))
+        if not changed:
+            log.info(f"RSS feed not modified: {self.rss_url}")
+            return None
+        return self.parse_rss(response.content, response)
+
+    async def afetch_rss(self, lastrss: Optional[Dict] = None,
+                         lookup: Optional[Callable[[List[Dict]], Dict[str, str]]] = None) -> Optional[Dict]:
+        """
+        Async, rate limited version of fetch_rss.
+        With a lookup and streaming enabled, only the entries up to the ones already
+        stored are read, see stream_rss.
+        Args:
+            lastrss: Previously fetched rss dictionary
+            lookup: Gets the stored content hash of entries by key, such as mdb.get_known_hashes
+        Returns:
+            Optional[Dict]: rss dictionary or None if the feed is unchanged since lastrss
+        """
+        lastrss = lastrss or {}
+        await self.limiter.wait()
+        with fetch_seconds.time(kind="rss", source=self.name):
+            response, changed = await httpclient.aget_conditional(
+                self.rss_url, lastrss.get("etag"), lastrss.get("last_modified"))
+        if not changed:
+            log.info(f"RSS feed not modified: {self.rss_url}")
+            return None
+        if lookup is not None and streaming:
+            return await asyncio.to_thread(self.stream_rss, response.content, response, lookup)
+        return self.parse_rss(response.content, response)
+
+    async def aget_content(self, url: str) -> Optional[str]:
+        """
+        Fetches an article page, rate limited.
+        Args:
+            url: Article URL
+        Returns:
+            Optional[str]: HTML content or None if the request fails
+        """
+        await self.limiter.wait()
+        with fetch_seconds.time(kind="article", source=self.name):
+            return await httpclient.aget_text(url)
+
+    def prepare_article(self, content: str) -> Tuple[List[str], List[str]]:
+        """
+        Turns a raw article page of this site into Telegraph content ready for translation.
+        Args:
+            content: Raw HTML content
+        Returns:
+            Tuple[List[str], List[str]]: Template parts and texts
+        """
+        return prepare_article(content, self.article_rules)
+
+    async def aprepare_nodes(self, content: str) -> Tuple[List[Node], List[str]]:
+        """
+        Turns a raw article page of this site into a Telegraph node template ready
+        for translation, in the CPU worker pool.
+        Args:
+            content: Raw HTML content
+        Returns:
+            Tuple[List[Node], List[str]]: Node template and texts
+        """
+        return await cpupool.run_cpu(prepare_nodes, content, self.article_rules)
+
+
+def register(source: Source) -> Source:
+    """
+    Adds a source to the registry.
+    Args:
+        source: Source to register
+    Returns:
+        Source: The registered source
+    """
+    registry[source.name] = source
+    return source
+
+
+def get_source(name: str) -> Source:
+    """
+    Gets a registered source, importing its module if needed.
+    Args:
+        name: Source name, also its module name
+    Returns:
+        Source: The source
+    Raises:
+        KeyError: If no module registers a source with that name
+    """
+    if name not in registry:
+        importlib.import_module(name)
+    return registry[name]
+
+
+def load_sources(names: Optional[str] = None) -> List[Source]:
+    """
+    Gets the enabled sources.
+    Args:
+        names: Comma separated source names, defaults to the SOURCES environment variable
+    Returns:
+        List[Source]: Enabled sources
+    """
+    return [get_source(name.strip()) for name in (names or enabled).split(",") if name.strip()]
@@ -1,60 +1,248 @@
-from telegram.ext import ApplicationBuilder
 import utils as ut
 from logging_conf import logger
-from typing import Optional
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union, TYPE_CHECKING
 import asyncio
+import metrics
+from ratelimit import RateLimiter
+
+if TYPE_CHECKING:
+    from telegram.ext import Application
 
 log = logger.getChild(__name__)
 bot_token = ut.ENV.get("TELEGRAM_BOT_TOKEN", "")
 chat_ids = ut.ENV.get("TELEGRAM_CHAT_ID", "")
+# Bot API base URL, set to use a local Bot API server
+base_url = ut.ENV.get("TELEGRAM_BASE_URL", "")
+# Telegram allows about 30 messages per second overall and 20 per minute in a group
+global_rate = float(ut.ENV.get("TELEGRAM_GLOBAL_RATE", "30"))
+chat_interval = float(ut.ENV.get("TELEGRAM_CHAT_INTERVAL", "3"))
+# Retries of a message after flood control or network errors
+max_retries = int(ut.ENV.get("TELEGRAM_MAX_RETRIES", "3"))
+# First delay of the exponential backoff after a network error, in seconds
+retry_backoff = float(ut.ENV.get("TELEGRAM_RETRY_BACKOFF", "1"))
 
-application = ApplicationBuilder().token(token=bot_token).build()
+_global_limiter = RateLimiter(1 / global_rate if global_rate > 0 else 0)
+_chat_limiters: Dict[str, RateLimiter] = {}
 
+_application: Optional["Application"] = None
 
-async def send_new(entry: dict, title: str, summary: str, link: str) -> bool:
+send_seconds = metrics.histogram("vocnews_telegram_seconds", "Duration of Telegram Bot API calls")
+send_retries = metrics.counter("vocnews_telegram_retries_total", "Telegram messages retried by reason")
+
+
+def get_application() -> "Application":
+    """
+    Get the shared Telegram application, building it on first use.
+
+    Returns:
+        Application: Shared application
+    """
+    global _application
+    if _application is None:
+        from telegram.ext import ApplicationBuilder
+        builder = ApplicationBuilder().token(token=bot_token)
+        if base_url:
+            builder = builder.base_url(base_url)
+        _application = builder.build()
+    return _application
+
+
+def get_chats() -> List[str]:
     """
-    Send a Telegram message with an image and formatted caption.
+    Get the chat IDs messages are sent to.
+
+    Returns:
+        List[str]: Chat IDs from TELEGRAM_CHAT_ID
+    """
+    return [chat_id.strip() for chat_id in chat_ids.split(",") if chat_id.strip()]
+
+
+def format_caption(entry: dict, title: str, summary: str, link: str) -> str:
+    """
+    Format the HTML caption of an article message.
 
     Args:
-        entry: RSS entry containing image URL and original link
+        entry: RSS entry containing the original link
         title: Message title
         summary: Message summary
         link: Telegraph article link
 
     Returns:
-        bool: True if message was sent successfully, False otherwise
+        str: HTML caption
     """
-    if not all([entry.get("image"), title, summary, link]):
-        log.error("Missing required parameters")
-        return False
-
-    try:
-        caption = f"""<a href='{link}'>{title}</a>
+    return f"""<a href='{link}'>{title}</a>
 {summary}
 
 <b>新闻详情:<a href='{link}'>点击这里</a> | <a href='{entry['link']}'>原文</a></b>"""
 
-        chats = chat_ids.split(",")
-        log.debug(f"Sending message to chat IDs: {chats}")
-        for chat_id in chats:
-            await application.bot.send_photo(
-                chat_id=chat_id,
-                photo=entry["image"],
-                caption=caption[:1024],  # Telegram caption length limit
-                parse_mode="HTML"
-            )
-            log.info(f"Message sent successfully: {title}")
-        return True
 
+def chat_limiter(chat_id: str) -> RateLimiter:
+    """
+    Get the rate limiter of a chat.
+
+    Args:
+        chat_id: Chat ID
+
+    Returns:
+        RateLimiter: Limiter spacing messages to the chat by chat_interval
+    """
+    if chat_id not in _chat_limiters:
+        _chat_limiters[chat_id] = RateLimiter(chat_interval)
+    return _chat_limiters[chat_id]
+
+
+async def deliver(chat_id: str, caption: str, photo: Optional[Union[str, bytes]] = None) -> Any:
+    """
+    Send one message within the rate limits, retrying flood control and network errors.
+    Bad requests, such as an unknown chat or invalid entities, are never retried.
+
+    Args:
+        chat_id: Target chat ID
+        caption: HTML caption from format_caption
+        photo: Photo URL, bytes or file_id, None for a text message
+
+    Returns:
+        Message: The sent message
+
+    Raises:
+        TelegramError: If the message still fails after max_retries retries
+    """
+    from telegram.error import BadRequest, NetworkError, RetryAfter
+    bot = get_application().bot
+    for attempt in range(max_retries + 1):
+        await chat_limiter(chat_id).wait()
+        await _global_limiter.wait()
+        try:
+            with send_seconds.time(method="sendPhoto" if photo else "sendMessage"):
+                if photo:
+                    return await bot.send_photo(
+                        chat_id=chat_id,
+                        photo=photo,
+                        caption=caption[:1024],  # Telegram caption length limit
+                        parse_mode="HTML"
+                    )
+                return await bot.send_message(
+                    chat_id=chat_id,
+                    text=caption[:4096],  # Telegram message length limit
+                    parse_mode="HTML"
+                )
+        except RetryAfter as e:
+            if attempt == max_retries:
+                raise
+            delay = e.retry_after
+            delay = delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+            log.warning(f"Flood control on {chat_id}, retrying in {delay:.0f}s")
+            send_retries.inc(reason="flood")
+            await asyncio.sleep(delay)
+        except BadRequest:
+            # A NetworkError subclass, but retrying cannot fix a permanent error
+            raise
+        except NetworkError as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * 2 ** attempt
+            log.warning(f"Network error sending to {chat_id}: {e}, retrying in {delay:.1f}s")
+            send_retries.inc(reason="network")
+            await asyncio.sleep(delay)
+
+
+async def send_to_chat(chat_id: str, entry: dict, caption: str,
+                       photo: Optional[Union[str, bytes]] = None) -> Optional[Any]:
+    """
+    Send an article message to one chat, as a photo when the entry has an image.
+
+    Args:
+        chat_id: Target chat ID
+        entry: RSS entry containing image URL
+        caption: HTML caption from format_caption
+        photo: Image bytes or file_id of the already uploaded image, defaults to the entry's image URL
+
+    Returns:
+        Optional[Message]: The sent message, None if sending failed
+    """
+    try:
+        return await deliver(chat_id, caption, photo or entry.get("image"))
     except Exception as e:
-        log.error(f"Failed to send telegram message: {str(e)}")
+        log.error(f"Failed to send telegram message to {chat_id}: {str(e)}")
+        return None
+
+
+async def send_to_chats(
+    chats: List[str],
+    entry: dict,
+    caption: str,
+    on_sent: Optional[Callable[[str], Awaitable[None]]] = None,
+    photo: Optional[Union[str, bytes]] = None,
+) -> Dict[str, bool]:
+    """
+    Send an article message to several chats concurrently.
+    A photo is uploaded to one chat only, the other chats reuse the file_id
+    Telegram returns for it. A failing chat never stops the others.
+
+    Args:
+        chats: Target chat IDs
+        entry: RSS entry containing image URL
+        caption: HTML caption from format_caption
+        on_sent: Coroutine function called with each chat ID once its message is sent
+        photo: Image bytes to upload, defaults to the entry's image URL
+
+    Returns:
+        Dict[str, bool]: Whether the message was sent, by chat ID
+    """
+    results: Dict[str, bool] = {}
+    remaining = list(chats)
+
+    async def send(chat_id: str, photo: Optional[Union[str, bytes]] = None) -> Optional[Any]:
+        message = await send_to_chat(chat_id, entry, caption, photo)
+        results[chat_id] = message is not None
+        if message is not None and on_sent:
+            await on_sent(chat_id)
+        return message
+
+    file_id = None
+    if entry.get("image"):
+        while remaining and file_id is None:
+            message = await send(remaining.pop(0), photo)
+            if message is not None and getattr(message, "photo", None):
+                file_id = message.photo[-1].file_id
+    await asyncio.gather(*(send(chat_id, file_id) for chat_id in remaining))
+    return results
+
+
+async def send_new(entry: dict, title: str, summary: str, link: str) -> bool:
+    """
+    Send a Telegram message with an image and formatted caption to every chat.
+    Entries without an image are sent as a plain text message.
+
+    Args:
+        entry: RSS entry containing image URL and original link
+        title: Message title
+        summary: Message summary
+        link: Telegraph article link
+
+    Returns:
+        bool: True if message was sent successfully to every chat, False otherwise
+    """
+    if not all([title, summary, link]):
+        log.error("Missing required parameters")
         return False
 
+    caption = format_caption(entry, title, summary, link)
+    chats = get_chats()
+    log.debug(f"Sending message to chat IDs: {chats}")
+    results = await send_to_chats(chats, entry, caption)
+    if all(results.values()):
+        log.info(f"Message sent successfully: {title}")
+    return all(results.values())
+
 
 async def shutdown():
     """Gracefully shutdown the bot application"""
+    if _application is None:
+        return
     try:
-        await application.shutdown()
+        await _application.shutdown()
         log.info("Bot application shutdown complete")
     except Exception as e:
         log.error(f"Error during shutdown: {e}")
@@ -1,22 +1,53 @@
-from openai import OpenAI
+import asyncio
+import re
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import utils as ut
+from backends import Completion, get_pool
+from cache import get_cache, make_key
 from logging_conf import logger
+from skiplist import classify_texts
 
 log = logger.getChild(__name__)
 
-# Initialize OpenAI configuration
-base_url = ut.ENV.get('AI_URL', '')
-api_key = ut.ENV.get('AI_TOKEN', '')
-model = ut.ENV.get('AI_MODEL', '')
-
-try:
-    client = OpenAI(base_url=base_url, api_key=api_key)
-except Exception as e:
-    log.error(f"Failed to initialize OpenAI client: {e}")
-    raise
+# Maximum number of chat completions in flight at once for the async client
+max_concurrency = int(ut.ENV.get('AI_MAX_CONCURRENCY', '4'))
 
 system_prompt = ut.ENV.get("SYSTEM_PROMPT", None)
 
+# Maximum number of characters packed into one batched request, 0 disables batching
+batch_max_chars = int(ut.ENV.get("TRANSLATE_BATCH_CHARS", "3000"))
+
+# Maximum estimated tokens of source text per request; longer texts are split into chunks.
+# The translation is about as long, so prompt and answer fit a small model's context.
+max_tokens = int(ut.ENV.get("AI_MAX_TOKENS", "1000"))
+
+# Rough tokenizer-independent estimate: a CJK character is about a token, other text about 4 characters
+cjk_re = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+CHARS_PER_TOKEN = 4
+
+# Boundaries tried in turn to split an over-long text: paragraphs, sentences, then words.
+# The "sep" group is the whitespace kept between the pieces.
+CHUNK_BOUNDARIES = [
+    re.compile(r"(?P<sep>[ \t]*\n\s*)"),
+    re.compile(r"(?<=[.!?…。！？])[»”\"')\]]*(?P<sep>\s+)"),
+    re.compile(r"(?P<sep>\s+)"),
+]
+
+# Segment markers look like [[1]]; models sometimes emit full-width brackets
+SEGMENT_MARKER = "[[{}]]"
+segment_marker_re = re.compile(r"^\s*(?:\[\[|【)\s*(\d+)\s*(?:\]\]|】)[ \t]*", re.MULTILINE)
+# A marker anywhere in a segment means the model merged segments together
+inline_marker_re = re.compile(r"(?:\[\[|【)\s*\d+\s*(?:\]\]|】)")
+batch_prompt = " ".join([
+    "The input contains numbered segments, each starting with a marker such as [[1]].",
+    "Translate every segment separately and keep each marker unchanged at the start of its line,",
+    "in the same order, without merging or splitting segments."
+])
+
+# asyncio.Semaphore binds to the loop it is first used on, so keep one per loop
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
 
 def default_system_prompt(source_lang=None, target_lang="English") -> str:
     """Generate default system prompt for translation.
@@ -52,8 +83,501 @@ def get_system_prompt(source_lang=None, target_lang="English") -> str:
     return default_system_prompt(source_lang, target_lang)
 
 
+def messages(system: str, text: str) -> List[Dict[str, str]]:
+    """Build the chat messages of a completion.
+
+    Args:
+        system (str): System prompt
+        text (str): User content
+
+    Returns:
+        List[Dict[str, str]]: System and user messages
+    """
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": text}
+    ]
+
+
+def complete(system: str, text: str) -> Completion:
+    """Run a single chat completion on the backend pool, failing over between backends.
+
+    Args:
+        system (str): System prompt
+        text (str): User content
+
+    Returns:
+        Completion: Content of the first completion choice and the backend that answered
+    """
+    return get_pool().complete(messages(system, text))
+
+
+def cache_key(text: str, model: str, source_lang=None, target_lang="English") -> str:
+    """Build the translation cache key for text translated by a model with the current prompt.
+
+    Args:
+        text (str): Text to translate
+        model (str): Model of the backend translating the text
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        str: Cache key
+    """
+    return make_key(text, source_lang, target_lang, model, get_system_prompt(source_lang, target_lang))
+
+
+def lookup_cached(texts: List[str], source_lang=None, target_lang="English") -> List[Optional[str]]:
+    """Look up cached translations of texts made by the models of the primary backends.
+
+    Translations of fallback backends with another model are never answered from the cache.
+
+    Args:
+        texts (List[str]): Texts to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        List[Optional[str]]: Cached translations in input order, None for misses
+    """
+    if not texts:
+        return []
+    models = get_pool().primary_models()
+    found = get_cache().get_many(
+        [cache_key(text, model, source_lang, target_lang) for text in texts for model in models])
+    return [next((value for value in found[i:i + len(models)] if value is not None), None)
+            for i in range(0, len(found), len(models))]
+
+
+def lookup_known(texts: List[str], source_lang=None, target_lang="English") -> List[Optional[str]]:
+    """Look up the translations known without the model: rule translations, then the cache.
+
+    Args:
+        texts (List[str]): Texts to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        List[Optional[str]]: Known translations in input order, None where the model is needed
+    """
+    results = classify_texts(texts, source_lang, target_lang)
+    pending = [i for i, result in enumerate(results) if result is None]
+    for i, cached in zip(pending, lookup_cached([texts[i] for i in pending], source_lang, target_lang)):
+        results[i] = cached
+    return results
+
+
+async def alookup_known(texts: List[str], source_lang=None, target_lang="English") -> List[Optional[str]]:
+    """Look up the known translations of texts in a thread, keeping the cache query off the event loop.
+
+    Args:
+        texts (List[str]): Texts to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        List[Optional[str]]: Known translations in input order, None where the model is needed
+    """
+    return await asyncio.to_thread(lookup_known, texts, source_lang, target_lang)
+
+
+def store_cached(text: str, translated: str, model: str, source_lang=None, target_lang="English") -> None:
+    """Store a translation in the cache.
+
+    Args:
+        text (str): Source text
+        translated (str): Translated text
+        model (str): Model of the backend that translated the text
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+    """
+    if translated:
+        get_cache().set(cache_key(text, model, source_lang, target_lang), translated)
+
+
+def store_many(texts: List[str], translated: List[str], model: str, source_lang=None, target_lang="English") -> None:
+    """Store translations in the cache.
+
+    Args:
+        texts (List[str]): Source texts
+        translated (List[str]): Translated texts, in the same order
+        model (str): Model of the backend that translated the texts
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+    """
+    for text, translation in zip(texts, translated):
+        store_cached(text, translation, model, source_lang, target_lang)
+
+
+async def astore_cached(text: str, translated: str, model: str, source_lang=None, target_lang="English") -> None:
+    """Store a translation in the cache from a thread, keeping the write off the event loop.
+
+    Args:
+        text (str): Source text
+        translated (str): Translated text
+        model (str): Model of the backend that translated the text
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+    """
+    await asyncio.to_thread(store_cached, text, translated, model, source_lang, target_lang)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text without a tokenizer.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count, at least 1 for a non-empty text
+    """
+    cjk = len(cjk_re.findall(text))
+    return cjk + -(-(len(text) - cjk) // CHARS_PER_TOKEN)
+
+
+def split_units(text: str, boundary: re.Pattern) -> List[Tuple[str, str]]:
+    """Split a text at a boundary, keeping the separators.
+
+    Args:
+        text (str): Text to split
+        boundary (re.Pattern): Pattern with a "sep" group matching the separator
+
+    Returns:
+        List[Tuple[str, str]]: (piece, separator following it) pairs that join back into text
+    """
+    units, start = [], 0
+    for match in boundary.finditer(text):
+        if match.start("sep") > start:
+            units.append((text[start:match.start("sep")], match.group("sep")))
+            start = match.end("sep")
+    units.append((text[start:], ""))
+    return units
+
+
+def chunk_text(text: str, max_tokens: int, level: int = 0) -> List[Tuple[str, str]]:
+    """Split a text into chunks of at most max_tokens estimated tokens.
+
+    Texts are cut at paragraph breaks first, then at sentence ends, and only
+    inside a sentence when it is too long on its own. Adjacent pieces are packed
+    back together as long as they fit.
+
+    Args:
+        text (str): Text to split
+        max_tokens (int): Token budget per chunk
+        level (int, optional): Index of the first CHUNK_BOUNDARIES pattern to try
+
+    Returns:
+        List[Tuple[str, str]]: (chunk, separator following it) pairs, see join_chunks
+    """
+    if estimate_tokens(text) <= max_tokens or level == len(CHUNK_BOUNDARIES):
+        return [(text, "")]
+    chunks: List[Tuple[str, str]] = []
+    for piece, sep in split_units(text, CHUNK_BOUNDARIES[level]):
+        parts = chunk_text(piece, max_tokens, level + 1)
+        parts[-1] = (parts[-1][0], sep)
+        for part, part_sep in parts:
+            if chunks and estimate_tokens(merged := chunks[-1][0] + chunks[-1][1] + part) <= max_tokens:
+                chunks[-1] = (merged, part_sep)
+            else:
+                chunks.append((part, part_sep))
+    return chunks
+
+
+def join_chunks(chunks: List[Tuple[str, str]], translated: List[str]) -> str:
+    """Join translated chunks with the separators of the source chunks.
+
+    Args:
+        chunks (List[Tuple[str, str]]): Output of chunk_text
+        translated (List[str]): Translation of each chunk
+
+    Returns:
+        str: Translated text
+    """
+    return "".join(text + sep for text, (_, sep) in zip(translated, chunks)).strip()
+
+
+def translate_uncached(text: str, source_lang=None, target_lang="English") -> str:
+    """Translate text with the model, bypassing the cache lookup but storing the result.
+
+    Texts over AI_MAX_TOKENS are translated in chunks, see chunk_text. The chunks
+    are cached one by one, the backends translating them may differ.
+
+    Args:
+        text (str): Text to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        str: Translated text
+
+    Raises:
+        Exception: If translation fails
+    """
+    chunks = chunk_text(text, max(max_tokens, 1))
+    if len(chunks) > 1:
+        log.debug(f"Translating {estimate_tokens(text)} tokens in {len(chunks)} chunks")
+        return join_chunks(chunks, [translate_text(chunk, source_lang, target_lang) for chunk, _ in chunks])
+    try:
+        translated, backend = complete(get_system_prompt(source_lang, target_lang), text)
+    except Exception as e:
+        log.error(f"Translation failed: {e}")
+        raise
+    store_cached(text, translated, backend.model, source_lang, target_lang)
+    return translated
+
+
 def translate_text(text: str, source_lang=None, target_lang="English") -> str:
-    """Translate text using OpenAI API.
+    """Translate text using OpenAI API, answering from the cache when possible.
+
+    Args:
+        text (str): Text to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        str: Translated text
+
+    Raises:
+        Exception: If translation fails
+    """
+    cached = lookup_known([text], source_lang, target_lang)[0]
+    if cached is not None:
+        return cached
+    return translate_uncached(text, source_lang, target_lang)
+
+
+def pack_segments(texts: List[str]) -> str:
+    """Pack texts into one request body, one marked segment per line.
+
+    Args:
+        texts (List[str]): Texts to pack
+
+    Returns:
+        str: Texts prefixed with [[n]] markers, whitespace collapsed to single spaces
+    """
+    return "\n".join(
+        f"{SEGMENT_MARKER.format(i)} {' '.join(text.split())}"
+        for i, text in enumerate(texts, 1)
+    )
+
+
+def split_segments(response: str, count: int) -> List[Optional[str]]:
+    """Split a batched response back into segments using their markers.
+
+    Args:
+        response (str): Model output for a packed request
+        count (int): Number of segments that were packed
+
+    Returns:
+        List[Optional[str]]: Translated segments in input order, None for
+            segments that are missing, duplicated, empty or holding another
+            segment's marker in the response
+    """
+    segments: List[Optional[str]] = [None] * count
+    seen = set()
+    matches = list(segment_marker_re.finditer(response or ""))
+    for match, following in zip(matches, matches[1:] + [None]):
+        index = int(match.group(1)) - 1
+        end = following.start() if following else len(response)
+        if not 0 <= index < count:
+            continue
+        if index in seen:
+            segments[index] = None
+            continue
+        seen.add(index)
+        text = response[match.end():end].strip()
+        segments[index] = None if inline_marker_re.search(text) else text or None
+    return segments
+
+
+def make_batches(texts: List[str], max_chars: int, max_tokens: Optional[int] = None) -> List[List[int]]:
+    """Group text indexes into batches of at most max_chars characters and max_tokens tokens.
+
+    Args:
+        texts (List[str]): Texts to group
+        max_chars (int): Character budget per batch, a larger text gets its own batch
+        max_tokens (int, optional): Estimated token budget per batch. Defaults to no limit.
+
+    Returns:
+        List[List[int]]: Batches of indexes into texts, in order
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    size = tokens = 0
+    for i, text in enumerate(texts):
+        text_tokens = estimate_tokens(text) if max_tokens else 0
+        if current and (size + len(text) > max_chars or (max_tokens and tokens + text_tokens > max_tokens)):
+            batches.append(current)
+            current, size, tokens = [], 0, 0
+        current.append(i)
+        size += len(text)
+        tokens += text_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def merge_segments(batch: List[int], segments: List[Optional[str]], results: List[Optional[str]]) -> List[int]:
+    """Store the translated segments of a batch into results.
+
+    Args:
+        batch (List[int]): Indexes of the texts that were packed
+        segments (List[Optional[str]]): Output of split_segments for the batch
+        results (List[Optional[str]]): Translations indexed like the input texts
+
+    Returns:
+        List[int]: Indexes whose segment did not round-trip and need a retry
+    """
+    missing = []
+    for i, segment in zip(batch, segments):
+        if segment is None:
+            missing.append(i)
+        else:
+            results[i] = segment
+    if missing and len(batch) > 1:
+        log.debug(f"Batch of {len(batch)} lost {len(missing)} segments, retrying them one by one")
+    return missing
+
+
+def plan_batches(texts: List[str], results: List[Optional[str]]) -> List[List[int]]:
+    """Group the texts that have no translation yet into batches.
+
+    Args:
+        texts (List[str]): Texts to translate
+        results (List[Optional[str]]): Known translations, None where still missing
+
+    Returns:
+        List[List[int]]: Batches of indexes into texts
+    """
+    pending = [i for i, result in enumerate(results) if result is None]
+    return [[pending[j] for j in batch]
+            for batch in make_batches([texts[i] for i in pending], max(batch_max_chars, 1), max_tokens)]
+
+
+def translate_batch(texts: List[str], source_lang=None, target_lang="English") -> List[str]:
+    """Translate many texts with as few requests as possible.
+
+    Texts the skip list translates by rule and cached texts need no request.
+    The others are packed into marked segments and sent together; segments that
+    do not round-trip through the model are translated again one by one.
+
+    Args:
+        texts (List[str]): Texts to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        List[str]: Translated texts in input order
+
+    Raises:
+        Exception: If a per-text fallback translation fails
+    """
+    results = lookup_known(texts, source_lang, target_lang)
+    system = f"{get_system_prompt(source_lang, target_lang)} {batch_prompt}"
+    for batch in plan_batches(texts, results):
+        segments: List[Optional[str]] = [None] * len(batch)
+        if len(batch) > 1 and batch_max_chars > 0:
+            try:
+                response, backend = complete(system, pack_segments([texts[i] for i in batch]))
+                segments = split_segments(response, len(batch))
+            except Exception as e:
+                log.warning(f"Batch translation failed, falling back per text: {e}")
+        missing = merge_segments(batch, segments, results)
+        for i in batch:
+            if i not in missing:
+                store_cached(texts[i], results[i], backend.model, source_lang, target_lang)
+        for i in missing:
+            results[i] = translate_uncached(texts[i], source_lang, target_lang)
+    return results
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    """Get the semaphore bounding in-flight requests on the running event loop.
+
+    Returns:
+        asyncio.Semaphore: Semaphore sized by AI_MAX_CONCURRENCY
+    """
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        _semaphore_loop = loop
+    return _semaphore
+
+
+async def acomplete(system: str, text: str) -> Completion:
+    """Run a single chat completion on the backend pool with the async clients.
+
+    At most AI_MAX_CONCURRENCY completions run at the same time, the rest wait.
+
+    Args:
+        system (str): System prompt
+        text (str): User content
+
+    Returns:
+        Completion: Content of the first completion choice and the backend that answered
+    """
+    async with get_semaphore():
+        return await get_pool().acomplete(messages(system, text))
+
+
+async def astream_complete(system: str, text: str) -> AsyncIterator[Completion]:
+    """Run a streamed chat completion on the async client, yielding content as it arrives.
+
+    The stream holds one of the AI_MAX_CONCURRENCY slots until it is exhausted.
+
+    Args:
+        system (str): System prompt
+        text (str): User content
+
+    Yields:
+        Completion: Content deltas of the first completion choice, with the backend streaming them
+    """
+    async with get_semaphore():
+        async for delta in get_pool().astream(messages(system, text)):
+            yield delta
+
+
+async def astream_text(text: str, source_lang=None, target_lang="English") -> AsyncIterator[str]:
+    """Translate text with a streamed completion, yielding the translation as it grows.
+
+    Cached and chunked texts are yielded whole, in one piece.
+
+    Args:
+        text (str): Text to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Yields:
+        str: Translated text so far
+
+    Raises:
+        Exception: If translation fails
+    """
+    cached = (await alookup_known([text], source_lang, target_lang))[0]
+    if cached is not None:
+        yield cached
+        return
+    if estimate_tokens(text) > max(max_tokens, 1):
+        yield await atranslate_uncached(text, source_lang, target_lang)
+        return
+    translated, backend = "", None
+    try:
+        async for delta, backend in astream_complete(get_system_prompt(source_lang, target_lang), text):
+            translated += delta
+            yield translated
+    except Exception as e:
+        log.error(f"Translation failed: {e}")
+        raise
+    if backend is not None:
+        await astore_cached(text, translated, backend.model, source_lang, target_lang)
+
+
+async def atranslate_uncached(text: str, source_lang=None, target_lang="English") -> str:
+    """Translate text with the async client, bypassing the cache lookup but storing the result.
+
+    Texts over AI_MAX_TOKENS are translated in concurrent chunks, see chunk_text.
+    The chunks are cached one by one, the backends translating them may differ.
 
     Args:
         text (str): Text to translate
@@ -66,24 +590,83 @@ def translate_text(text: str, source_lang=None, target_lang="English") -> str:
     Raises:
         Exception: If translation fails
     """
+    chunks = chunk_text(text, max(max_tokens, 1))
+    if len(chunks) > 1:
+        log.debug(f"Translating {estimate_tokens(text)} tokens in {len(chunks)} concurrent chunks")
+        return join_chunks(chunks, await asyncio.gather(
+            *(atranslate_text(chunk, source_lang, target_lang) for chunk, _ in chunks)))
     try:
-        completion = client.chat.completions.create(
-            model=model,
-            temperature=0,
-            messages=[
-                {"role": "system", "content": get_system_prompt(
-                    source_lang, target_lang)},
-                {"role": "user", "content": text}
-            ]
-        )
-        return completion.choices[0].message.content
+        translated, backend = await acomplete(get_system_prompt(source_lang, target_lang), text)
     except Exception as e:
         log.error(f"Translation failed: {e}")
         raise
+    await astore_cached(text, translated, backend.model, source_lang, target_lang)
+    return translated
+
+
+async def atranslate_text(text: str, source_lang=None, target_lang="English") -> str:
+    """Translate text using the async OpenAI client, answering from the cache when possible.
+
+    Args:
+        text (str): Text to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        str: Translated text
+
+    Raises:
+        Exception: If translation fails
+    """
+    cached = (await alookup_known([text], source_lang, target_lang))[0]
+    if cached is not None:
+        return cached
+    return await atranslate_uncached(text, source_lang, target_lang)
+
+
+async def atranslate_batch(texts: List[str], source_lang=None, target_lang="English") -> List[str]:
+    """Translate many texts concurrently with as few requests as possible.
+
+    Same as translate_batch, but all batches and retries run concurrently,
+    bounded by AI_MAX_CONCURRENCY.
+
+    Args:
+        texts (List[str]): Texts to translate
+        source_lang (str, optional): Source language. Defaults to None.
+        target_lang (str, optional): Target language. Defaults to "English".
+
+    Returns:
+        List[str]: Translated texts in input order
+
+    Raises:
+        Exception: If a per-text fallback translation fails
+    """
+    results = await alookup_known(texts, source_lang, target_lang)
+    system = f"{get_system_prompt(source_lang, target_lang)} {batch_prompt}"
+
+    async def run(batch: List[int]) -> None:
+        segments: List[Optional[str]] = [None] * len(batch)
+        if len(batch) > 1 and batch_max_chars > 0:
+            try:
+                response, backend = await acomplete(system, pack_segments([texts[i] for i in batch]))
+                segments = split_segments(response, len(batch))
+            except Exception as e:
+                log.warning(f"Batch translation failed, falling back per text: {e}")
+        missing = merge_segments(batch, segments, results)
+        if done := [i for i in batch if i not in missing]:
+            await asyncio.to_thread(store_many, [texts[i] for i in done], [results[i] for i in done],
+                                    backend.model, source_lang, target_lang)
+        retried = await asyncio.gather(
+            *(atranslate_uncached(texts[i], source_lang, target_lang) for i in missing))
+        for i, translated in zip(missing, retried):
+            results[i] = translated
+
+    await asyncio.gather(*(run(batch) for batch in plan_batches(texts, results)))
+    return results
 
 
 if __name__ == "__main__":
-    print(model)
+    print(get_pool().primary_models())
     text = "Deux hommes, âgés respectivement de 22 et 28 ans, et une femme de 22 ans ont été arrêtés pour entrave du travail des policiers, a indiqué Véronique Dubuc, porte-parole du SPVM. La femme sera aussi accusée de voie de fait. Tous ont été identifiés et libérés sur les lieux. Ils devront éventuellement comparaître pour répondre des accusations."
     print(text)
     translated_text = translate_text(
@@ -1,25 +1,20 @@
 import json
 import os
-from typing import Dict, Any
-import doppler_env
+from typing import Mapping
 import logging_conf
 
 
-def init_environment() -> Dict[str, Any]:
-    """Initialize environment variables and debug settings.
+def init_environment() -> Mapping[str, str]:
+    """Initialize debug settings from the environment.
+
+    Doppler variables are already loaded by the doppler_env .pth hook at
+    interpreter startup, so the process environment is used as is.
 
     Returns:
-        Dict[str, Any]: Dictionary containing all environment variables
+        Mapping[str, str]: The process environment
     """
-    env = {}
-    debug = False
-    for k, v in os.environ.items():
-        if k == "DEBUG":
-            debug = v.lower() == "true"
-        env[k] = v
-
-    logging_conf.set_debug(debug)
-    return env
+    logging_conf.set_debug(os.environ.get("DEBUG", "").lower() == "true")
+    return os.environ
 
 
 ENV = init_environment()
@@ -104,6 +99,6 @@ def read_file(file: str) -> str:
 
 
 if __name__ == "__main__":
-    dump_json(ENV, "env.json")
+    dump_json(dict(ENV), "env.json")
     logging_conf.logger.debug("ENV: %s", ENV)
     print("Done")
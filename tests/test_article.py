@@ -0,0 +1,106 @@
+import asyncio
+import os
+import pytest
+import article
+import lapresse
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture
+def page():
+    with open(os.path.join(FIXTURES, "lapresse_article.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def telegraph(monkeypatch):
+    """Record Telegraph calls and keep the page map in memory"""
+    calls, pages = [], {}
+
+    def create_page(title, content):
+        calls.append(("create", title, content))
+        return {"url": f"https://telegra.ph/p{len(calls)}", "path": f"p{len(calls)}"}
+
+    def edit_page(path, title, content):
+        calls.append(("edit", path, content))
+        return {"url": f"https://telegra.ph/{path}", "path": path}
+
+    monkeypatch.setattr(article, "create_page", create_page)
+    monkeypatch.setattr(article, "edit_page", edit_page)
+    monkeypatch.setattr(article.db, "get_page", pages.get)
+    monkeypatch.setattr(article.db, "save_page", pages.__setitem__)
+    return calls
+
+
+def test_node_template_matches_telegraph_parsing_of_the_html(page):
+    rules = lapresse.SOURCE.article_rules
+    parts, texts = article.prepare_article(page, rules)
+    template, node_texts = article.prepare_nodes(page, rules)
+    translated = [f"«{text.upper()}»" for text in texts]
+
+    assert node_texts == texts
+    assert article.render_nodes(template, translated) == article.html_nodes(article.render_texts(parts, translated))
+
+
+def test_render_nodes_checks_slot_count():
+    template = [{"tag": "p", "children": [f"{article.TEXT_SLOT} et {article.TEXT_SLOT}"]}, {"tag": "br"}]
+    assert article.render_nodes(template, ["a <b>", "c\n d"]) == [
+        {"tag": "p", "children": ["a <b> et c d"]}, {"tag": "br"}]
+    with pytest.raises(ValueError):
+        article.render_nodes(template, ["a"])
+
+
+def test_split_nodes_fits_limit_and_keeps_content():
+    nodes = [{"tag": "p", "children": [f"paragraphe {i} " * 20]} for i in range(30)]
+    nodes.append({"tag": "ul", "children": [{"tag": "li", "children": ["élément " * 30]} for _ in range(20)]})
+    nodes.append({"tag": "p", "children": ["x" * 5000]})
+
+    pages = article.split_nodes(nodes, limit=2000)
+    assert len(pages) > 1
+    assert all(article.content_size(content) <= 2000 for content in pages)
+
+    def text(content):
+        return "".join(node if isinstance(node, str) else text(node.get("children", [])) for node in content)
+    assert "".join(text(content) for content in pages) == text(nodes)
+    assert article.split_nodes([]) == [[]]
+
+
+def test_publish_page_links_continuation_pages_and_reuses_identical_ones(monkeypatch, telegraph):
+    monkeypatch.setattr(article, "CONTENT_LIMIT", 1000)
+    monkeypatch.setattr(article, "LINK_RESERVE", 200)
+    content = [{"tag": "p", "children": [f"paragraphe {i} " * 10]} for i in range(10)]
+
+    first = article.publish_page("Titre", content)
+    creates = [call for call in telegraph if call[0] == "create"]
+    assert len(creates) > 1
+    # Pages are created last first, each one linking to the next
+    assert [call[1] for call in creates] == [f"Titre ({n})" for n in range(len(creates), 1, -1)] + ["Titre"]
+    assert creates[-1][2][-1] == article.continuation_node(f"https://telegra.ph/p{len(creates) - 1}")
+    assert first == {"url": f"https://telegra.ph/p{len(creates)}", "path": f"p{len(creates)}"}
+
+    telegraph.clear()
+    assert article.publish_page("Titre", content) == first
+    assert telegraph == []
+
+    article.publish_page("Titre", content[:1], path="p9")
+    assert telegraph == [("edit", "p9", content[:1])]
+    telegraph.clear()
+    article.publish_page("Titre", content[:1], path="p9")
+    assert telegraph == []
+
+
+def test_aupdate_texts_only_translates_changed_paragraphs(monkeypatch):
+    calls = []
+
+    async def translate(texts, source_lang):
+        calls.append(texts)
+        return [text.upper() for text in texts]
+
+    monkeypatch.setattr(article, "atranslate_texts", translate)
+    previous = ["Premier.", "Deuxième.", "Troisième."]
+    texts = ["Premier.", "Nouveau.", "Troisième.", "Fin."]
+
+    assert article.reuse_translations(texts, previous, ["1", "2", "3"]) == ["1", None, "3", None]
+    assert asyncio.run(article.aupdate_texts(texts, previous, ["1", "2", "3"])) == ["1", "NOUVEAU.", "3", "FIN."]
+    assert calls == [["Nouveau.", "Fin."]]
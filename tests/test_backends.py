@@ -0,0 +1,144 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import backends
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible server answering with its own name"""
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.server.down:
+            return self.reply(503, b'{"error": {"message": "down"}}')
+        self.reply(200, b'{"object": "list", "data": []}')
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(request)
+        time.sleep(self.server.delay)
+        if self.server.down:
+            return self.reply(500, b'{"error": {"message": "down"}}')
+        content = f"{self.server.name}:{request['messages'][-1]['content']}"
+        if request.get("stream"):
+            events = [{"choices": [{"index": 0, "delta": {"content": part}}]} for part in (content[:3], content[3:])]
+            body = "".join(f"data: {json.dumps({'id': '1', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'm', **event})}\n\n"
+                           for event in events) + "data: [DONE]\n\n"
+            return self.reply(200, body.encode(), "text/event-stream")
+        self.reply(200, json.dumps({
+            "id": "1", "object": "chat.completion", "created": 0, "model": request["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(name, delay=0.0, down=False):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+        httpd.name, httpd.delay, httpd.down, httpd.requests = name, delay, down, []
+        threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+        started.append(httpd)
+        return httpd
+
+    yield start
+    for httpd in started:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def backend(httpd, **kwargs):
+    return backends.Backend(httpd.name, f"http://127.0.0.1:{httpd.server_address[1]}/v1", model="m", **kwargs)
+
+
+MESSAGES = [{"role": "user", "content": "bonjour"}]
+
+
+def test_complete_fails_over_and_takes_failing_backend_out(servers, monkeypatch):
+    monkeypatch.setattr(backends, "max_failures", 2)
+    down, up = servers("down", down=True), servers("up")
+    pool = backends.Pool([backend(down), backend(up)])
+
+    assert pool.complete(MESSAGES).content == "up:bonjour"
+    assert pool.complete(MESSAGES).content == "up:bonjour"
+    assert [b.name for b in pool.candidates()] == ["up", "down"]
+    assert pool.complete(MESSAGES).content == "up:bonjour"
+    assert len(down.requests) == 2
+
+
+def test_acomplete_routes_to_least_outstanding_backend(servers):
+    first, second = servers("first", delay=0.1), servers("second", delay=0.1)
+    pool = backends.Pool([backend(first), backend(second)])
+
+    async def run():
+        return await asyncio.gather(*(pool.acomplete(MESSAGES) for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert sorted(content for content, _ in results) == ["first:bonjour"] * 2 + ["second:bonjour"] * 2
+
+
+def test_fallback_only_used_when_primaries_fail(servers):
+    primary, fallback = servers("primary"), servers("fallback")
+    pool = backends.Pool([backend(fallback, fallback=True), backend(primary)])
+    assert asyncio.run(pool.acomplete(MESSAGES)) == ("primary:bonjour", pool.backends[1])
+
+    primary.down = True
+    assert asyncio.run(pool.acomplete(MESSAGES)) == ("fallback:bonjour", pool.backends[0])
+
+
+def test_slow_backend_times_out_and_fails_over(servers):
+    slow, fast = servers("slow", delay=0.5), servers("fast")
+    pool = backends.Pool([backend(slow, timeout=0.2), backend(fast)])
+    assert asyncio.run(pool.acomplete(MESSAGES)).content == "fast:bonjour"
+
+
+def test_health_check_brings_backend_back(servers, monkeypatch):
+    monkeypatch.setattr(backends, "max_failures", 1)
+    httpd = servers("gpu", down=True)
+    pool = backends.Pool([backend(httpd)])
+
+    assert asyncio.run(pool.acheck_all()) == {"gpu": False}
+    assert not pool.backends[0].available
+    httpd.down = False
+    pool.backends[0]._async_client = None
+    assert asyncio.run(pool.acheck_all()) == {"gpu": True}
+    assert pool.backends[0].available
+
+
+def test_astream_fails_over_before_first_delta(servers):
+    down, up = servers("down", down=True), servers("up")
+    pool = backends.Pool([backend(down), backend(up)])
+
+    async def collect():
+        return [delta async for delta in pool.astream(MESSAGES)]
+
+    assert asyncio.run(collect()) == [("up:", pool.backends[1]), ("bonjour", pool.backends[1])]
+
+
+def test_primary_models_leave_out_fallbacks():
+    pool = backends.Pool([backends.Backend("a", "", model="m1"), backends.Backend("b", "", model="m2"),
+                          backends.Backend("c", "", model="m1"), backends.Backend("d", "", model="m3", fallback=True)])
+    assert pool.primary_models() == ["m1", "m2"]
+    assert backends.Pool([backends.Backend("d", "", model="m3", fallback=True)]).primary_models() == ["m3"]
+
+
+def test_parse_backends():
+    parsed = backends.parse_backends('[{"name": "gpu1", "url": "http://gpu1/v1", "model": "qwen2:7b"},'
+                                     ' {"url": "https://api.example.com/v1", "token": "t", "fallback": true, "timeout": 5}]')
+    assert [(b.name, b.model, b.fallback, b.timeout) for b in parsed] == [
+        ("gpu1", "qwen2:7b", False, backends.default_timeout),
+        ("https://api.example.com/v1", backends.ut.ENV.get("AI_MODEL", ""), True, 5.0)]
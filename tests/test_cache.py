@@ -0,0 +1,76 @@
+import pytest
+from cache import MongoCache, SQLiteCache, make_key
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    return SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+
+
+def test_make_key_depends_on_every_part():
+    base = make_key("Bonjour", "French", "English", "qwen2:7b", "prompt")
+    assert base == make_key("Bonjour", "French", "English", "qwen2:7b", "prompt")
+    assert base != make_key("Bonjour", "French", "Simple Chinese", "qwen2:7b", "prompt")
+    assert base != make_key("Bonjour", "French", "English", "gpt-4o", "prompt")
+    assert base != make_key("Bonjour", "French", "English", "qwen2:7b", "other prompt")
+    assert base != make_key("Bonjour", None, "English", "qwen2:7b", "prompt")
+
+
+def test_sqlite_cache_hit_and_miss(sqlite_cache):
+    assert sqlite_cache.get("k") is None
+    sqlite_cache.set("k", "v")
+    assert sqlite_cache.get("k") == "v"
+    stats = sqlite_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_sqlite_cache_overwrite_keeps_size(sqlite_cache):
+    sqlite_cache.set("k", "v1")
+    sqlite_cache.set("k", "v2")
+    assert sqlite_cache.get("k") == "v2"
+    assert sqlite_cache.stats()["size"] == 1
+
+
+def test_sqlite_cache_evicts_least_recently_used(sqlite_cache):
+    for i in range(10):
+        sqlite_cache.set(f"k{i}", str(i))
+    sqlite_cache.get("k0")
+    sqlite_cache.set("k10", "10")
+    assert sqlite_cache.stats()["size"] <= 10
+    assert sqlite_cache.get("k0") == "0"
+    assert sqlite_cache.get("k1") is None
+    assert sqlite_cache.get("k10") == "10"
+
+
+def test_sqlite_cache_persists(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCache(path, 10).set("k", "v")
+    reopened = SQLiteCache(path, 10)
+    assert reopened.get("k") == "v"
+    assert reopened.stats()["size"] == 1
+
+
+def test_sqlite_cache_get_many_touches_hits_once(sqlite_cache):
+    for i in range(10):
+        sqlite_cache.set(f"k{i}", str(i))
+    assert sqlite_cache.get_many(["k0", "x", "k1", "k0"]) == ["0", None, "1", "0"]
+    assert sqlite_cache.stats()["hits"] == 3
+    assert sqlite_cache.stats()["misses"] == 1
+    sqlite_cache.set("k10", "10")
+    assert sqlite_cache.get_many(["k0", "k1", "k2"]) == ["0", "1", None]
+
+
+def test_mongo_cache_get_many_uses_one_query():
+    from benchmarks.memorydb import MemoryCollection
+    collection = MemoryCollection()
+    mongo_cache = MongoCache(collection, max_entries=10)
+    mongo_cache.set("k", "v")
+    queries = []
+    find = collection.find
+    collection.find = lambda query=None, projection=None: queries.append(query) or find(query, projection)
+
+    assert mongo_cache.get_many(["k", "x", "k"]) == ["v", None, "v"]
+    assert queries == [{"_id": {"$in": ["k", "x"]}}]
+    assert mongo_cache.stats()["hits"] == 2
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import pytest
+import article
+import cpupool
+import metrics
+import sources
+from htmlrules import Rules
+
+PAGE = '<html><body><div class="ad">pub</div><h3>Titre</h3><p>texte</p></body></html>'
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    def set_workers(count):
+        monkeypatch.setattr(cpupool, "cpu_workers", count)
+        monkeypatch.setattr(cpupool, "_executor", None)
+    yield set_workers
+    cpupool.shutdown()
+
+
+def test_run_cpu_in_thread_without_workers(workers):
+    workers(0)
+    assert asyncio.run(cpupool.run_cpu(os.getpid)) == os.getpid()
+    assert cpupool._executor is None
+
+
+def test_run_cpu_prepares_articles_in_worker_processes(workers):
+    workers(1)
+    metrics.REGISTRY.reset()
+    source = sources.Source(name="test", rss_url="", rules=Rules(remove=[".ad"]))
+
+    async def run():
+        return await asyncio.gather(cpupool.run_cpu(os.getpid), source.aprepare_nodes(PAGE))
+
+    pid, (nodes, texts) = asyncio.run(run())
+    assert pid != os.getpid()
+    # Metrics recorded in the worker are merged back
+    assert article.parse_seconds.count(step="readability") == 1
+    assert texts == ["Titre", "texte"]
+    assert nodes == [{"tag": "h3", "children": ["\ue000"]}, {"tag": "p", "children": ["\ue000"]}]
@@ -0,0 +1,297 @@
+import asyncio
+import pytest
+import article
+import feedrss
+import sources
+import telegram_bot
+
+
+@pytest.fixture
+def progress(monkeypatch):
+    """Record the entry state updates instead of writing them to MongoDB"""
+    calls = []
+    for name in ("save_progress", "record_failure", "add_sent_chat", "finish_entry"):
+        monkeypatch.setattr(feedrss.db, name, lambda *args, name=name: calls.append((name, *args)))
+    monkeypatch.setattr(feedrss.db, "get_page", lambda content_hash: None)
+    monkeypatch.setattr(feedrss.db, "save_page", lambda content_hash, page: None)
+    monkeypatch.setattr(feedrss, "get_chats", lambda: ["1", "2"])
+    return calls
+
+
+def stored(state, **artifacts):
+    return {
+        "source": "lapresse", "key": "lapresse:https://example.com/a", "link": "https://example.com/a",
+        "title": "Titre", "summary": "Resume", "published": "2024-11-23T14:13:45-05:00", "image": None,
+        "state": state, "attempts": 0, "sent_chats": ["1"] if state == "published" else [],
+        "artifacts": artifacts,
+    }
+
+
+def test_process_entry_resumes_after_last_completed_stage(monkeypatch, progress):
+    async def no_fetch(self, url):
+        raise AssertionError("fetched again")
+
+    async def send(chat_id, entity, caption, photo=None):
+        return object()
+
+    monkeypatch.setattr(sources.Source, "aget_content", no_fetch)
+    monkeypatch.setattr(article, "create_page", lambda title, content: {"url": "https://telegra.ph/a", "path": "a"})
+    monkeypatch.setattr(telegram_bot, "send_to_chat", send)
+    doc = stored("translated", title="标题", summary="摘要", translated_text="<p>文本</p>")
+
+    assert asyncio.run(feedrss.process_entry(doc)) is True
+    assert progress[0] == ("save_progress", doc["key"], "published", {"url": "https://telegra.ph/a", "path": "a"})
+    assert sorted(progress[1:3]) == [("add_sent_chat", doc["key"], "1"), ("add_sent_chat", doc["key"], "2")]
+    assert progress[3:] == [("finish_entry", doc["key"], "sent", feedrss.DROPPED_ARTIFACTS)]
+
+
+def test_send_stage_skips_chats_already_sent_and_records_failures(monkeypatch, progress):
+    sent = []
+
+    async def send(chat_id, entity, caption, photo=None):
+        sent.append(chat_id)
+        return None
+
+    monkeypatch.setattr(telegram_bot, "send_to_chat", send)
+    item = feedrss.item_of(stored("published", title="标题", summary="摘要", url="https://telegra.ph/a"))
+
+    assert asyncio.run(feedrss.send_stage(item)) is False
+    assert sent == ["2"]
+    assert progress == [("record_failure", item["key"], "send: 2")]
+
+
+def test_failed_stage_is_recorded_and_not_persisted(monkeypatch, progress):
+    async def no_content(self, url):
+        return None
+
+    monkeypatch.setattr(sources.Source, "aget_content", no_content)
+    item = feedrss.item_of(stored("new"))
+
+    with pytest.raises(ValueError):
+        asyncio.run(feedrss.STAGES[0].func(item))
+    assert [call[0] for call in progress] == ["record_failure"]
+    assert item["state"] == "new"
+
+
+def test_early_post_sends_placeholder_page_then_edits_it(monkeypatch, progress):
+    events = []
+
+    async def headline(text, source_lang, target_lang):
+        return text.upper()
+
+    async def body(texts, lang):
+        events.append("body")
+        return [text.upper() for text in texts]
+
+    def create_page(title, content):
+        events.append(("create", title))
+        return {"url": "https://telegra.ph/a", "path": "a"}
+
+    def edit_page(path, title, content):
+        events.append(("edit", path, content))
+        return {"url": "https://telegra.ph/a", "path": path}
+
+    async def send(chat_id, entity, caption, photo=None):
+        events.append(("send", chat_id))
+        return object()
+
+    monkeypatch.setattr(feedrss, "early_post", True)
+    monkeypatch.setattr(feedrss, "atranslate_text", headline)
+    monkeypatch.setattr(article, "atranslate_texts", body)
+    monkeypatch.setattr(article, "create_page", create_page)
+    monkeypatch.setattr(article, "edit_page", edit_page)
+    monkeypatch.setattr(telegram_bot, "send_to_chat", send)
+    doc = stored("parsed", nodes=[{"tag": "p", "children": [article.TEXT_SLOT]}], texts=["texte"])
+
+    assert asyncio.run(feedrss.process_entry(doc)) is True
+    steps = [event for event in events if event != "body"]
+    assert steps[0] == ("create", "TITRE")
+    assert sorted(steps[1:3]) == [("send", "1"), ("send", "2")]
+    assert steps[3:] == [("edit", "a", [{"tag": "p", "children": ["TEXTE"]}])]
+
+
+def test_entries_parsed_into_html_templates_are_still_published(monkeypatch, progress):
+    async def translate(text, source_lang, target_lang):
+        return text.upper()
+
+    async def body(texts, lang):
+        return [text.upper() for text in texts]
+
+    pages = []
+    monkeypatch.setattr(feedrss, "atranslate_text", translate)
+    monkeypatch.setattr(article, "atranslate_texts", body)
+    monkeypatch.setattr(article, "create_page", lambda title, content: pages.append(content) or {
+        "url": "https://telegra.ph/a", "path": "a"})
+    item = feedrss.item_of(stored("parsed", parts=["<p>", " &amp; co</p>"], texts=["texte"]))
+
+    item = asyncio.run(feedrss.STAGES[3].func(item))
+    asyncio.run(feedrss.STAGES[4].func(item))
+    assert pages == [[{"tag": "p", "children": ["TEXTE & co"]}]]
+
+
+def test_updated_entry_translates_changed_paragraphs_and_edits_its_page(monkeypatch, progress):
+    translated, edited = [], []
+
+    async def translate(text, source_lang, target_lang):
+        translated.append(text)
+        return text.upper()
+
+    async def body(texts, lang):
+        translated.extend(texts)
+        return [text.upper() for text in texts]
+
+    async def send(chat_id, entity, caption, photo=None):
+        raise AssertionError("sent again")
+
+    monkeypatch.setattr(feedrss, "early_post", True)
+    monkeypatch.setattr(feedrss, "atranslate_text", translate)
+    monkeypatch.setattr(article, "atranslate_texts", body)
+    monkeypatch.setattr(article, "create_page", lambda title, content: pytest.fail("page created"))
+    monkeypatch.setattr(article, "edit_page", lambda path, title, content: edited.append((path, title, content)) or {
+        "url": "https://telegra.ph/a", "path": path})
+    monkeypatch.setattr(telegram_bot, "send_to_chat", send)
+    previous = {"texts": ["un", "deux"], "translated_texts": ["一", "二"], "title": "Titre", "summary": "Ancien",
+                "translated_title": "标题", "translated_summary": "旧"}
+    nodes = [{"tag": "p", "children": [article.TEXT_SLOT]}] * 3
+    doc = {**stored("parsed", nodes=nodes, texts=["un", "trois", "deux"], url="https://telegra.ph/a", path="a",
+                    previous=previous), "sent_chats": ["1", "2"]}
+
+    assert asyncio.run(feedrss.process_entry(doc)) is True
+    assert sorted(translated) == ["Resume", "trois"]
+    assert edited == [("a", "标题", [{"tag": "p", "children": [text]} for text in ("一", "TROIS", "二")])]
+    assert progress[0][3]["translated_texts"] == ["一", "TROIS", "二"]
+    assert progress[0][3]["original"] == {"title": "Titre", "summary": "Resume"}
+    assert progress[-1] == ("finish_entry", doc["key"], "sent", feedrss.DROPPED_ARTIFACTS)
+
+
+def test_run_worker_drains_queue_releases_sent_entries_and_backs_off_failed_ones(monkeypatch):
+    queue = [stored("new"), {**stored("parsed"), "key": "lapresse:https://example.com/b", "attempts": 1}]
+    claims, released, deferred = [], [], []
+
+    def claim_entry(worker, states, max_attempts, lease_seconds, names):
+        claims.append((worker, tuple(states), names))
+        return queue.pop(0) if queue else None
+
+    async def process_entry(doc):
+        await asyncio.sleep(0)
+        return doc["state"] == "new"
+
+    monkeypatch.setattr(feedrss.db, "claim_entry", claim_entry)
+    monkeypatch.setattr(feedrss.db, "release_entry", lambda key, worker: released.append(key))
+    monkeypatch.setattr(feedrss.db, "renew_lease", lambda key, worker, seconds: deferred.append((key, seconds)))
+    monkeypatch.setattr(feedrss.db, "revert_update", lambda key, max_attempts: False)
+    monkeypatch.setattr(feedrss, "process_entry", process_entry)
+    monkeypatch.setattr(feedrss, "worker_id", "w1")
+    monkeypatch.setattr(feedrss, "workers", 2)
+    monkeypatch.setattr(feedrss, "retry_backoff", 60)
+
+    assert asyncio.run(feedrss.run_worker(asyncio.Event(), drain=True)) == 1
+    assert released == ["lapresse:https://example.com/a"]
+    assert deferred == [("lapresse:https://example.com/b", 120)]
+    assert claims[0] == ("w1", tuple(feedrss.STATES[:-1]), ["lapresse"])
+
+
+def test_process_claimed_abandons_entry_when_lease_is_lost(monkeypatch):
+    released = []
+
+    async def process_entry(doc):
+        await asyncio.sleep(5)
+        return True
+
+    monkeypatch.setattr(feedrss.db, "renew_lease", lambda key, worker, seconds: False)
+    monkeypatch.setattr(feedrss.db, "release_entry", lambda key, worker: released.append(key))
+    monkeypatch.setattr(feedrss, "process_entry", process_entry)
+    monkeypatch.setattr(feedrss, "lease_seconds", 0.03)
+
+    assert asyncio.run(feedrss.process_claimed(stored("new"))) is False
+    assert released == ["lapresse:https://example.com/a"]
+
+
+def test_failed_entry_is_not_claimed_again_before_its_backoff(monkeypatch):
+    from datetime import datetime, timedelta, timezone
+    from benchmarks.memorydb import MemoryCollection
+    collection = MemoryCollection()
+    monkeypatch.setattr(feedrss.db, "_entries_indexed", False)
+    monkeypatch.setattr(feedrss.db, "get_collection", lambda name="rss": collection)
+    entry = {"source": "lapresse", "link": "https://example.com/a", "published": "2024-11-23T14:13:45-05:00"}
+    feedrss.db.save_entries([entry])
+    feedrss.db.start_entries([entry])
+
+    async def process_entry(doc):
+        feedrss.db.record_failure(doc["key"], "translate: backend down")
+        raise ValueError("backend down")
+
+    monkeypatch.setattr(feedrss, "process_entry", process_entry)
+    monkeypatch.setattr(feedrss, "retry_backoff", 60)
+    monkeypatch.setattr(feedrss, "worker_id", "w1")
+    doc = feedrss.db.claim_entry("w1", feedrss.STATES[:-1], 3, 300)
+
+    assert asyncio.run(feedrss.process_claimed(doc)) is False
+    assert feedrss.db.claim_entry("w2", feedrss.STATES[:-1], 3, 300) is None
+    lease_until = collection.docs[0]["lease_until"]
+    assert timedelta(seconds=55) < lease_until - datetime.now(timezone.utc) <= timedelta(seconds=60)
+
+    collection.docs[0]["lease_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    assert feedrss.db.claim_entry("w2", feedrss.STATES[:-1], 3, 300)["attempts"] == 1
+
+
+def test_inline_path_claims_entries_and_skips_leased_ones(monkeypatch):
+    from benchmarks.memorydb import MemoryCollection
+    collection = MemoryCollection()
+    monkeypatch.setattr(feedrss.db, "_entries_indexed", False)
+    monkeypatch.setattr(feedrss.db, "get_collection", lambda name="rss": collection)
+    entries = [{"source": "lapresse", "link": f"https://example.com/{name}",
+                "published": f"2024-11-23T14:1{index}:45-05:00"} for index, name in enumerate("abc")]
+    feedrss.db.save_entries(entries)
+    feedrss.db.start_entries(entries)
+    busy = feedrss.db.claim_entry("w2", feedrss.STATES[:-1], 3, 300)
+    sent = []
+
+    async def send_stage(item):
+        sent.append(item["key"])
+        if item["key"].endswith("b"):
+            feedrss.db.finish_entry(item["key"], "sent", feedrss.DROPPED_ARTIFACTS)
+            return True
+        return False
+
+    monkeypatch.setattr(feedrss, "STAGES", [])
+    monkeypatch.setattr(feedrss, "send_stage", send_stage)
+    monkeypatch.setattr(feedrss, "worker_id", "w1")
+    monkeypatch.setattr(feedrss, "retry_backoff", 60)
+
+    docs = feedrss.claim_entries("lapresse")
+    assert [doc["key"] for doc in docs] == ["lapresse:https://example.com/b", "lapresse:https://example.com/c"]
+    assert asyncio.run(feedrss.process_entries(docs)) == [True, False]
+    assert sent == [doc["key"] for doc in docs]
+    leases = {doc["key"]: doc.get("lease_owner") for doc in collection.docs}
+    assert leases == {busy["key"]: "w2", docs[0]["key"]: None, docs[1]["key"]: "w1"}
+    assert feedrss.claim_entries("lapresse") == []
+
+
+def test_update_failing_its_last_attempt_stays_sent(monkeypatch):
+    from benchmarks.memorydb import MemoryCollection
+    collection = MemoryCollection()
+    monkeypatch.setattr(feedrss.db, "_entries_indexed", False)
+    monkeypatch.setattr(feedrss.db, "get_collection", lambda name="rss": collection)
+    entry = {"source": "lapresse", "link": "https://example.com/a", "published": "2024-11-23T14:13:45-05:00"}
+    artifacts = {"texts": ["texte"], "translated_texts": ["文本"], "title": "标题", "summary": "摘要",
+                 "original": {"title": "a", "summary": "resume"}, "url": "https://telegra.ph/a", "path": "a"}
+    feedrss.db.save_entries([entry])
+    feedrss.db.start_entries([entry])
+    feedrss.db.save_progress("lapresse:https://example.com/a", "translated", artifacts)
+    feedrss.db.finish_entry("lapresse:https://example.com/a", "sent")
+    feedrss.db.restart_updated([entry])
+
+    async def process_entry(doc):
+        feedrss.db.record_failure(doc["key"], "translate: backend down")
+        raise ValueError("backend down")
+
+    monkeypatch.setattr(feedrss, "process_entry", process_entry)
+    monkeypatch.setattr(feedrss, "worker_id", "w1")
+    monkeypatch.setattr(feedrss, "max_attempts", 1)
+    doc = feedrss.db.claim_entry("w1", feedrss.STATES[:-1], 1, 300)
+
+    assert asyncio.run(feedrss.process_claimed(doc)) is False
+    stored_doc = collection.docs[0]
+    assert (stored_doc["state"], stored_doc["artifacts"]) == ("sent", artifacts)
+    assert stored_doc.get("lease_owner") is None
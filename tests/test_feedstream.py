@@ -0,0 +1,82 @@
+import os
+import feedstream
+import rssutils
+import sources
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+ATOM_FEED = b"""<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom"><title>t</title>
+<entry><title type="html">Caf&#233; &amp;amp; co</title><link rel="alternate" href="https://example.com/c"/>
+<link rel="enclosure" type="image/png" href="https://example.com/c.png"/><id>tag:example.com,2024:c</id>
+<updated>2024-11-23T20:00:00Z</updated><published>2024-11-23T19:13:45-05:00</published>
+<summary>Resume &lt;b&gt;brut&lt;/b&gt;</summary></entry></feed>"""
+
+HTML_FEED = b"""<?xml version="1.0"?><rss version="2.0"><channel><item>
+<title>A &amp; B</title><link>https://example.com/a</link>
+<description><![CDATA[<p>Texte &amp; <b>gras</b><script>x()</script></p>]]></description>
+<pubDate>Sat, 23 Nov 2024 19:13:45 GMT</pubDate></item></channel></rss>"""
+
+
+def feed(count):
+    items = "".join(f"<item><title>Titre {i}</title><link>https://example.com/{i}</link>"
+                    f"<description>Resume</description><pubDate>Sat, 23 Nov 2024 14:{59 - i:02d}:00 -0500</pubDate></item>" for i in range(count))
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>{items}</channel></rss>'.encode()
+
+
+def test_streamed_entries_match_feedparser():
+    with open(os.path.join(FIXTURES, "lapresse_rss.xml"), "rb") as f:
+        lapresse = f.read()
+    source = sources.Source(name="test", rss_url="https://example.com/rss")
+    for data in (lapresse, HTML_FEED, ATOM_FEED, feed(3)):
+        assert source.stream_rss(data)["entries"] == source.parse_rss(data)["entries"]
+    assert sources.get_source("lapresse").stream_rss(lapresse) == sources.get_source("lapresse").parse_rss(lapresse)
+
+
+def test_read_delta_stops_after_first_unchanged_batch():
+    source = sources.Source(name="test", rss_url="https://example.com/rss")
+    known = source.parse_rss(feed(30))["entries"][7:]
+    stored = {rssutils.entry_key(entry): rssutils.entry_hash(entry) for entry in known}
+    lookups = []
+
+    def lookup(entries):
+        lookups.append(len(entries))
+        return {key: stored[key] for key in map(rssutils.entry_key, entries) if key in stored}
+
+    entries = list(feedstream.read_delta(map(source.to_entry, feedstream.iter_entries(feed(30))), lookup, size=5))
+    assert lookups == [5, 5, 5]
+    assert [entry["title"] for entry in entries] == [f"Titre {i}" for i in range(15)]
+
+
+def test_stream_rss_falls_back_to_feedparser_on_malformed_xml():
+    source = sources.Source(name="test", rss_url="https://example.com/rss")
+    data = feed(2).replace(b"</channel>", b"<broken></channel>")
+    assert [entry["title"] for entry in source.stream_rss(data, lookup=lambda entries: {})["entries"]] == [
+        "Titre 0", "Titre 1"]
+
+
+def test_changed_entry_after_first_unchanged_batch_is_found(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    import feedrss
+    from benchmarks.memorydb import MemoryDatabase
+    database = MemoryDatabase()
+    monkeypatch.setattr(feedrss.db, "_entries_indexed", False)
+    monkeypatch.setattr(feedrss.db, "get_collection", lambda name="rss": database[name])
+    source = sources.Source(name="test", rss_url="https://example.com/rss")
+    data = feed(20)
+    changed = data.replace(b"<title>Titre 15</title>", b"<title>Titre 15 (mis a jour)</title>")
+    response = SimpleNamespace(content=changed, headers={})
+
+    async def aget_conditional(url, etag, last_modified):
+        return response, True
+
+    monkeypatch.setattr(sources.httpclient, "aget_conditional", aget_conditional)
+    monkeypatch.setattr(feedstream, "batch_size", 10)
+    restarted = []
+    monkeypatch.setattr(feedrss.db, "restart_updated", lambda entries: restarted.extend(entries) or 0)
+    for streaming in (False, True):
+        monkeypatch.setattr(sources, "streaming", streaming)
+        restarted.clear()
+        feedrss.db.save_entries(source.parse_rss(data)["entries"])
+        asyncio.run(feedrss.poll_source(source, process=False))
+        assert [entry["title"] for entry in restarted] == ["Titre 15 (mis a jour)"]
@@ -0,0 +1,53 @@
+import pytest
+from lxml import html
+from htmlrules import CLEANER_RULES, Rules, Selector, parse_selector
+
+
+def apply(rules, content):
+    body = rules.compile().apply(html.document_fromstring(content).body)
+    return html.tostring(body, encoding="unicode")[len("<body>"):-len("</body>")]
+
+
+def test_parse_selector():
+    assert parse_selector("div") == Selector(tag="div")
+    assert parse_selector("header#mainHeader") == Selector(tag="header", id="mainHeader")
+    assert parse_selector(".a.b") == Selector(classes=frozenset({"a", "b"}))
+    assert parse_selector("header h1") == Selector(tag="h1", ancestor=Selector(tag="header"))
+
+
+@pytest.mark.parametrize("text", ["", "div > p", "a[href]", "#a#b"])
+def test_parse_selector_rejects_unsupported(text):
+    with pytest.raises(ValueError):
+        parse_selector(text)
+
+
+def test_remove_keeps_tail_text():
+    rules = Rules(remove=["span.ad"])
+    assert apply(rules, '<p>a<span class="x ad">ad</span>b</p>') == "<p>ab</p>"
+
+
+def test_remove_descendant_only():
+    rules = Rules(remove=["header h1"])
+    assert apply(rules, "<h1>keep</h1><header><div><h1>drop</h1></div></header>") == \
+        "<h1>keep</h1><header><div></div></header>"
+
+
+def test_unwrap_and_rename_before_whitelist():
+    rules = Rules(rename={"h2": "h4", "span": "b"}, allowed_tags=frozenset({"p", "b", "h4"}))
+    assert apply(rules, "<div><h2>T</h2><p>x <span>y</span> <i>z</i></p></div>") == \
+        "<h4>T</h4><p>x <b>y</b> z</p>"
+
+
+def test_cleaner_rules():
+    content = ('<!-- c --><script>x()</script><style>p{}</style>'
+               '<p style="color:red" onclick="x()" class="k">t</p>'
+               '<a href="javascript:alert(1)">l</a><form><input name="q">f</form><blink>b</blink>')
+    assert apply(CLEANER_RULES, content) == '<p class="k">t</p><a>l</a>fb'
+
+
+def test_merge():
+    merged = Rules(remove=["aside"], allowed_tags=frozenset({"p", "b"}), rename={"span": "i"}).merge(
+        Rules(remove=["footer"], allowed_tags=frozenset({"p", "i"}), rename={"span": "b"}))
+    assert list(merged.remove) == ["aside", "footer"]
+    assert merged.allowed_tags == frozenset({"p"})
+    assert merged.rename == {"span": "b"}
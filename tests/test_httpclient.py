@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import httpclient
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Stub</title></channel></rss>"""
+ETAG = '"feed-v1"'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.client_address, dict(self.headers)))
+        if self.path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml; charset=utf-8")
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", "Sat, 23 Nov 2024 14:13:45 GMT")
+        self.send_header("Content-Length", str(len(FEED)))
+        self.end_headers()
+        self.wfile.write(FEED)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    asyncio.run(httpclient.aclose())
+    yield
+    asyncio.run(httpclient.aclose())
+
+
+def url(server, path="/feed"):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def test_get_conditional_full_then_not_modified(server):
+    response, changed = httpclient.get_conditional(url(server))
+    assert changed
+    assert response.content == FEED
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    response, changed = httpclient.get_conditional(url(server), etag, last_modified)
+    assert not changed
+    assert response is None
+    headers = server.requests[-1][2]
+    assert headers["If-None-Match"] == ETAG
+    assert headers["If-Modified-Since"] == last_modified
+
+
+def test_get_text_reuses_connection(server):
+    for _ in range(3):
+        assert httpclient.get_text(url(server)) == FEED.decode()
+    assert len({client for _, client, _ in server.requests}) == 1
+
+
+def test_get_text_error_returns_none(server):
+    assert httpclient.get_text(url(server, "/missing")) is None
+
+
+def test_async_fetches_share_pool(server):
+    async def run():
+        texts = await asyncio.gather(*(httpclient.aget_text(url(server)) for _ in range(3)))
+        texts.append(await httpclient.aget_text(url(server)))
+        response, changed = await httpclient.aget_conditional(url(server), ETAG)
+        await httpclient.aclose()
+        return texts, response, changed
+
+    texts, response, changed = asyncio.run(run())
+    assert texts == [FEED.decode()] * 4
+    assert response is None and not changed
+    assert len({client for _, client, _ in server.requests}) <= 3
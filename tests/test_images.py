@@ -0,0 +1,50 @@
+import asyncio
+import io
+import os
+import time
+import pytest
+import images
+
+
+def test_image_cache_evicts_least_recently_used(tmp_path):
+    cache = images.ImageCache(str(tmp_path), max_bytes=250)
+    cache.set("https://example.com/a.jpg", b"a" * 100)
+    cache.set("https://example.com/b.jpg", b"b" * 100)
+    past = time.time() - 60
+    os.utime(cache.path("https://example.com/b.jpg"), (past, past))
+    assert cache.get("https://example.com/a.jpg") == b"a" * 100
+
+    cache.set("https://example.com/c.jpg", b"c" * 100)
+    assert cache.get("https://example.com/b.jpg") is None
+    assert cache.get("https://example.com/a.jpg") is not None
+    assert images.ImageCache(str(tmp_path), 250)._size == 200
+
+
+def test_aget_image_downloads_once(tmp_path, monkeypatch):
+    downloads = []
+
+    async def aget_bytes(url):
+        downloads.append(url)
+        return b"image"
+
+    monkeypatch.setattr(images, "_cache", images.ImageCache(str(tmp_path), 1024))
+    monkeypatch.setattr(images.httpclient, "aget_bytes", aget_bytes)
+
+    async def run():
+        return [await images.aget_image("https://example.com/a.jpg") for _ in range(3)]
+
+    assert asyncio.run(run()) == [b"image"] * 3
+    assert downloads == ["https://example.com/a.jpg"]
+
+
+def test_fit_photo_downscales_large_images(monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    output = io.BytesIO()
+    Image.new("RGB", (400, 100), "red").save(output, format="PNG")
+    monkeypatch.setattr(images, "photo_max_side", 200)
+
+    small = images.fit_photo(output.getvalue())
+    with Image.open(io.BytesIO(small)) as image:
+        assert image.size == (200, 50)
+        assert image.format == "JPEG"
+    assert images.fit_photo(small) is small
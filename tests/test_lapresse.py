@@ -0,0 +1,76 @@
+import os
+import re
+import pytest
+from telegraph.utils import html_to_nodes
+import lapresse as lp
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture
+def article():
+    with open(os.path.join(FIXTURES, "lapresse_article.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_prepare_article_keeps_telegraph_content_only(article):
+    parts, texts = lp.prepare_article(article)
+    content = lp.render_texts(parts, texts)
+    for removed in ["mainHeader", "socialShare", "Partager", "Marie Tremblay", "Grand Montréal",
+                    "Un incendie ravage", "Un autre article", "© La Presse", "<script", "<style",
+                    "<noscript", "<div", "<section", "pixel.gif", "onclick"]:
+        assert removed not in content
+    assert "<h4>" not in content
+    assert "<b class=" not in content
+    assert "<b>Véronique Dubuc</b>" in content
+    assert '<img src="https://mobile-img.lpcdn.ca/' in content
+    assert "<li>Rue Notre-Dame Est fermée</li>" in content
+
+
+def test_prepare_article_extracts_stripped_texts(article):
+    parts, texts = lp.prepare_article(article)
+    assert len(parts) == len(texts) + 1
+    assert "Une centaine de pompiers ont été déployés dans la nuit de vendredi à samedi." in texts
+    assert "Les pompiers sur les lieux de l’incendie. PHOTO ARCHIVES LA PRESSE" in texts
+    assert "Une enquête ouverte" in texts
+    assert all(text == text.strip() and text for text in texts)
+
+
+def normalized(nodes):
+    """Telegraph nodes with whitespace collapsed and blank texts dropped, as Telegraph shows them"""
+    result = []
+    for node in nodes:
+        if isinstance(node, str):
+            if text := re.sub(r"\s+", " ", node).strip():
+                result.append(text)
+        else:
+            result.append({**node, "children": normalized(node.get("children", []))})
+    return result
+
+
+def test_prepare_article_matches_baseline_output(article):
+    # Output of the BeautifulSoup implementation, which unwrapped h1, h2 and span
+    with open(os.path.join(FIXTURES, "lapresse_article_telegraph.html"), encoding="utf-8") as f:
+        baseline = f.read()
+    parts, texts = lp.prepare_article(article)
+    assert normalized(html_to_nodes(lp.render_texts(parts, texts))) == normalized(html_to_nodes(baseline))
+
+
+def test_render_texts_escapes_translations(article):
+    parts, texts = lp.prepare_article(article)
+    assert "&amp; une enquête" in lp.render_texts(parts, texts)
+    translated = lp.render_texts(parts, ["<T>"] * len(texts))
+    assert "<T>" not in translated
+    assert "&lt;T&gt;" in translated
+
+
+def test_string_wrappers_match_single_tree_pipeline(article):
+    parts, texts = lp.prepare_article(article)
+    prepared = lp.prepare_telegraph_content(lp.get_readability(article))
+    assert prepared == lp.render_texts(parts, texts)
+
+
+def test_translate_content_replaces_text_nodes(monkeypatch):
+    monkeypatch.setattr(lp, "translate_texts", lambda texts: [text.upper() for text in texts])
+    translated = lp.translate_content("<p>  un <b>deux</b> trois </p>")
+    assert translated == "<p>  UN <b>DEUX</b> TROIS </p>"
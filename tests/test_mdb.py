@@ -0,0 +1,131 @@
+import mdb
+import rssutils
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.indexes = []
+        self.operations = None
+
+    def create_index(self, key, **kwargs):
+        self.indexes.append((key, kwargs))
+
+    def find(self, query, projection=None):
+        keys = set(query["key"]["$in"])
+        return [doc for doc in self.docs if doc["key"] in keys]
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations = operations
+        return len(operations)
+
+
+def use_collection(monkeypatch, collection):
+    monkeypatch.setattr(mdb, "_entries_indexed", False)
+    monkeypatch.setattr(mdb, "get_collection", lambda name="rss": collection)
+
+
+def test_get_known_hashes_queries_entry_keys(monkeypatch):
+    entry = {"source": "s", "link": "https://example.com/a"}
+    collection = FakeCollection([{"key": rssutils.entry_key(entry), "hash": "h"}])
+    use_collection(monkeypatch, collection)
+
+    assert mdb.get_known_hashes([entry, {"source": "s", "link": "https://example.com/b"}]) == {
+        "s:https://example.com/a": "h"}
+    assert ("key", {"unique": True}) in collection.indexes
+
+
+def test_save_entries_bulk_upserts_each_key_once(monkeypatch):
+    collection = FakeCollection()
+    use_collection(monkeypatch, collection)
+    entry = {"source": "s", "link": "https://example.com/a", "title": "A"}
+
+    assert mdb.save_entries([entry, {**entry, "link": "https://example.com/a#top"}]) == 1
+    operation = collection.operations[0]
+    assert operation._filter == {"key": "s:https://example.com/a"}
+    assert operation._doc["$set"]["hash"] == rssutils.entry_hash(entry)
+    assert operation._upsert is True
+    assert mdb.save_entries([]) is None
+
+
+def test_claim_entry_leases_each_entry_to_one_worker(monkeypatch):
+    from datetime import datetime, timedelta, timezone
+    from benchmarks.memorydb import MemoryCollection
+    collection = MemoryCollection()
+    use_collection(monkeypatch, collection)
+    entries = [{"source": "s", "link": f"https://example.com/{name}", "published": published}
+               for name, published in (("b", "2024-11-23T15:00:00"), ("a", "2024-11-23T14:00:00"))]
+    mdb.save_entries(entries)
+    mdb.start_entries(entries)
+    states = ["new", "fetched"]
+
+    first = mdb.claim_entry("w1", states, 3, 60, ["s"])
+    second = mdb.claim_entry("w2", states, 3, 60, ["s"])
+    assert first["key"] == "s:https://example.com/a"
+    assert second["key"] == "s:https://example.com/b"
+    assert mdb.claim_entry("w3", states, 3, 60) is None
+
+    # An expired lease is reclaimed and its former owner can no longer renew it
+    for doc in collection.docs:
+        if doc["key"] == first["key"]:
+            doc["lease_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    assert mdb.claim_entry("w3", states, 3, 60)["key"] == first["key"]
+    assert mdb.renew_lease(first["key"], "w1", 60) is False
+    assert mdb.renew_lease(first["key"], "w3", 60) is True
+
+    mdb.release_entry(second["key"], "w2")
+    assert mdb.claim_entry("w1", states, 3, 60, ["other"]) is None
+    assert mdb.claim_entry("w1", states, 3, 60, ["s"])["key"] == second["key"]
+
+
+def test_restart_updated_keeps_page_and_previous_translation(monkeypatch):
+    from benchmarks.memorydb import MemoryCollection
+    collection = MemoryCollection()
+    use_collection(monkeypatch, collection)
+    entries = [{"source": "s", "link": f"https://example.com/{name}", "title": name} for name in "abc"]
+    mdb.save_entries(entries)
+    mdb.start_entries(entries)
+    artifacts = {"texts": ["texte"], "translated_texts": ["文本"], "title": "标题", "summary": "摘要",
+                 "original": {"title": "a", "summary": "resume"}, "url": "https://telegra.ph/a", "path": "a"}
+    mdb.save_progress("s:https://example.com/a", "translated", artifacts)
+    mdb.finish_entry("s:https://example.com/a", "sent")
+    mdb.save_progress("s:https://example.com/b", "translated", artifacts)
+    mdb.finish_entry("s:https://example.com/c", "sent")
+
+    assert mdb.restart_updated(entries) == 1
+    doc = collection.find_one({"key": "s:https://example.com/a"})
+    assert doc["state"] == "new"
+    assert doc["artifacts"] == {"url": "https://telegra.ph/a", "path": "a", "previous": {
+        "texts": ["texte"], "translated_texts": ["文本"], "title": "a", "summary": "resume",
+        "translated_title": "标题", "translated_summary": "摘要"}}
+    assert collection.find_one({"key": "s:https://example.com/b"})["state"] == "translated"
+    assert collection.find_one({"key": "s:https://example.com/c"})["state"] == "sent"
+
+
+def test_failed_update_reverts_to_the_sent_version(monkeypatch):
+    from benchmarks.memorydb import MemoryCollection
+    collection = MemoryCollection()
+    use_collection(monkeypatch, collection)
+    entries = [{"source": "s", "link": f"https://example.com/{name}", "title": name} for name in "ab"]
+    mdb.save_entries(entries)
+    mdb.start_entries(entries)
+    artifacts = {"texts": ["texte"], "translated_texts": ["文本"], "title": "标题", "summary": "摘要",
+                 "original": {"title": "a", "summary": "resume"}, "url": "https://telegra.ph/a", "path": "a"}
+    for key in ("s:https://example.com/a", "s:https://example.com/b"):
+        mdb.save_progress(key, "translated", artifacts)
+        mdb.finish_entry(key, "sent")
+    assert mdb.restart_updated(entries) == 2
+
+    mdb.record_failure("s:https://example.com/a", "translate: backend down")
+    assert mdb.revert_update("s:https://example.com/a", 2) is False
+    mdb.record_failure("s:https://example.com/a", "translate: backend down")
+    assert mdb.revert_update("s:https://example.com/a", 2) is True
+    doc = collection.find_one({"key": "s:https://example.com/a"})
+    assert (doc["state"], doc["attempts"], doc["artifacts"]) == ("sent", 0, artifacts)
+    assert "sent_version" not in doc
+
+    mdb.finish_entry("s:https://example.com/b", "sent", ["previous"])
+    assert "sent_version" not in collection.find_one({"key": "s:https://example.com/b"})
+    mdb.record_failure("s:https://example.com/b", "send: 1")
+    mdb.record_failure("s:https://example.com/b", "send: 1")
+    assert mdb.revert_update("s:https://example.com/b", 2) is False
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import urllib.request
+import pytest
+import metrics
+import pipeline
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram("test_seconds", "Test durations", buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="fetch")
+    histogram.observe(0.5, stage="fetch")
+    histogram.observe(5, stage="fetch")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP test_seconds Test durations", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{stage="fetch",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="fetch",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="fetch",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="fetch"} 3' in lines
+    assert histogram.total(stage="fetch") == pytest.approx(5.55)
+
+
+def test_counter_and_snapshot():
+    registry = metrics.Registry()
+    counter = registry.counter("test_total", "Test counter")
+    counter.inc(backend="gpu1", kind="prompt")
+    counter.inc(41, backend="gpu1", kind="prompt")
+
+    assert counter.value(kind="prompt", backend="gpu1") == 42
+    assert registry.counter("test_total") is counter
+    assert 'test_total{backend="gpu1",kind="prompt"} 42' in registry.render()
+    assert registry.snapshot()["test_total"]["samples"] == [
+        {"labels": {"backend": "gpu1", "kind": "prompt"}, "value": 42}]
+    with pytest.raises(ValueError):
+        registry.histogram("test_total")
+
+    registry.reset()
+    assert counter.value(backend="gpu1", kind="prompt") == 0
+
+
+def test_timed_observes_sync_and_async_functions_even_when_they_raise():
+    histogram = metrics.Registry().histogram("test_seconds")
+
+    @metrics.timed(histogram, op="sync")
+    def fail():
+        raise ValueError("boom")
+
+    @metrics.timed(histogram, op="async")
+    async def work():
+        return "done"
+
+    with pytest.raises(ValueError):
+        fail()
+    assert asyncio.run(work()) == "done"
+    assert histogram.count(op="sync") == 1
+    assert histogram.count(op="async") == 1
+
+
+def test_pipeline_records_stage_durations_and_failures():
+    metrics.REGISTRY.reset()
+
+    async def double(value):
+        if value == 2:
+            raise ValueError("boom")
+        return value * 2
+
+    async def sink(value):
+        return value
+
+    stages = [pipeline.Stage("double", double, 2)]
+    assert asyncio.run(pipeline.run_pipeline([1, 2, 3], stages, sink)) == [2, None, 6]
+    assert pipeline.stage_seconds.count(stage="double") == 3
+    assert pipeline.stage_failures.value(stage="double") == 1
+
+
+def test_serve_and_dump(tmp_path):
+    metrics.REGISTRY.reset()
+    metrics.counter("vocnews_test_total", "Test counter").inc()
+    server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            body = response.read().decode()
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert "vocnews_test_total 1" in body
+    finally:
+        server.shutdown()
+
+    metrics.dump(str(tmp_path / "metrics.json"))
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data["metrics"]["vocnews_test_total"]["samples"] == [{"labels": {}, "value": 1}]
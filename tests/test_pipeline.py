@@ -0,0 +1,65 @@
+import asyncio
+import random
+from pipeline import Stage, run_pipeline
+
+
+def test_run_pipeline_delivers_in_order():
+    sent = []
+
+    async def slow(value):
+        await asyncio.sleep(random.random() / 100)
+        return value * 2
+
+    async def sink(value):
+        sent.append(value)
+        return value
+
+    results = asyncio.run(run_pipeline(
+        list(range(20)), [Stage("a", slow, 4), Stage("b", slow, 3)], sink, queue_size=2))
+    assert sent == [i * 4 for i in range(20)]
+    assert results == sent
+
+
+def test_run_pipeline_overlaps_items():
+    in_flight = 0
+    peak = 0
+
+    async def stage(value):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return value
+
+    async def sink(value):
+        return value
+
+    asyncio.run(run_pipeline(list(range(10)), [Stage("a", stage, 3)], sink))
+    assert peak == 3
+
+
+def test_run_pipeline_drops_failed_items():
+    sent = []
+
+    async def stage(value):
+        if value == 2:
+            raise ValueError("boom")
+        return value
+
+    async def sink(value):
+        if value == 4:
+            raise ValueError("boom")
+        sent.append(value)
+        return True
+
+    results = asyncio.run(run_pipeline(list(range(6)), [Stage("a", stage, 2)], sink))
+    assert sent == [0, 1, 3, 5]
+    assert results == [True, True, None, True, None, True]
+
+
+def test_run_pipeline_empty():
+    async def sink(value):
+        return value
+
+    assert asyncio.run(run_pipeline([], [], sink)) == []
@@ -1,7 +1,8 @@
 
 import pytest
 from datetime import datetime, timedelta
-from src.rssutils import get_last_entries, get_new_entries
+from src.rssutils import (get_last_entries, get_new_entries, normalize_link, entry_key,
+                          entry_hash, diff_entries)
 
 
 @pytest.fixture
@@ -119,3 +120,29 @@ def test_get_new_entries_with_overlap(sample_entries):
     assert result[0]["title"] == "Article 3"
     assert result[1]["title"] == "New Article 1"
     assert result[2]["title"] == "New Article 2"
+
+
+def test_normalize_link_drops_tracking_and_fragment():
+    url = "HTTPS://WWW.LaPresse.ca:443/actualites/a.php/?utm_source=rss&b=2&a=1#comments"
+    assert normalize_link(url) == "https://www.lapresse.ca/actualites/a.php?a=1&b=2"
+
+
+def test_entry_key_prefers_guid_and_normalizes():
+    entry = {"source": "lapresse", "link": "https://example.com/a?utm_medium=rss", "guid": None}
+    assert entry_key(entry) == "lapresse:https://example.com/a"
+    assert entry_key({**entry, "guid": "tag:example.com,2024:42"}) == "lapresse:tag:example.com,2024:42"
+
+
+def test_diff_entries_finds_new_updated_and_backdated():
+    old = {"source": "s", "link": "https://example.com/old", "title": "Old",
+           "published": "2024-11-23T10:00:00"}
+    edited = {"source": "s", "link": "https://example.com/edited", "title": "Edited",
+              "published": "2024-11-23T11:00:00"}
+    known = {entry_key(old): entry_hash(old), entry_key(edited): entry_hash(edited)}
+    backdated = {"source": "s", "link": "https://example.com/late", "title": "Late",
+                 "published": "2024-11-20T08:00:00"}
+    entries = [old, {**edited, "title": "Edited again"}, backdated, backdated]
+
+    new, updated = diff_entries(entries, known)
+    assert new == [backdated]
+    assert [entry["title"] for entry in updated] == ["Edited again"]
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from scheduler import Schedule, parse_hours, poll_forever
+
+
+@pytest.fixture
+def schedule():
+    return Schedule(min_interval=10, max_interval=100, backoff=2, jitter=0,
+                    night_hours=(0, 6), night_factor=3, timezone="UTC")
+
+
+def test_parse_hours():
+    assert parse_hours("0-6") == (0, 6)
+    assert parse_hours("22-5") == (22, 5)
+    assert parse_hours("") is None
+
+
+def test_next_interval_backs_off_and_resets(schedule):
+    assert schedule.next_interval(10, 0) == 20
+    assert schedule.next_interval(80, 0) == 100
+    assert schedule.next_interval(100, -1) == 100
+    assert schedule.next_interval(100, 3) == 10
+
+
+def test_is_night_wraps_midnight(schedule):
+    assert schedule.is_night(datetime(2024, 11, 23, 3, tzinfo=timezone.utc))
+    assert not schedule.is_night(datetime(2024, 11, 23, 12, tzinfo=timezone.utc))
+    schedule.night_hours = (22, 5)
+    assert schedule.is_night(datetime(2024, 11, 23, 23, tzinfo=timezone.utc))
+    assert schedule.is_night(datetime(2024, 11, 23, 4, tzinfo=timezone.utc))
+    assert not schedule.is_night(datetime(2024, 11, 23, 6, tzinfo=timezone.utc))
+
+
+def test_delay_stretches_at_night_and_jitters(schedule):
+    assert schedule.delay(10, datetime(2024, 11, 23, 3, tzinfo=timezone.utc)) == 30
+    assert schedule.delay(10, datetime(2024, 11, 23, 12, tzinfo=timezone.utc)) == 10
+    schedule.jitter = 0.1
+    for _ in range(20):
+        assert 9 <= schedule.delay(10, datetime(2024, 11, 23, 12, tzinfo=timezone.utc)) <= 11
+
+
+def test_poll_forever_until_stopped():
+    schedule = Schedule(min_interval=0.01, max_interval=0.01, jitter=0, night_hours=None)
+    calls = []
+
+    async def run():
+        stop = asyncio.Event()
+
+        async def poll():
+            calls.append(len(calls))
+            if len(calls) == 2:
+                raise RuntimeError("feed down")
+            if len(calls) == 4:
+                stop.set()
+            return 1
+
+        await asyncio.wait_for(poll_forever("test", poll, schedule, stop), timeout=5)
+
+    asyncio.run(run())
+    assert calls == [0, 1, 2, 3]
@@ -0,0 +1,42 @@
+import json
+import pytest
+import skiplist
+from skiplist import classify
+
+
+@pytest.fixture(autouse=True)
+def fresh_glossary(monkeypatch):
+    monkeypatch.setattr(skiplist, "_glossary", None)
+
+
+@pytest.mark.parametrize("text", [
+    "2024", "45 %", "23/11/2024", "1 250 000 $", "(514) 555-1234", "—", "« »", "...",
+    "https://www.lapresse.ca/actualites", "www.example.com", "info@lapresse.ca",
+    "PHOTO ARCHIVES LA PRESSE", "PHOTO ROBERT SKINNER, LA PRESSE", "ILLUSTRATION : LA PRESSE",
+])
+def test_classify_keeps_non_translatable_texts(text):
+    assert classify(text, "French", "Simple Chinese") == text
+
+
+@pytest.mark.parametrize("text", [
+    "Le budget de la Ville adopté", "3,5 millions de dollars", "Photo du jour : un chat", "Montréal",
+])
+def test_classify_leaves_prose_to_the_model(text):
+    assert classify(text, "French", "Simple Chinese") is None
+
+
+def test_classify_translates_dates_times_and_glossary_for_chinese():
+    assert classify("samedi 23 novembre 2024", "French", "Simple Chinese") == "2024年11月23日"
+    assert classify("1er août 2024", "French", "Simple Chinese") == "2024年8月1日"
+    assert classify("14 h 30", "French", "Simple Chinese") == "14:30"
+    assert classify("Lisez aussi :", "French", "Simple Chinese") == "另请阅读"
+    assert classify("Lisez aussi", "French", "English") is None
+
+
+def test_glossary_file_extends_builtin(tmp_path, monkeypatch):
+    path = tmp_path / "glossary.json"
+    path.write_text(json.dumps({"Simple Chinese": {"Grand Montréal": "大蒙特利尔"}, "English": {"Lisez aussi": "Read also"}}))
+    monkeypatch.setattr(skiplist, "glossary_path", str(path))
+    assert classify("Grand  Montréal", "French", "Simple Chinese") == "大蒙特利尔"
+    assert classify("Lisez aussi", "French", "English") == "Read also"
+    assert classify("Lire aussi", "French", "Simple Chinese") == "另请阅读"
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import time
+import feedparser
+import pytest
+import sources
+from htmlrules import Rules
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+GMT_FEED = b"""<?xml version="1.0"?><rss version="2.0"><channel><item>
+<title>Titre</title><link>https://example.com/a</link><description>Resume</description>
+<pubDate>Sat, 23 Nov 2024 19:13:45 GMT</pubDate>
+<media:thumbnail xmlns:media="http://search.yahoo.com/mrss/" url="https://example.com/a.jpg"/>
+</item></channel></rss>"""
+
+
+@pytest.fixture
+def rss_data():
+    with open(os.path.join(FIXTURES, "lapresse_rss.xml"), "rb") as f:
+        return f.read()
+
+
+def test_lapresse_is_registered():
+    source = sources.get_source("lapresse")
+    assert source.name == "lapresse"
+    assert sources.registry["lapresse"] is source
+
+
+def test_load_sources(monkeypatch):
+    monkeypatch.setitem(sources.registry, "other", sources.Source(name="other", rss_url="https://example.com/rss"))
+    loaded = sources.load_sources("lapresse, other")
+    assert [source.name for source in loaded] == ["lapresse", "other"]
+
+
+def test_parse_rss_tags_entries_with_source(rss_data):
+    rss = sources.get_source("lapresse").parse_rss(rss_data)
+    assert rss["name"] == "lapresse"
+    assert len(rss["entries"]) == 3
+    entry = rss["entries"][0]
+    assert entry["source"] == "lapresse"
+    assert entry["published"] == "2024-11-23T14:13:45-05:00"
+    assert entry["image"].endswith("8faeb300f65a3207b2311f0f1c7170b6.jpg")
+
+
+def test_generic_source_falls_back_on_parsed_date_and_media():
+    source = sources.Source(name="test", rss_url="https://example.com/rss")
+    entry = source.parse_rss(GMT_FEED)["entries"][0]
+    assert entry["published"] == "2024-11-23T19:13:45+00:00"
+    assert entry["image"] == "https://example.com/a.jpg"
+
+
+def test_unreadable_entries_are_skipped():
+    source = sources.Source(name="test", rss_url="https://example.com/rss")
+    bad = (b"<item><title>Sans date</title><link>https://example.com/b</link></item>"
+           b"<item><title>Date</title><link>https://example.com/c</link><pubDate>hier</pubDate></item>")
+    data = GMT_FEED.replace(b"<channel>", b"<channel>" + bad)
+    for entries in (source.parse_rss(data)["entries"], source.stream_rss(data)["entries"]):
+        assert [entry["link"] for entry in entries] == ["https://example.com/a"]
+
+
+def test_find_image_prefers_image_enclosure(rss_data):
+    entry = feedparser.parse(rss_data).entries[0]
+    assert sources.find_image(entry).startswith("https://mobile-img.lpcdn.ca/")
+
+
+def test_source_article_rules_apply_site_rules():
+    source = sources.Source(name="test", rss_url="", rules=Rules(remove=["div.ad"]))
+    parts, texts = source.prepare_article('<div class="ad">pub</div><h3>Titre</h3><p>texte</p>')
+    assert texts == ["Titre", "texte"]
+    assert "".join(parts) == "<h3></h3><p></p>"
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = sources.RateLimiter(0.05)
+
+    async def run():
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.wait() for _ in range(3)))
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.1
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter
+import telegram_bot
+from ratelimit import RateLimiter
+
+
+class FakeBot:
+    def __init__(self, failures=None):
+        self.calls = []
+        self.failures = failures or {}
+
+    async def send_photo(self, chat_id, photo, caption, parse_mode):
+        self.calls.append((chat_id, photo))
+        if self.failures.get(chat_id):
+            raise self.failures[chat_id].pop(0)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id="large")])
+
+    async def send_message(self, chat_id, text, parse_mode):
+        self.calls.append((chat_id, None))
+        return SimpleNamespace(photo=None)
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    bot = FakeBot()
+    monkeypatch.setattr(telegram_bot, "_application", SimpleNamespace(bot=bot))
+    monkeypatch.setattr(telegram_bot, "_global_limiter", RateLimiter(0))
+    monkeypatch.setattr(telegram_bot, "chat_interval", 0)
+    monkeypatch.setattr(telegram_bot, "_chat_limiters", {})
+    monkeypatch.setattr(telegram_bot, "retry_backoff", 0)
+    return bot
+
+
+ENTRY = {"link": "https://example.com/a", "image": "https://example.com/a.jpg"}
+
+
+def test_send_to_chats_uploads_photo_once_then_reuses_file_id(bot):
+    results = asyncio.run(telegram_bot.send_to_chats(["1", "2", "3"], ENTRY, "caption"))
+    assert results == {"1": True, "2": True, "3": True}
+    assert bot.calls[0] == ("1", ENTRY["image"])
+    assert sorted(bot.calls[1:]) == [("2", "large"), ("3", "large")]
+
+
+def test_send_to_chats_retries_flood_control_and_isolates_failures(bot):
+    bot.failures = {"1": [RetryAfter(0)], "2": [NetworkError("down")] * 4}
+    sent = []
+
+    async def on_sent(chat_id):
+        sent.append(chat_id)
+
+    results = asyncio.run(telegram_bot.send_to_chats(["1", "2", "3"], ENTRY, "caption", on_sent))
+    assert results == {"1": True, "2": False, "3": True}
+    assert sorted(sent) == ["1", "3"]
+    assert bot.calls.count(("1", ENTRY["image"])) == 2
+    assert len([call for call in bot.calls if call[0] == "2"]) == telegram_bot.max_retries + 1
+
+
+def test_deliver_does_not_retry_bad_requests(bot):
+    bot.failures = {"1": [BadRequest("Chat not found")]}
+
+    with pytest.raises(BadRequest):
+        asyncio.run(telegram_bot.deliver("1", "caption", ENTRY["image"]))
+    assert bot.calls == [("1", ENTRY["image"])]
+
+
+def test_send_to_chats_falls_back_to_url_until_an_upload_succeeds(bot):
+    bot.failures = {"1": [NetworkError("down")] * 4}
+    results = asyncio.run(telegram_bot.send_to_chats(["1", "2", "3"], ENTRY, "caption"))
+    assert results == {"1": False, "2": True, "3": True}
+    assert ("2", ENTRY["image"]) in bot.calls and ("3", "large") in bot.calls
@@ -1,5 +1,23 @@
+import asyncio
+from types import SimpleNamespace
 import pytest
-from translate import default_system_prompt
+import translate
+import backends
+import cache
+from translate import default_system_prompt, pack_segments, split_segments, make_batches
+
+
+FAKE = backends.Backend("fake", "", model="m")
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(cache, "_cache", cache.NullCache())
+    monkeypatch.setattr(backends, "_pool", backends.Pool([FAKE]))
+
+
+def answer(content, backend=FAKE):
+    return backends.Completion(content, backend)
 
 
 def test_default_system_prompt_no_params():
@@ -16,3 +34,202 @@ def test_default_system_prompt_auto_source_lang():
     prompt = default_system_prompt(
         source_lang="auto", target_lang="French")
     assert prompt == "You are a professional translator. please translate the following into French, do not give any text other than the translated content, and trim the spaces at the end:"
+
+
+def test_pack_segments_collapses_whitespace():
+    packed = pack_segments(["Bonjour", "le\n  monde"])
+    assert packed == "[[1]] Bonjour\n[[2]] le monde"
+
+
+def test_split_segments_round_trip():
+    response = "[[1]] Hello\n[[2]] the world\n"
+    assert split_segments(response, 2) == ["Hello", "the world"]
+
+
+def test_split_segments_full_width_markers():
+    assert split_segments("【1】你好\n【2】世界", 2) == ["你好", "世界"]
+
+
+def test_split_segments_missing_and_duplicate():
+    response = "[[1]] Hello\n[[3]] one\n[[3]] two\n[[9]] extra"
+    assert split_segments(response, 3) == ["Hello", None, None]
+
+
+def test_split_segments_rejects_merged_segments():
+    assert split_segments("[[1]] a\n[[2]] b [[3]] c", 3) == ["a", None, None]
+    assert split_segments("[[1]] a 【2】 b\n[[3]] c", 3) == [None, None, "c"]
+
+
+def test_make_batches_respects_budget():
+    assert make_batches(["aaaa", "bb", "cc", "dddddd"], 6) == [[0, 1], [2], [3]]
+
+
+def test_translate_batch_falls_back_for_lost_segments(monkeypatch):
+    calls = []
+
+    def fake_complete(system, text):
+        calls.append(text)
+        if text.startswith("[[1]]"):
+            return answer("[[1]] ONE\n[[3]] THREE")
+        return answer(text.upper())
+
+    monkeypatch.setattr(translate, "complete", fake_complete)
+    monkeypatch.setattr(translate, "batch_max_chars", 100)
+    result = translate.translate_batch(["one", "two", "three"], "French", "English")
+    assert result == ["ONE", "TWO", "THREE"]
+    assert calls == ["[[1]] one\n[[2]] two\n[[3]] three", "two"]
+
+
+def test_atranslate_batch_matches_sync(monkeypatch):
+    async def fake_acomplete(system, text):
+        if text.startswith("[[1]]"):
+            return answer("[[1]] ONE\n[[2]] TWO")
+        return answer(text.upper())
+
+    monkeypatch.setattr(translate, "acomplete", fake_acomplete)
+    monkeypatch.setattr(translate, "batch_max_chars", 6)
+    result = asyncio.run(translate.atranslate_batch(["one", "two", "three"], "French", "English"))
+    assert result == ["ONE", "TWO", "THREE"]
+
+
+def test_acomplete_bounds_in_flight_requests(monkeypatch):
+    in_flight = 0
+    peak = 0
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            message = SimpleNamespace(content=kwargs["messages"][1]["content"])
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    backend = backends.Backend("fake", "http://fake/v1", _async_client=fake_client)
+    monkeypatch.setattr(backends, "_pool", backends.Pool([backend]))
+    monkeypatch.setattr(translate, "max_concurrency", 2)
+
+    async def run():
+        return await asyncio.gather(*(translate.acomplete("system", str(i)) for i in range(6)))
+
+    assert [content for content, _ in asyncio.run(run())] == [str(i) for i in range(6)]
+    assert peak == 2
+
+
+def test_translate_batch_uses_cache(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_complete(system, text):
+        calls.append(text)
+        return answer(text.upper())
+
+    monkeypatch.setattr(cache, "_cache", cache.SQLiteCache(str(tmp_path / "cache.sqlite3"), 100))
+    monkeypatch.setattr(translate, "complete", fake_complete)
+    assert translate.translate_text("two", "French", "English") == "TWO"
+    calls.clear()
+    result = translate.translate_batch(["one", "two"], "French", "English")
+    assert result == ["ONE", "TWO"]
+    assert calls == ["one"]
+    assert cache.get_cache().stats()["hits"] == 1
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert translate.estimate_tokens("abcdefgh") == 2
+    assert translate.estimate_tokens("你好世界") == 4
+    assert translate.estimate_tokens("") == 0
+
+
+def test_chunk_text_splits_on_sentences_and_round_trips():
+    text = "Première phrase ici. Deuxième phrase, un peu plus longue!\n\nUn nouveau paragraphe. Fin."
+    chunks = translate.chunk_text(text, 8)
+    assert "".join(chunk + sep for chunk, sep in chunks) == text
+    assert all(translate.estimate_tokens(chunk) <= 8 for chunk, _ in chunks)
+    assert chunks[0] == ("Première phrase ici.", " ")
+    assert translate.chunk_text("Court.", 8) == [("Court.", "")]
+
+
+def test_chunk_text_splits_long_sentences_on_words():
+    chunks = translate.chunk_text("mot " * 20 + "fin", 4)
+    assert all(translate.estimate_tokens(chunk) <= 4 for chunk, _ in chunks)
+    assert " ".join(chunk for chunk, _ in chunks) == ("mot " * 20 + "fin")
+
+
+def test_make_batches_respects_token_budget():
+    assert make_batches(["aaaa", "bbbb", "你好你好"], 100, max_tokens=4) == [[0, 1], [2]]
+
+
+def test_atranslate_text_translates_chunks_concurrently(monkeypatch):
+    in_flight = peak = 0
+
+    async def fake_acomplete(system, text):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return answer(text.upper())
+
+    monkeypatch.setattr(translate, "acomplete", fake_acomplete)
+    monkeypatch.setattr(translate, "max_tokens", 5)
+    text = "Un paragraphe.\n\nUn autre paragraphe.\n\nEt un dernier."
+    result = asyncio.run(translate.atranslate_text(text, "French", "English"))
+    assert result == text.upper()
+    assert peak == 3
+
+
+def test_astream_text_yields_growing_translation_and_caches(monkeypatch, tmp_path):
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            assert kwargs["stream"] is True
+
+            async def stream():
+                for delta in ["Bon", "jour", None, " !\n"]:
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+            return stream()
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    monkeypatch.setattr(backends, "_pool", backends.Pool([backends.Backend("fake", "", _async_client=fake_client)]))
+    monkeypatch.setattr(cache, "_cache", cache.SQLiteCache(str(tmp_path / "cache.sqlite3"), 10))
+
+    async def collect():
+        return [partial async for partial in translate.astream_text("Hello!", "English", "French")]
+
+    assert asyncio.run(collect()) == ["Bon", "Bonjour", "Bonjour !\n"]
+    assert asyncio.run(collect()) == ["Bonjour !\n"]
+    # Cached as the other paths store completions, unstripped
+    assert asyncio.run(translate.atranslate_text("Hello!", "English", "French")) == "Bonjour !\n"
+
+
+def test_translate_batch_skips_rule_translated_texts(monkeypatch):
+    calls = []
+
+    def fake_complete(system, text):
+        calls.append(text)
+        return answer(text.upper())
+
+    monkeypatch.setattr(translate, "complete", fake_complete)
+    texts = ["2024", "PHOTO ARCHIVES LA PRESSE", "un texte", "https://example.com"]
+    assert translate.translate_batch(texts, "French", "Simple Chinese") == [
+        "2024", "PHOTO ARCHIVES LA PRESSE", "UN TEXTE", "https://example.com"]
+    assert calls == ["un texte"]
+
+
+def test_translations_are_cached_under_the_model_that_made_them(monkeypatch, tmp_path):
+    primary = backends.Backend("gpu", "", model="qwen")
+    fallback = backends.Backend("hosted", "", model="gpt", fallback=True)
+    monkeypatch.setattr(backends, "_pool", backends.Pool([primary, fallback]))
+    monkeypatch.setattr(cache, "_cache", cache.SQLiteCache(str(tmp_path / "cache.sqlite3"), 100))
+    calls = []
+
+    async def fake_acomplete(system, text):
+        calls.append(text)
+        return answer(text.upper(), fallback if len(calls) == 1 else primary)
+
+    monkeypatch.setattr(translate, "acomplete", fake_acomplete)
+    assert asyncio.run(translate.atranslate_text("un", "French", "English")) == "UN"
+    assert asyncio.run(translate.atranslate_text("un", "French", "English")) == "UN"
+    assert asyncio.run(translate.atranslate_text("un", "French", "English")) == "UN"
+    assert calls == ["un", "un"]
+    assert translate.lookup_cached(["un"], "French", "English") == ["UN"]